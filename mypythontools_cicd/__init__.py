@@ -76,6 +76,10 @@ which is used mostly in PyVueEel applications.
 ----------------------------------
 Pipeline for all the other submodules, that provide configurable CI/CD.
 
+:py:mod:`mypythontools_cicd.commands`
+--------------------------------------
+Run terminal commands, also more at the same time with output streamed line by line.
+
 :py:mod:`mypythontools_cicd.deploy`
 -----------------------------------
 Build package and push it to PyPi.
@@ -119,10 +123,28 @@ https://github.com/Malachov/mypythontools
 This can help you with a lot of stuff around CICD like getting project paths, generating docs, testing,
 deploying to PyPi etc.
 """
-from mypythontools_cicd import build_app, deploy, packages, cicd, project_paths, tests, venvs
+import importlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from mypythontools_cicd import build_app, deploy, packages, cicd, project_paths, tests, venvs
 
 __all__ = ["build_app", "deploy", "packages", "project_paths", "cicd", "tests", "venvs"]
 
+# Subpackages are imported when used first time, so importing e.g. just `packages` in `setup.py` is fast
+_SUBPACKAGES = [*__all__, "commands", "docs", "git", "misc"]
+
+
+def __getattr__(name: str):
+    if name in _SUBPACKAGES:
+        return importlib.import_module(f"mypythontools_cicd.{name}")
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted([*globals(), *_SUBPACKAGES])
+
 __version__ = "0.0.35"
 
 __author__ = "Daniel Malachov"
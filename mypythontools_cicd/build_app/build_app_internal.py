@@ -6,15 +6,15 @@ from pathlib import Path
 import sys
 
 from typing_extensions import Literal
-from mypythontools.paths import PathLike, find_path, validate_path
+from mypythontools.paths import PathLike, validate_path
 from mypythontools.misc import delete_files
 from mypythontools.system import (
     check_script_is_available,
     check_library_is_available,
     get_console_str_with_quotes,
-    terminal_do_command,
 )
 
+from ..commands import run_command
 from ..project_paths import PROJECT_PATHS
 from .. import venvs
 
@@ -143,9 +143,7 @@ def build_with_pyinstaller(
     if not main_file_path.exists():
 
         # Iter paths and find the one
-        main_file_path = find_path(
-            main_file_path.name,
-        )
+        main_file_path = PROJECT_PATHS.files.find(main_file_path.name)
 
         if not main_file_path.exists():
             raise KeyError("Main file not found, not inferred and must be configured in params...")
@@ -163,10 +161,7 @@ def build_with_pyinstaller(
         if not icon_path.exists():
 
             # Iter paths and find the one
-            icon_path = find_path(
-                icon_path.name,
-                exclude_names=["node_modules", "build"],
-            )
+            icon_path = PROJECT_PATHS.files.find(icon_path.name, exclude_names=["node_modules", "build"])
 
             if not icon_path.exists():
                 raise KeyError("Icon not found, not inferred check path or name...")
@@ -191,13 +186,13 @@ def build_with_pyinstaller(
         if verbosity:
             print("\n\nBuilding web.\n\n")
 
-        gui_path = find_path("package.json").parent
+        gui_path = PROJECT_PATHS.files.find("package.json").parent
 
         check_script_is_available(
             "npm", message="If building application with pyvueel, Node has to be installed."
         )
 
-        terminal_do_command(
+        run_command(
             "npm run build",
             cwd=gui_path.as_posix(),
             shell=True,
@@ -207,7 +202,7 @@ def build_with_pyinstaller(
 
     if build_web or preset == "eel":
         if not web_path:
-            web_path = find_path(
+            web_path = PROJECT_PATHS.files.find(
                 "index.html",
                 exclude_names=[
                     "public",
@@ -330,7 +325,7 @@ coll = COLLECT(exe,
     else:
         command = f"pyinstaller --noconfirm {spec_path}"
 
-    terminal_do_command(
+    run_command(
         command,
         cwd=PROJECT_PATHS.root.as_posix(),
         shell=True,
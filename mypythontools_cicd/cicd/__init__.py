@@ -76,7 +76,17 @@ Examples:
 from mypythontools_cicd.cicd.cicd_internal import (
     default_pipeline_config,
     PipelineConfig,
+    PipelineStage,
+    StageCache,
     cicd_pipeline,
+    run_stages,
 )
 
-__all__ = ["default_pipeline_config", "PipelineConfig", "cicd_pipeline"]
+__all__ = [
+    "default_pipeline_config",
+    "PipelineConfig",
+    "PipelineStage",
+    "StageCache",
+    "cicd_pipeline",
+    "run_stages",
+]
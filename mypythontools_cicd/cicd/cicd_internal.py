@@ -1,22 +1,32 @@
 """Module with functions for 'cicd' subpackage."""
 
 from __future__ import annotations
-from typing import Sequence
+from typing import Callable, Sequence
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import ExitStack
+from pathlib import Path
+import hashlib
+import json
 import os
+import re
 import sys
+import threading
+import time
 
 from typing_extensions import Literal
 
 from mypythontools.config import Config, MyProperty
 from mypythontools.misc import GLOBAL_VARS, EMOJIS, print_progress
 from mypythontools.paths import PathLike
+from mypythontools.types import validate_sequence
 
 from .. import git
 from .. import venvs
 from .. import tests
+from ..commands import Trace
 from ..deploy import deploy_to_pypi
 from ..docs import docs_regenerate
-from ..misc import reformat_with_black
+from ..misc import DurationsDatabase, get_files_hash, get_project_files, reformat_with_black
 from ..project_paths import PROJECT_PATHS
 from ..venvs import Venv
 
@@ -97,11 +107,14 @@ class PipelineConfig(Config):
         return "venv"
 
     @MyProperty
-    def reformat(self) -> bool:
+    def reformat(self) -> bool | Literal["changed"]:
         """Reformat all python files with black. Setup parameters in pyproject.toml.
 
+        If "changed", only python files changed since the last successful reformat are formatted with black
+        python API. Check `reformat_with_black` for details.
+
         Type:
-            bool
+            bool | Literal["changed"]
 
         Default:
             True
@@ -244,6 +257,53 @@ class PipelineConfig(Config):
         """
         return ["master", "main"]
 
+    @MyProperty
+    def cache_stages(self) -> bool:
+        """Skip tests, docs and reformat if nothing changed since the last successful run.
+
+        Type:
+            bool
+
+        Default:
+            True
+
+        Inputs of the stage (source files, requirements, stage config and python version) are hashed and
+        stored in `PROJECT_PATHS.cache` after stage finish successfully. If the hash is the same on the next
+        run, stage is reported as cached and skipped.
+        """
+        return True
+
+    @MyProperty
+    def max_workers(self) -> None | int:
+        """Maximum number of pipeline stages running at the same time.
+
+        Type:
+            None | int
+
+        Default:
+            None
+
+        Stages that do not depend on each other (e.g. docs generation and tests) run concurrently. If None,
+        number of CPUs is used. Use 1 to run stages one after another.
+        """
+        return None
+
+    @MyProperty
+    def trace(self) -> bool:
+        """Record timeline of stages and commands and save it to `trace.json` in project cache.
+
+        Type:
+            bool
+
+        Default:
+            True
+
+        File is in Chrome trace format and can be opened in chrome://tracing or in https://ui.perfetto.dev.
+        Exit code, CPU time and peak memory of each command is recorded (CPU and memory not on Windows). Text
+        summary with the slowest stages and commands is printed at the end if verbosity is not 0.
+        """
+        return True
+
     @MyProperty
     def verbosity(self) -> Literal[0, 1, 2]:
         """Pipeline runs only on defined branches.
@@ -260,6 +320,303 @@ class PipelineConfig(Config):
 default_pipeline_config = PipelineConfig()
 
 
+class PipelineStage:
+    """One step of the pipeline that can run when all the stages it depends on are finished.
+
+    Attributes:
+        name (str): Name of the stage. Used in `depends_on` of other stages. E.g. "docs".
+        function (Callable[[], None]): Function without parameters doing the work.
+        depends_on (Sequence[str]): Names of stages that has to finish before this stage starts.
+    """
+
+    def __init__(self, name: str, function: Callable[[], None], depends_on: Sequence[str] = ()) -> None:
+        """Init the stage.
+
+        Args:
+            name (str): Name of the stage. Used in `depends_on` of other stages. E.g. "docs".
+            function (Callable[[], None]): Function without parameters doing the work.
+            depends_on (Sequence[str], optional): Names of stages that has to finish before this stage starts.
+                Defaults to ().
+        """
+        validate_sequence(depends_on, "depends_on")
+
+        self.name = name
+        self.function = function
+        self.depends_on = list(depends_on)
+
+
+class StageCache:
+    """Persistent results of successful pipeline stages. It's used to skip stages whose inputs has not changed.
+
+    Results are stored in json file as mapping of stage name to hash of stage inputs.
+
+    Example:
+        >>> import tempfile
+        ...
+        >>> cache = StageCache(Path(tempfile.mkdtemp()) / "stages.json")
+        >>> key = cache.get_key("docs", patterns=["*.py"], config_values={"keep": []})
+        >>> cache.is_cached("docs", key)
+        False
+        >>> cache.save("docs", key)
+        >>> StageCache(cache.path).is_cached("docs", key)
+        True
+    """
+
+    def __init__(self, path: PathLike) -> None:
+        """Load stored results.
+
+        Args:
+            path (PathLike): Path to json file with results. It's created if doesn't exist.
+        """
+        self.path = Path(path)
+        self.lock = threading.Lock()
+
+        try:
+            with open(self.path) as cache_file:
+                self.results: dict[str, str] = json.load(cache_file)
+        except (OSError, ValueError):
+            self.results = {}
+
+    @staticmethod
+    def get_key(
+        stage_name: str,
+        patterns: Sequence[str],
+        config_values: None | dict = None,
+        extra_files: Sequence[PathLike] = (),
+        exclude_patterns: Sequence[str] = ("test_readme_generated*",),
+        exclude_folders: Sequence[PathLike] = (),
+    ) -> str:
+        """Compute hash of stage inputs.
+
+        Args:
+            stage_name (str): Name of the stage, e.g. "run_tests".
+            patterns (Sequence[str]): Glob-style patterns of project files that stage uses. E.g. ["*.py"].
+            config_values (None | dict, optional): Configuration of the stage. Values has to be convertible
+                to string. Defaults to None.
+            extra_files (Sequence[PathLike], optional): Files outside of project that are used too. E.g.
+                `pyvenv.cfg` of used venvs. Defaults to ().
+            exclude_patterns (Sequence[str], optional): Files created by stage itself that would change the
+                hash. Defaults to ("test_readme_generated*",).
+            exclude_folders (Sequence[PathLike], optional): Folders whose files are not used, e.g. docs that
+                are generated by another stage running at the same time. Defaults to ().
+
+        Returns:
+            str: Hexadecimal hash.
+
+        Note:
+            Version assignment in `__init__.py` is not part of the hash. It's changed in `set_version` stage
+            after tests and docs, so stages would never be cached otherwise.
+        """
+        excluded_folders = [Path(i).resolve() for i in exclude_folders]
+        files = [
+            i
+            for i in get_project_files(patterns)
+            if not any(i.match(pattern) for pattern in exclude_patterns)
+            and not any(folder in i.resolve().parents for folder in excluded_folders)
+        ]
+
+        try:
+            init_path = PROJECT_PATHS.init.resolve()
+        except FileNotFoundError:
+            init_path = None
+
+        stage_hash = hashlib.sha256()
+        stage_hash.update(stage_name.encode("utf-8"))
+        stage_hash.update(sys.version.encode("utf-8"))
+        stage_hash.update(json.dumps(config_values, sort_keys=True, default=str).encode("utf-8"))
+
+        if init_path in files:
+            files.remove(init_path)
+            with open(init_path, encoding="utf-8", errors="replace") as init_file:
+                init_content = re.sub('__version__ = "(.*)"', '__version__ = ""', init_file.read())
+            stage_hash.update(init_content.encode("utf-8"))
+
+        stage_hash.update(get_files_hash([*files, *extra_files]).encode("utf-8"))
+
+        return stage_hash.hexdigest()
+
+    def is_cached(self, stage_name: str, key: str) -> bool:
+        """Check whether stage already finished successfully with the same inputs.
+
+        Args:
+            stage_name (str): Name of the stage, e.g. "run_tests".
+            key (str): Hash from `get_key`.
+
+        Returns:
+            bool: True if stage can be skipped.
+        """
+        return self.results.get(stage_name) == key
+
+    def save(self, stage_name: str, key: str) -> None:
+        """Store successful result of the stage.
+
+        Args:
+            stage_name (str): Name of the stage, e.g. "run_tests".
+            key (str): Hash from `get_key`.
+        """
+        with self.lock:
+            self.results[stage_name] = key
+            if self.path.parent == PROJECT_PATHS.cache:
+                PROJECT_PATHS.create_cache()
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+            with open(self.path, "w") as cache_file:
+                json.dump(self.results, cache_file, indent=2)
+
+
+def run_stages(
+    stages: Sequence[PipelineStage],
+    max_workers: None | int = None,
+    durations: None | DurationsDatabase = None,
+    print_estimate: bool = False,
+    trace: None | Trace = None,
+) -> None:
+    """Run stages in threads so that independent stages run concurrently.
+
+    Stage starts as soon as all the stages it depends on are finished. Dependencies on stages that are not
+    part of the run are ignored, so it's possible to turn off any of the stages. If some stage fails, no new
+    stage is started, running stages are finished and then the error of the first failed stage is raised.
+
+    If `durations` is used, duration of each successful stage is stored in "stages" category. If stage
+    function returns False, it means it was skipped and duration is not stored. From stored durations, the
+    longest chain of remaining stages is computed, and if more stages can start, the one with the longest
+    chain starts first.
+
+    Args:
+        stages (Sequence[PipelineStage]): Stages to run. If more stages can start at once, the one defined
+            first starts first.
+        max_workers (None | int, optional): Maximum number of stages running at the same time. If None,
+            number of CPUs is used. Defaults to None.
+        durations (None | DurationsDatabase, optional): Durations from previous runs. New durations are
+            added, but not saved. Defaults to None.
+        print_estimate (bool, optional): Whether print estimated remaining time when some stage finishes.
+            It's printed only if durations of all the remaining stages are known. Defaults to False.
+        trace (None | Trace, optional): If used, every stage is added to the trace with its status
+            ("passed", "skipped" or "failed"). Defaults to None.
+
+    Raises:
+        ValueError: If stage names are not unique or if there is cyclic dependency.
+
+    Example:
+        >>> order = []
+        >>> run_stages(
+        ...     [
+        ...         PipelineStage("push", lambda: order.append("push"), depends_on=["test", "docs"]),
+        ...         PipelineStage("test", lambda: order.append("test")),
+        ...         PipelineStage("docs", lambda: order.append("docs"), depends_on=["not_used"]),
+        ...     ]
+        ... )
+        >>> order[-1]
+        'push'
+    """
+    names = [stage.name for stage in stages]
+
+    if len(set(names)) != len(names):
+        raise ValueError(f"Pipeline stages names must be unique. Used names: {names}")
+
+    # Dependencies on stages that are not used are ignored
+    remaining = {stage.name: {i for i in stage.depends_on if i in names} for stage in stages}
+    waiting = list(stages)
+    done: set[str] = set()
+
+    # Check cycles before anything run, so nothing is done if pipeline is misconfigured
+    resolved: set[str] = set()
+    resolved_order: list[str] = []
+    while len(resolved) < len(names):
+        ready = [i for i in names if i not in resolved and remaining[i] <= resolved]
+        if not ready:
+            raise ValueError(
+                f"Pipeline stages has cyclic dependency. Check stages {[i for i in names if i not in resolved]}"
+            )
+        resolved.update(ready)
+        resolved_order.extend(ready)
+
+    def get_duration(name: str) -> None | float:
+        return durations.get("stages", name) if durations else None
+
+    # Longest chain of stages from the stage to the end of the pipeline
+    chains: dict[str, float] = {}
+    for name in reversed(resolved_order):
+        following = [chains[i] for i in names if name in remaining[i]]
+        chains[name] = (get_duration(name) or 0) + max(following, default=0)
+
+    if not max_workers:
+        max_workers = os.cpu_count() or 1
+
+    first_error: None | BaseException = None
+    started: dict[str, float] = {}
+
+    def run_stage(stage: PipelineStage) -> None:
+        start = time.perf_counter()
+        started[stage.name] = start
+
+        status = "failed"
+
+        try:
+            if stage.function() is False:
+                status = "skipped"
+            else:
+                status = "passed"
+                if durations:
+                    durations.update("stages", {stage.name: time.perf_counter() - start})
+        finally:
+            if trace:
+                trace.add(stage.name, "stage", start, time.perf_counter(), {"status": status})
+
+    def print_remaining_time() -> None:
+        not_finished = [i for i in names if i not in done]
+
+        if not not_finished or any(get_duration(i) is None for i in not_finished):
+            return
+
+        now = time.perf_counter()
+        chains_left: dict[str, float] = {}
+
+        for name in reversed(resolved_order):
+            if name in done:
+                continue
+            duration = get_duration(name) or 0
+            if name in started:
+                duration = max(duration - (now - started[name]), 0)
+            following = [chains_left[i] for i in not_finished if name in remaining[i]]
+            chains_left[name] = duration + max(following, default=0)
+
+        print(f"\tEstimated remaining time: {round(max(chains_left.values()))} s")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {}
+
+        while waiting or running:
+            if first_error is None:
+                ready = [i for i in waiting if remaining[i.name] <= done]
+                # Stable sort, so order of definition is used for the same chains
+                for stage in sorted(ready, key=lambda stage: -chains[stage.name]):
+                    if len(running) >= max_workers:
+                        break
+                    waiting.remove(stage)
+                    running[executor.submit(run_stage, stage)] = stage.name
+
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+
+            for future in finished:
+                name = running.pop(future)
+                error = future.exception()
+                if error is not None:
+                    if first_error is None:
+                        first_error = error
+                else:
+                    done.add(name)
+
+            if print_estimate and first_error is None:
+                print_remaining_time()
+
+    if first_error is not None:
+        raise first_error
+
+
 def cicd_pipeline(
     config: PipelineConfig = default_pipeline_config,
 ) -> None:
@@ -276,6 +633,12 @@ def cicd_pipeline(
     Note:
         Beware, that by default, it creates a commit and add all the changes, not only the staged ones.
 
+    Stages run in order prepare_venvs, sync_requirements, reformat, tests, docs, set_version, git_commit_all,
+    git_push and deploy, but stages that do not depend on each other run concurrently (docs are generated
+    while tests are running). Number of concurrent stages can be set with `max_workers`. If push fails,
+    original version is restored. Durations of stages are stored in project cache and used to start longer
+    stages first and to print estimated remaining time.
+
     When using sys args for boolean values, always define True or False.
 
     There is command line entrypoint called `mypythontools_cicd`. After mypythontools is installed, you can
@@ -376,12 +739,14 @@ def cicd_pipeline(
             tag = config.tag
         git.check_tag(tag)
 
-    if config.prepare_venvs:
+    original_version = None
+
+    def prepare_venvs_stage():
         venvs.prepare_venvs(
             path=config.prepare_venvs_path, versions=config.prepare_venvs, verbosity=verbosity
         )
 
-    if config.sync_requirements:
+    def sync_requirements_stage():
         if not venvs.is_venv:
             raise RuntimeError("'sync_requirements' available only if using virtualenv.")
         my_venv = venvs.Venv(sys.prefix)
@@ -389,52 +754,191 @@ def cicd_pipeline(
             config.sync_requirements, verbosity=verbosity, path=config.sync_requirements_path
         )
 
-    if config.test:
+    stage_cache = StageCache(PROJECT_PATHS.cache / "stages.json") if config.cache_stages else None
+
+    try:
+        docs_path = PROJECT_PATHS.docs
+    except RuntimeError:
+        docs_path = None
+
+    def run_tests_stage():
+        if stage_cache:
+            test_venvs = [*config.test.virtualenvs, *config.test.wsl_virtualenvs]
+            key = stage_cache.get_key(
+                "run_tests",
+                patterns=["*.py", "*.pyi", "*.ipynb", "*.txt", "*.toml", "*.cfg", "*.ini", "*.md", "*.rst"],
+                config_values=config.test.do.get_dict(),
+                extra_files=[Path(i).resolve() / "pyvenv.cfg" for i in test_venvs],
+                # Docs are generated while tests are running
+                exclude_folders=[docs_path] if docs_path else [],
+            )
+            if stage_cache.is_cached("run_tests", key):
+                print_progress(
+                    "Testing skipped - cached, nothing changed since last success", progress_is_printed
+                )
+                return False
+
         tests.run_tests(config.test)
 
-    if config.reformat:
-        reformat_with_black()
+        if stage_cache:
+            stage_cache.save("run_tests", key)
+
+    def reformat_stage():
+        reformat_patterns = ["*.py", "*.pyi", "pyproject.toml"]
+
+        if stage_cache:
+            key = stage_cache.get_key("reformat", patterns=reformat_patterns)
+            if stage_cache.is_cached("reformat", key):
+                print_progress(
+                    "Reformatting skipped - cached, nothing changed since last success", progress_is_printed
+                )
+                return False
+
+        reformat_with_black(changed_only=config.reformat == "changed")
+
+        if stage_cache:
+            # Black changes the files, so state after formatting is stored
+            stage_cache.save("reformat", stage_cache.get_key("reformat", patterns=reformat_patterns))
 
-    if config.set_version:
+    def set_version_stage():
+        nonlocal original_version
         print_progress("Setting version", progress_is_printed)
         original_version = packages.get_version()
         packages.set_version(config.set_version)
 
-    if config.docs:
+    def docs_stage():
+        docs_patterns = ["*.py", "*.md", "*.rst", "*.txt", "*.toml", "*.html", "Makefile", "make.bat"]
+
+        if stage_cache:
+            key = stage_cache.get_key("docs", patterns=docs_patterns)
+            if stage_cache.is_cached("docs", key):
+                print_progress(
+                    "Docs generation skipped - cached, nothing changed since last success",
+                    progress_is_printed,
+                )
+                return False
+
         docs_regenerate(verbosity=verbosity)
 
-    if config.git_commit_all:
+        if stage_cache:
+            # Generated rst files are inputs as well, so state after generation is stored
+            stage_cache.save("docs", stage_cache.get_key("docs", patterns=docs_patterns))
+
+    def git_commit_all_stage():
         git.commit_all(config.git_commit_all, verbosity=verbosity)
 
-    try:
-        if config.git_push:
+    def git_push_stage():
+        try:
             git.push(
                 tag=config.tag,
                 tag_message=config.tag_message,
                 verbosity=verbosity,
             )
 
-    except Exception as err:  # pylint: disable=broad-except
-        if config.set_version:
-            packages.set_version(original_version)  # type: ignore
+        except Exception as err:  # pylint: disable=broad-except
+            if original_version:
+                packages.set_version(original_version)
 
-        raise RuntimeError(
-            f"{3 * EMOJIS.DISAPPOINTMENT} Utils pipeline failed {3 * EMOJIS.DISAPPOINTMENT} \n\n"
-            f"{'Original version restored. ' if config.set_version else ''}Nothing was pushed to repo, "
-            "you can restart pipeline. "
-            f"{'All changes already committed.' if config.git_commit_all else ''}"
-        ) from err
+            raise RuntimeError(
+                f"{3 * EMOJIS.DISAPPOINTMENT} Utils pipeline failed {3 * EMOJIS.DISAPPOINTMENT} \n\n"
+                f"{'Original version restored. ' if config.set_version else ''}Nothing was pushed to repo, "
+                "you can restart pipeline. "
+                f"{'All changes already committed.' if config.git_commit_all else ''}"
+            ) from err
 
-    try:
-        if config.deploy:
+    def deploy_stage():
+        try:
             deploy_to_pypi(verbosity=verbosity, venv=config.venv)
 
-    except Exception as err:  # pylint: disable=broad-except
-        raise RuntimeError(
-            f"{3 * EMOJIS.DISAPPOINTMENT} Deploy failed {3 * EMOJIS.DISAPPOINTMENT} \n\n"
-            "Already pushed to repository. Deploy manually."
-            f"{'All changes already committed.' if config.git_commit_all else ''}"
-            f"{'Version already changed.' if config.set_version else ''}"
-        ) from err
+        except Exception as err:  # pylint: disable=broad-except
+            raise RuntimeError(
+                f"{3 * EMOJIS.DISAPPOINTMENT} Deploy failed {3 * EMOJIS.DISAPPOINTMENT} \n\n"
+                "Already pushed to repository. Deploy manually."
+                f"{'All changes already committed.' if config.git_commit_all else ''}"
+                f"{'Version already changed.' if config.set_version else ''}"
+            ) from err
+
+    # Stages that change files (reformat, set_version) never run concurrently with stages reading them.
+    # Docs and tests do not depend on each other, so they can run at the same time.
+    all_stages = {
+        "prepare_venvs": PipelineStage("prepare_venvs", prepare_venvs_stage),
+        "sync_requirements": PipelineStage(
+            "sync_requirements", sync_requirements_stage, depends_on=["prepare_venvs"]
+        ),
+        "reformat": PipelineStage("reformat", reformat_stage),
+        "run_tests": PipelineStage(
+            "run_tests", run_tests_stage, depends_on=["prepare_venvs", "sync_requirements", "reformat"]
+        ),
+        "docs": PipelineStage("docs", docs_stage, depends_on=["reformat"]),
+        "set_version": PipelineStage("set_version", set_version_stage, depends_on=["run_tests", "docs"]),
+        "git_commit_all": PipelineStage(
+            "git_commit_all",
+            git_commit_all_stage,
+            depends_on=["prepare_venvs", "sync_requirements", "reformat", "run_tests", "docs", "set_version"],
+        ),
+        "git_push": PipelineStage(
+            "git_push",
+            git_push_stage,
+            depends_on=[
+                "prepare_venvs",
+                "sync_requirements",
+                "reformat",
+                "run_tests",
+                "docs",
+                "set_version",
+                "git_commit_all",
+            ],
+        ),
+        "deploy": PipelineStage(
+            "deploy",
+            deploy_stage,
+            depends_on=[
+                "prepare_venvs",
+                "sync_requirements",
+                "reformat",
+                "run_tests",
+                "docs",
+                "set_version",
+                "git_commit_all",
+                "git_push",
+            ],
+        ),
+    }
+
+    used_stages = {
+        "prepare_venvs": config.prepare_venvs,
+        "sync_requirements": config.sync_requirements,
+        "reformat": config.reformat,
+        "run_tests": config.test.run_tests,
+        "docs": config.docs,
+        "set_version": config.set_version,
+        "git_commit_all": config.git_commit_all,
+        "git_push": config.git_push,
+        "deploy": config.deploy,
+    }
+
+    durations = DurationsDatabase()
+    trace = Trace() if config.trace else None
+
+    try:
+        with ExitStack() as stack:
+            if trace:
+                stack.enter_context(trace)
+
+            run_stages(
+                [all_stages[i] for i, used in used_stages.items() if used],
+                max_workers=config.max_workers,
+                durations=durations,
+                print_estimate=progress_is_printed,
+                trace=trace,
+            )
+    finally:
+        durations.save()
+        venvs.shutdown_workers()
+
+        if trace:
+            trace_path = trace.save(PROJECT_PATHS.create_cache() / "trace.json")
+            if progress_is_printed:
+                print(f"\n{trace.get_summary()}\n\tTrace saved to {trace_path}\n")
 
     print_progress(f"{3 * EMOJIS.PARTY} Finished {3 * EMOJIS.PARTY}", True)
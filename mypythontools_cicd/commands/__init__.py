@@ -0,0 +1,26 @@
+"""Run terminal commands. Commands can run concurrently and output can be streamed line by line with prefix,
+so output of more commands is not mixed."""
+
+from mypythontools_cicd.commands.commands_internal import (
+    Command,
+    CommandError,
+    CommandResult,
+    process_result,
+    record_command,
+    run_command,
+    run_command_async,
+    run_commands,
+    Trace,
+)
+
+__all__ = [
+    "Command",
+    "CommandError",
+    "CommandResult",
+    "process_result",
+    "record_command",
+    "run_command",
+    "run_command_async",
+    "run_commands",
+    "Trace",
+]
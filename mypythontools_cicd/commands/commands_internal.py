@@ -0,0 +1,824 @@
+"""Module with functions for 'commands' subpackage."""
+
+from __future__ import annotations
+from typing import Any, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import asyncio
+import json
+import os
+import shlex
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from mypythontools.paths import PathLike, validate_path, WslPath
+
+# Lazy import
+# import mylogging
+
+# Output of commands running at the same time is printed line by line, so lines are never mixed
+_output_lock = threading.Lock()
+
+# Maximum length of one line of output
+_LINE_LIMIT = 2**24
+
+# Trace where commands are recorded. Set when `Trace` is used as context manager.
+_active_trace: None | Trace = None
+
+# Command is run from this script if trace is active, so resource usage of just this command is measured
+_RESOURCE_USAGE_LAUNCHER = """
+import json, os, resource, subprocess, sys
+command, shell, fd = json.loads(sys.argv[1])
+code = subprocess.call(command, shell=shell)
+usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+os.write(fd, json.dumps([usage.ru_utime + usage.ru_stime, usage.ru_maxrss]).encode())
+sys.exit(code if code >= 0 else 128 - code)
+"""
+
+
+class CommandResult:
+    """Result of finished command.
+
+    Attributes:
+        command (str): Used command.
+        cwd (None | Path): Where command was run. None means current working directory.
+        returncode (None | int): Exit code. None if command was killed because of timeout.
+        stdout (str): Captured standard output.
+        stderr (str): Captured error output.
+        duration (float): Duration in seconds.
+        timed_out (bool): Whether command was killed because of timeout.
+        cpu_time (None | float): User and system CPU time of the command and its children in seconds. It's
+            measured only if `Trace` is active and not on Windows, otherwise it's None.
+        peak_memory (None | float): Peak resident memory of the largest process of the command in MB.
+            Measured the same way as `cpu_time`.
+        cancelled (bool): Whether command was killed because `cancel_event` was set.
+    """
+
+    def __init__(
+        self,
+        command: str,
+        cwd: None | Path,
+        returncode: None | int,
+        stdout: str,
+        stderr: str,
+        duration: float,
+        timed_out: bool = False,
+        cpu_time: None | float = None,
+        peak_memory: None | float = None,
+        cancelled: bool = False,
+    ) -> None:
+        """Store the result. Check attributes for details."""
+        self.command = command
+        self.cwd = cwd
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.duration = duration
+        self.timed_out = timed_out
+        self.cpu_time = cpu_time
+        self.peak_memory = peak_memory
+        self.cancelled = cancelled
+
+    @property
+    def success(self) -> bool:
+        """Whether command finished with zero exit code."""
+        return self.returncode == 0 and not self.timed_out and not self.cancelled
+
+    def __repr__(self) -> str:
+        return f"CommandResult(command={self.command!r}, returncode={self.returncode}, duration={self.duration:.2f})"
+
+
+class CommandError(RuntimeError):
+    """Error raised when command fails or timeouts. It's subclass of `RuntimeError`, so callers catching
+    `RuntimeError` (e.g. `git.push`) handle failed commands as well.
+
+    Attributes:
+        result (None | CommandResult): Result of failed command. None if command was not started at all.
+    """
+
+    def __init__(self, message: str, result: None | CommandResult = None) -> None:
+        """Init the error.
+
+        Args:
+            message (str): Error message.
+            result (None | CommandResult, optional): Result of failed command. Defaults to None.
+        """
+        super().__init__(message)
+        self.result = result
+
+
+class Trace:
+    """Timeline of pipeline stages and commands that can be saved in Chrome trace format.
+
+    While trace is active (used as context manager), every command run with this subpackage from any thread is
+    recorded with exit code, CPU time and peak memory. Other events (e.g. pipeline stages) can be added with
+    `add`. Saved file can be opened in chrome://tracing or in https://ui.perfetto.dev.
+
+    Attributes:
+        events (list[dict[str, Any]]): Recorded events with "name", "category", "start", "end" (seconds since
+            trace creation) and "args".
+
+    Example:
+        >>> with Trace() as trace:
+        ...     _ = run_command("python --version", verbose=False)
+        >>> trace.events[0]["category"], trace.events[0]["args"]["returncode"]
+        ('command', 0)
+    """
+
+    def __init__(self) -> None:
+        """Init the trace. Times of events are relative to this moment."""
+        self.events: list[dict[str, Any]] = []
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+        self._previous: None | Trace = None
+
+    def __enter__(self) -> Trace:
+        global _active_trace  # pylint: disable=global-statement
+        self._previous = _active_trace
+        _active_trace = self
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        global _active_trace  # pylint: disable=global-statement
+        _active_trace = self._previous
+
+    def add(
+        self, name: str, category: str, start: float, end: float, args: None | dict[str, Any] = None
+    ) -> None:
+        """Add finished event.
+
+        Args:
+            name (str): E.g. stage name.
+            category (str): E.g. "stage". Events of the same category are displayed together.
+            start (float): Start as returned from `time.perf_counter()`.
+            end (float): End as returned from `time.perf_counter()`.
+            args (None | dict[str, Any], optional): Extra data displayed with the event. Defaults to None.
+        """
+        with self.lock:
+            self.events.append(
+                {
+                    "name": name,
+                    "category": category,
+                    "start": start - self.start,
+                    "end": end - self.start,
+                    "args": args or {},
+                }
+            )
+
+    def save(self, path: PathLike) -> Path:
+        """Save trace in Chrome trace event format.
+
+        Events that overlap are displayed in separate rows (e.g. commands running at the same time).
+
+        Args:
+            path (PathLike): Path of json file.
+
+        Returns:
+            Path: Path of saved file.
+        """
+        path = Path(path)
+        trace_events: list[dict[str, Any]] = []
+        row_offset = 0
+
+        with self.lock:
+            events = sorted(self.events, key=lambda event: event["start"])
+
+        for category in sorted({event["category"] for event in events}):
+            rows_ends: list[float] = []
+
+            for event in events:
+                if event["category"] != category:
+                    continue
+
+                # First row where previous event already finished
+                row = next((i for i, end in enumerate(rows_ends) if end <= event["start"]), len(rows_ends))
+                if row == len(rows_ends):
+                    rows_ends.append(event["end"])
+                    trace_events.append(
+                        {
+                            "name": "thread_name",
+                            "ph": "M",
+                            "pid": 1,
+                            "tid": row_offset + row,
+                            "args": {"name": f"{category} {row + 1}"},
+                        }
+                    )
+                rows_ends[row] = event["end"]
+
+                trace_events.append(
+                    {
+                        "name": event["name"],
+                        "cat": category,
+                        "ph": "X",
+                        "ts": round(event["start"] * 1e6),
+                        "dur": round((event["end"] - event["start"]) * 1e6),
+                        "pid": 1,
+                        "tid": row_offset + row,
+                        "args": event["args"],
+                    }
+                )
+
+            row_offset += len(rows_ends)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        with open(path, "w") as trace_file:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, trace_file)
+
+        return path
+
+    def get_summary(self, commands_count: int = 5) -> str:
+        """Get text summary with duration of stages and the slowest commands.
+
+        Args:
+            commands_count (int, optional): How many of the slowest commands are listed. Defaults to 5.
+
+        Returns:
+            str: Summary that can be printed.
+        """
+        with self.lock:
+            events = list(self.events)
+
+        total = max((event["end"] for event in events), default=0)
+        summary = [f"Timing summary (total {total:.1f} s)"]
+
+        stages = [event for event in events if event["category"] == "stage"]
+        if stages:
+            summary.append("\tStages")
+            name_width = max(len(event["name"]) for event in stages)
+            for event in stages:
+                status = event["args"].get("status", "")
+                summary.append(
+                    f"\t\t{event['name']:<{name_width}}  {status:<7}  {event['end'] - event['start']:7.1f} s"
+                )
+
+        commands = sorted(
+            (event for event in events if event["category"] == "command"),
+            key=lambda event: event["start"] - event["end"],
+        )
+        if commands:
+            summary.append("\tSlowest commands")
+            for event in commands[:commands_count]:
+                args = event["args"]
+                usage = ""
+                if args.get("cpu_time") is not None:
+                    usage = f"  cpu {args['cpu_time']:6.1f} s  peak {args['peak_memory']:6.0f} MB"
+                summary.append(
+                    f"\t\t{event['end'] - event['start']:7.1f} s{usage}  exit {args.get('returncode')}  "
+                    f"{event['name']}"
+                )
+
+        return "\n".join(summary)
+
+
+class Command:
+    """Definition of command that can be run with `run_commands`. Check `run_command` for arguments.
+
+    Attributes:
+        command (str): Command to run.
+    """
+
+    def __init__(
+        self,
+        command: str,
+        cwd: None | PathLike = None,
+        prefix: None | str = None,
+        timeout: None | float = None,
+        env: None | dict[str, str] = None,
+        shell: bool = True,
+        with_wsl: bool = False,
+        input_str: None | str = None,
+        error_header: str = "",
+        cancel_event: None | threading.Event = None,
+    ) -> None:
+        """Init the command. Check `run_command` for arguments."""
+        self.command = command
+        self.cwd = cwd
+        self.prefix = prefix
+        self.timeout = timeout
+        self.env = env
+        self.shell = shell
+        self.with_wsl = with_wsl
+        self.input_str = input_str
+        self.error_header = error_header
+        self.cancel_event = cancel_event
+
+
+def run_command(
+    command: str,
+    shell: bool = True,
+    cwd: None | PathLike = None,
+    verbose: bool = True,
+    error_header: str = "",
+    with_wsl: bool = False,
+    input_str: None | str = None,
+    stream: bool = False,
+    prefix: None | str = None,
+    timeout: None | float = None,
+    env: None | dict[str, str] = None,
+    cancel_event: None | threading.Event = None,
+) -> str:
+    """Run command in terminal and return its output.
+
+    It can be used instead of `terminal_do_command` from mypythontools, but it's possible to stream output
+    line by line while command is running, to use timeout or to add environment variables. It's thread safe,
+    so commands can run from more threads at the same time and output lines are not mixed.
+
+    Args:
+        command (str): Command to run.
+        shell (bool, optional): Same meaning as in ``subprocess.run()``. Defaults to True.
+        cwd (None | PathLike, optional): Where to run the command. Defaults to None.
+        verbose (bool, optional): Whether print output to console. Defaults to True.
+        error_header (str, optional): If meet error, message at the beginning of message. Defaults to "".
+        with_wsl (bool, optional): Prepend wsl prefix and edit command so it works. Path needs to be edited
+            manually. Defaults to False.
+        input_str (None | str, optional): Input inserted into terminal. It can be answer `y` for example if
+            terminal needs an confirmation. Defaults to None.
+        stream (bool, optional): If True and verbose, output is printed line by line as it comes, otherwise
+            it's printed when command finishes. Defaults to False.
+        prefix (None | str, optional): If printing output, every line starts with `[prefix]`, so it's clear
+            which command printed it. Defaults to None.
+        timeout (None | float, optional): Command is killed if it doesn't finish in defined number of
+            seconds. Defaults to None.
+        env (None | dict[str, str], optional): Environment variables added to the current ones.
+            Defaults to None.
+        cancel_event (None | threading.Event, optional): If the event is set from other thread while command
+            is running, command is killed and `CommandError` with cancelled result is raised. It's not
+            supported on python < 3.8 out of main thread. Defaults to None.
+
+    Returns:
+        str: Standard output.
+
+    Raises:
+        CommandError: If command cannot be started, returns non zero exit code, timeouts or is cancelled.
+
+    Example:
+        >>> run_command("python -c \\"print('Hello')\\"", verbose=False)
+        'Hello'
+    """
+    return _run_blocking(
+        [Command(command, cwd, prefix, timeout, env, shell, with_wsl, input_str, error_header, cancel_event)],
+        verbose=verbose,
+        stream=stream,
+        check=True,
+    )[0].stdout
+
+
+async def run_command_async(
+    command: str,
+    shell: bool = True,
+    cwd: None | PathLike = None,
+    verbose: bool = True,
+    error_header: str = "",
+    with_wsl: bool = False,
+    input_str: None | str = None,
+    stream: bool = False,
+    prefix: None | str = None,
+    timeout: None | float = None,
+    env: None | dict[str, str] = None,
+    check: bool = True,
+) -> CommandResult:
+    """Run command in terminal asynchronously. If cancelled, the process is killed.
+
+    Args:
+        command (str): Command to run. Check `run_command` for other arguments.
+        check (bool, optional): Whether to raise `CommandError` if command fails. Defaults to True.
+
+    Returns:
+        CommandResult: Result with output and exit code.
+
+    Raises:
+        CommandError: If check and command cannot be started, returns non zero exit code or timeouts.
+    """
+    definition = Command(command, cwd, prefix, timeout, env, shell, with_wsl, input_str, error_header)
+    result = await _execute_async(definition, verbose and stream)
+    return process_result(definition, result, verbose and not stream, check)
+
+
+def run_commands(
+    commands: Sequence[str | Command],
+    max_concurrent: None | int = None,
+    verbose: bool = True,
+    stream: bool = True,
+    check: bool = True,
+    fail_fast: bool = False,
+) -> list[CommandResult]:
+    """Run more commands at the same time.
+
+    Output is printed line by line with prefix (if defined in `Command`), so it's clear which command printed
+    what.
+
+    Args:
+        commands (Sequence[str | Command]): Commands to run. Use `Command` to define cwd, prefix, timeout etc.
+        max_concurrent (None | int, optional): Maximum number of commands running at the same time. If None,
+            all the commands run at the same time. Defaults to None.
+        verbose (bool, optional): Whether print output to console. Defaults to True.
+        stream (bool, optional): If True, output is printed line by line as it comes, otherwise it's printed
+            when command finishes. Defaults to True.
+        check (bool, optional): Whether to raise `CommandError` if some command fails. It's raised when all
+            the commands finish. Defaults to True.
+        fail_fast (bool, optional): If True, other commands are killed when some command fails and error is
+            raised immediately. Defaults to False.
+
+    Returns:
+        list[CommandResult]: Results in the same order as commands.
+
+    Raises:
+        CommandError: If check and some command fails.
+
+    Example:
+        >>> results = run_commands(["python --version", "python -c \\"print(1)\\""], verbose=False)
+        >>> [i.success for i in results]
+        [True, True]
+    """
+    definitions = [i if isinstance(i, Command) else Command(i) for i in commands]
+    return _run_blocking(
+        definitions,
+        verbose=verbose,
+        stream=stream,
+        check=check,
+        max_concurrent=max_concurrent,
+        fail_fast=fail_fast,
+    )
+
+
+def record_command(definition: Command, result: CommandResult, start: float) -> None:
+    """Add finished command to active `Trace`. Nothing happens if no trace is active.
+
+    Commands run with this subpackage are recorded automatically. Use it for commands run other way, e.g. in
+    venv worker.
+
+    Args:
+        definition (Command): Definition of the command.
+        result (CommandResult): Result of the command.
+        start (float): Start as returned from `time.perf_counter()`.
+    """
+    if not _active_trace:
+        return
+
+    _active_trace.add(
+        result.command if len(result.command) <= 80 else result.command[:77] + "...",
+        "command",
+        start,
+        start + result.duration,
+        {
+            "command": result.command,
+            "cwd": str(result.cwd) if result.cwd else None,
+            "prefix": definition.prefix,
+            "returncode": result.returncode,
+            "timed_out": result.timed_out,
+            "cancelled": result.cancelled,
+            "cpu_time": result.cpu_time,
+            "peak_memory": result.peak_memory,
+        },
+    )
+
+
+def process_result(
+    definition: Command, result: CommandResult, print_output: bool = False, check: bool = True
+) -> CommandResult:
+    """Print output of successful command or raise error with details.
+
+    Args:
+        definition (Command): Definition of the command. Prefix and error header are used.
+        result (CommandResult): Result of the command.
+        print_output (bool, optional): Whether print output of successful command. Defaults to False.
+        check (bool, optional): Whether raise error if command failed. Defaults to True.
+
+    Returns:
+        CommandResult: The same result if it's successful or if not check.
+
+    Raises:
+        CommandError: If check and command failed, timed out or was cancelled.
+
+    Example:
+        >>> result = CommandResult("python --version", None, 1, "", "Error", 0.1)
+        >>> process_result(Command(result.command), result)
+        Traceback (most recent call last):
+        mypythontools_cicd.commands.commands_internal.CommandError: ...
+    """
+    if result.success:
+        if print_output:
+            _print_lines(f"\n{result.stdout}\n", definition.prefix)
+        return result
+
+    if not check:
+        return result
+
+    import mylogging
+
+    if result.cancelled:
+        error = f"Command was cancelled.\n\nstdout:\n\n{result.stdout}\n\n"
+    elif result.timed_out:
+        error = f"Timeout {definition.timeout} seconds exceeded.\n\nstdout:\n\n{result.stdout}\n\n"
+    elif result.returncode is None:
+        error = f"Command not started. {result.stderr}"
+    else:
+        stderr = f"\n\n{result.stderr}" if result.stderr else "\n"
+        error = f"Return code is {result.returncode}.\n\nstderr:{stderr}\n\nstdout:\n\n{result.stdout}\n\n"
+
+    header = f"{definition.error_header}\n\n" if definition.error_header else ""
+    cwd_str = "on your project root" if result.cwd is None else f"in '{result.cwd}' folder"
+
+    raise CommandError(
+        f"{header}"
+        "Used command"
+        f"\n\n{mylogging.colors.colorize(result.command)}\n\n"
+        f"Command execution in terminal failed. Try command above in the terminal on path {cwd_str} "
+        "On windows use cmd so script paths resolved correctly. Try it with administrator rights.\n\n"
+        f"Captured error: {error}",
+        result,
+    )
+
+
+def _run_blocking(
+    definitions: list[Command],
+    verbose: bool,
+    stream: bool,
+    check: bool,
+    max_concurrent: None | int = None,
+    fail_fast: bool = False,
+) -> list[CommandResult]:
+    """Run commands from synchronous code. New event loop is used, so it works from any thread."""
+    max_concurrent = max_concurrent or len(definitions) or 1
+
+    # Python < 3.8 on unix attaches child watcher only to the main thread's current loop, so blocking
+    # subprocess is used there
+    if sys.version_info < (3, 8) and os.name != "nt":
+
+        def run_one(definition: Command) -> CommandResult:
+            result = _execute_blocking(definition)
+            return process_result(definition, result, verbose, False)
+
+        with ThreadPoolExecutor(max_concurrent) as executor:
+            results = list(executor.map(run_one, definitions))
+
+        if check:
+            for definition, result in zip(definitions, results):
+                process_result(definition, result, False, True)
+
+        return results
+
+    async def run_all() -> list[CommandResult]:
+        semaphore = asyncio.Semaphore(max_concurrent)
+
+        async def run_one(definition: Command) -> CommandResult:
+            async with semaphore:
+                result = await _execute_async(definition, verbose and stream)
+                return process_result(definition, result, verbose and not stream, fail_fast)
+
+        tasks = [asyncio.ensure_future(run_one(i)) for i in definitions]
+
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        finally:
+            # Processes of unfinished commands are killed on cancellation (fail fast or KeyboardInterrupt)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        for task in done:
+            if task.exception():
+                raise task.exception()  # type: ignore
+
+        return [i.result() for i in tasks]
+
+    # If already in running event loop (e.g. in jupyter), new loop has to run in other thread
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        with ThreadPoolExecutor(1) as executor:
+            return executor.submit(
+                _run_blocking, definitions, verbose, stream, check, max_concurrent, fail_fast
+            ).result()
+
+    loop = asyncio.ProactorEventLoop() if os.name == "nt" else asyncio.new_event_loop()  # type: ignore
+    main_task = asyncio.ensure_future(run_all(), loop=loop)
+
+    try:
+        results = loop.run_until_complete(main_task)
+    except BaseException:
+        main_task.cancel()
+        try:
+            loop.run_until_complete(main_task)
+        except BaseException:  # pylint: disable=broad-except
+            pass
+        raise
+    finally:
+        loop.close()
+
+    if check:
+        for definition, result in zip(definitions, results):
+            process_result(definition, result, False, True)
+
+    return results
+
+
+def _prepare_command(definition: Command) -> tuple[str, None | Path, None | dict[str, str]]:
+    command = definition.command
+    cwd = validate_path(definition.cwd) if definition.cwd else None
+
+    if definition.with_wsl:
+        command = "wsl " + command
+
+        if definition.shell:
+            for i in ["^", "&", "$", "|", "<", ">"]:
+                command = command.replace(i, f"^{i}")
+        if cwd:
+            cwd = WslPath(cwd)
+
+    env = {**os.environ, **definition.env} if definition.env else None
+
+    return command, cwd, env
+
+
+async def _execute_async(definition: Command, print_lines: bool) -> CommandResult:
+    command, cwd, env = _prepare_command(definition)
+    kwargs: dict[str, Any] = {
+        "cwd": cwd,
+        "env": env,
+        "stdin": subprocess.PIPE if definition.input_str else None,
+        "stdout": subprocess.PIPE,
+        "stderr": subprocess.PIPE,
+        "limit": _LINE_LIMIT,
+    }
+
+    # Own process group, so children of the shell can be killed too
+    if os.name != "nt":
+        kwargs["start_new_session"] = True
+
+    used_command: str | list[str] = (
+        command if definition.shell else shlex.split(command, posix=os.name != "nt")
+    )
+    usage_fds: None | tuple[int, int] = None
+    start = time.perf_counter()
+
+    try:
+        if _active_trace and os.name != "nt":
+            # Launcher writes resource usage of the command into the pipe
+            usage_fds = os.pipe()
+            process = await asyncio.create_subprocess_exec(
+                sys.executable,
+                "-c",
+                _RESOURCE_USAGE_LAUNCHER,
+                json.dumps([used_command, definition.shell, usage_fds[1]]),
+                pass_fds=(usage_fds[1],),
+                **kwargs,
+            )
+        elif definition.shell:
+            process = await asyncio.create_subprocess_shell(command, **kwargs)
+        else:
+            process = await asyncio.create_subprocess_exec(*used_command, **kwargs)
+    except OSError as err:
+        if usage_fds:
+            os.close(usage_fds[0])
+            usage_fds = None
+        result = CommandResult(command, cwd, None, "", str(err), time.perf_counter() - start)
+        record_command(definition, result, start)
+        return result
+    finally:
+        if usage_fds:
+            os.close(usage_fds[1])
+
+    stdout_lines: list[str] = []
+    stderr_lines: list[str] = []
+
+    async def read(reader: asyncio.StreamReader, lines: list[str]) -> None:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            lines.append(line.decode("utf-8", errors="replace").rstrip("\r\n"))
+            if print_lines:
+                _print_lines(lines[-1], definition.prefix)
+
+    async def communicate() -> int:
+        if definition.input_str:
+            process.stdin.write(definition.input_str.encode("utf-8"))  # type: ignore
+            await process.stdin.drain()  # type: ignore
+            process.stdin.close()  # type: ignore
+
+        await asyncio.gather(read(process.stdout, stdout_lines), read(process.stderr, stderr_lines))  # type: ignore
+        return await process.wait()
+
+    async def communicate_until_cancelled() -> None | int:
+        """Same as communicate, but None is returned if cancel event is set before command finishes."""
+        task = asyncio.ensure_future(communicate())
+        try:
+            while not definition.cancel_event.is_set():  # type: ignore
+                done, _ = await asyncio.wait([task], timeout=0.1)
+                if done:
+                    return task.result()
+            return None
+        finally:
+            task.cancel()
+
+    timed_out = False
+    cancelled = False
+    returncode: None | int = None
+
+    cpu_time = peak_memory = None
+
+    try:
+        returncode = await asyncio.wait_for(
+            communicate_until_cancelled() if definition.cancel_event else communicate(), definition.timeout
+        )
+        if returncode is None:
+            cancelled = True
+            await _kill(process)
+    except asyncio.TimeoutError:
+        timed_out = True
+        await _kill(process)
+    except asyncio.CancelledError:
+        await _kill(process)
+        raise
+    finally:
+        if usage_fds:
+            cpu_time, peak_memory = _read_resource_usage(usage_fds[0])
+
+    result = CommandResult(
+        command,
+        cwd,
+        returncode,
+        "\n".join(stdout_lines).strip("\r\n"),
+        "\n".join(stderr_lines).strip("\r\n"),
+        time.perf_counter() - start,
+        timed_out,
+        cpu_time,
+        peak_memory,
+        cancelled,
+    )
+    record_command(definition, result, start)
+
+    return result
+
+
+def _execute_blocking(definition: Command) -> CommandResult:
+    command, cwd, env = _prepare_command(definition)
+    start = time.perf_counter()
+
+    try:
+        completed = subprocess.run(
+            command if definition.shell else shlex.split(command, posix=os.name != "nt"),
+            shell=definition.shell,
+            cwd=cwd,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            input=definition.input_str.encode("utf-8") if definition.input_str else None,
+            timeout=definition.timeout,
+        )
+        result = CommandResult(
+            command,
+            cwd,
+            completed.returncode,
+            completed.stdout.decode("utf-8", errors="replace").strip("\r\n"),
+            completed.stderr.decode("utf-8", errors="replace").strip("\r\n"),
+            time.perf_counter() - start,
+        )
+    except subprocess.TimeoutExpired as err:
+        stdout = (err.stdout or b"").decode("utf-8", errors="replace").strip("\r\n")
+        result = CommandResult(command, cwd, None, stdout, "", time.perf_counter() - start, True)
+    except OSError as err:
+        result = CommandResult(command, cwd, None, "", str(err), time.perf_counter() - start)
+
+    record_command(definition, result, start)
+
+    return result
+
+
+def _read_resource_usage(fd: int) -> tuple[None | float, None | float]:
+    """Read CPU time and peak memory in MB written by launcher. Nothing is written if command was killed."""
+    try:
+        with os.fdopen(fd, "rb") as usage_file:
+            cpu_time, max_rss = json.loads(usage_file.read())
+    except (OSError, ValueError):
+        return None, None
+
+    # Max rss is in kilobytes on linux and in bytes on mac
+    return cpu_time, max_rss / (1024**2 if sys.platform == "darwin" else 1024)
+
+
+async def _kill(process: asyncio.subprocess.Process) -> None:
+    try:
+        if os.name != "nt":
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except OSError:
+        pass  # Already finished
+
+    await process.wait()
+
+
+def _print_lines(output: str, prefix: None | str) -> None:
+    if prefix:
+        output = "\n".join(f"[{prefix}] {i}" for i in output.split("\n"))
+
+    with _output_lock:
+        print(output, flush=True)
@@ -7,8 +7,9 @@ from typing_extensions import Literal
 
 from mypythontools.paths import validate_path, PathLike
 from mypythontools.misc import delete_files, print_progress
-from mypythontools.system import check_script_is_available, terminal_do_command, PYTHON
+from mypythontools.system import check_script_is_available, PYTHON
 
+from mypythontools_cicd.commands import run_command
 from mypythontools_cicd.project_paths import PROJECT_PATHS
 from mypythontools_cicd.venvs import Venv
 
@@ -72,7 +73,7 @@ def deploy_to_pypi(
     else:
         build_command = f"{activate_prefix_command} {PYTHON} setup.py sdist bdist_wheel"
 
-    terminal_do_command(
+    run_command(
         build_command,
         cwd=setup_dir_path.as_posix(),
         verbose=verbose,
@@ -83,7 +84,7 @@ def deploy_to_pypi(
 
     command = "twine upload dist/*"
 
-    terminal_do_command(
+    run_command(
         command,
         cwd=setup_dir_path.as_posix(),
         verbose=verbose,
@@ -2,7 +2,12 @@
 
 from __future__ import annotations
 from typing import Sequence
+from pathlib import Path
 import ast
+import filecmp
+import platform
+import shutil
+import tempfile
 
 from typing_extensions import Literal
 
@@ -13,10 +18,10 @@ from mypythontools.misc import delete_files, print_progress
 from mypythontools.system import (
     check_script_is_available,
     get_console_str_with_quotes,
-    terminal_do_command,
     SHELL_AND,
 )
 
+from mypythontools_cicd.commands import run_command
 from mypythontools_cicd.project_paths import PROJECT_PATHS
 
 
@@ -26,12 +31,18 @@ def docs_regenerate(
     git_add: bool = True,
     keep: Sequence[PathLike] = (),
     ignore: Sequence[PathLike] = ("modules.rst", "**/*internal.py"),
+    incremental: bool = True,
     verbosity: Literal[0, 1, 2] = 1,
 ) -> None:
     """Generate all rst files necessary for sphinx documentation generation with sphinx-apidoc.
 
     It automatically delete rst files from removed or renamed files.
 
+    In incremental mode, rst files are generated into temporary folder and only added or changed files are
+    written into the docs source, so unchanged files keep their modification time. Build folder is not
+    cleaned (only if some module was removed), so sphinx rebuilds only changed pages using cached doctrees.
+    Sphinx build runs in parallel with `-j auto`.
+
     Note:
         All the files except ['conf.py', 'index.rst', '_static', '_templates', 'content/**'], and files in
         'keep' parameter will be deleted!!! Because if some files would be deleted or
@@ -55,6 +66,8 @@ def docs_regenerate(
             It can be python modules that will be ignored or it can be rst files created, that will be
             deleted. to have no errors in sphinx build for unused modules, or for internal modules. Glob-style
             patterns can be used. Defaults to ("modules.rst", "**/*_.py")
+        incremental (bool, optional): If False, all generated files are deleted and created again and build
+            is cleaned before building. Defaults to True.
         verbosity (Literal[0, 1, 2], optional): If 0, prints nothing, if 1, then one line description of what
             happened is printed. If 3, all the results from terminal are printed. Defaults to 1.
 
@@ -97,30 +110,56 @@ def docs_regenerate(
 
     ignored = " "
 
+    source_index = PROJECT_PATHS.get_file_index(source_path)
+
     for i in ignore_list:
-        for file in source_path.rglob(str(i)):
+        for file in source_index.glob(str(i), source_path):
             ignored = ignored + f"{get_console_str_with_quotes(file)} "
 
-    for file in docs_source_path.iterdir():
-        if not any((file.match(str(pattern)) for pattern in keep)):
-            delete_files(file)
+    apidoc_command = "sphinx-apidoc --module-first --force --separate -o"
+    removed = False
 
-    apidoc_command = (
-        f"sphinx-apidoc --module-first --force --separate -o source {source_console_path} {ignored}"
-    )
+    if incremental:
+        with tempfile.TemporaryDirectory() as generated_dir:
+            generated_path = Path(generated_dir)
+            generated_console_path = get_console_str_with_quotes(generated_path)
 
-    terminal_do_command(
-        apidoc_command, cwd=docs_path, verbose=verbose, error_header="Docs sphinx-apidoc failed."
-    )
+            run_command(
+                f"{apidoc_command} {generated_console_path} {source_console_path} {ignored}",
+                cwd=docs_path,
+                verbose=verbose,
+                error_header="Docs sphinx-apidoc failed.",
+            )
 
-    if ignore_list:
+            _delete_ignored(generated_path, ignore_list)
+            removed = _sync_generated_files(generated_path, docs_source_path, keep)
+
+    else:
         for file in docs_source_path.iterdir():
-            if any((file.match(str(pattern)) for pattern in ignore_list)):
+            if not any((file.match(str(pattern)) for pattern in keep)):
                 delete_files(file)
 
+        run_command(
+            f"{apidoc_command} source {source_console_path} {ignored}",
+            cwd=docs_path,
+            verbose=verbose,
+            error_header="Docs sphinx-apidoc failed.",
+        )
+
+        _delete_ignored(docs_source_path, ignore_list)
+
     if build_locally:
-        terminal_do_command(
-            f"make clean {SHELL_AND} make html",
+        if platform.system() == "Windows":
+            build_command = f"set SPHINXOPTS=-j auto {SHELL_AND} make html"
+        else:
+            build_command = 'make html SPHINXOPTS="-j auto"'
+
+        # Cached doctrees are removed only if necessary, so sphinx can rebuild just changed pages
+        if not incremental or removed:
+            build_command = f"make clean {SHELL_AND} {build_command}"
+
+        run_command(
+            build_command,
             cwd=docs_path,
             verbose=verbose,
             error_header="Sphinx build failed.",
@@ -128,7 +167,32 @@ def docs_regenerate(
         )
 
     if git_add:
-        terminal_do_command("git add docs", cwd=PROJECT_PATHS.root.as_posix(), verbose=verbose)
+        run_command("git add docs", cwd=PROJECT_PATHS.root.as_posix(), verbose=verbose)
+
+
+def _delete_ignored(folder: Path, ignore_list: Sequence[PathLike]) -> None:
+    for file in folder.iterdir():
+        if any((file.match(str(pattern)) for pattern in ignore_list)):
+            delete_files(file)
+
+
+def _sync_generated_files(generated_path: Path, docs_source_path: Path, keep: Sequence[PathLike]) -> bool:
+    """Copy new and changed generated files and delete files that were not generated. Return whether some
+    file was deleted."""
+    generated = {i.name for i in generated_path.iterdir()}
+    removed = False
+
+    for file in docs_source_path.iterdir():
+        if file.name not in generated and not any((file.match(str(pattern)) for pattern in keep)):
+            delete_files(file)
+            removed = True
+
+    for name in generated:
+        target = docs_source_path / name
+        if not target.exists() or not filecmp.cmp(generated_path / name, target, shallow=False):
+            shutil.copyfile(generated_path / name, target)
+
+    return removed
 
 
 def generate_readme_from_init(git_add: bool = True) -> None:
@@ -156,4 +220,4 @@ def generate_readme_from_init(git_add: bool = True) -> None:
         file.write(docstrings)
 
     if git_add:
-        terminal_do_command(f"git add {PROJECT_PATHS.readme}", cwd=PROJECT_PATHS.root.as_posix())
+        run_command(f"git add {PROJECT_PATHS.readme}", cwd=PROJECT_PATHS.root.as_posix())
@@ -7,6 +7,17 @@ from mypythontools_cicd.git.git_internal import (
     check_tag,
     TagAlreadyExists,
     clone_locally,
+    get_changed_files,
+    get_head_commit,
 )
 
-__all__ = ["commit_all", "push", "check_branch", "check_tag", "TagAlreadyExists", "clone_locally"]
+__all__ = [
+    "commit_all",
+    "push",
+    "check_branch",
+    "check_tag",
+    "TagAlreadyExists",
+    "clone_locally",
+    "get_changed_files",
+    "get_head_commit",
+]
@@ -2,6 +2,7 @@
 
 from __future__ import annotations
 from typing import Sequence
+from pathlib import Path
 
 from typing_extensions import Literal
 
@@ -10,13 +11,13 @@ from mypythontools.types import validate_sequence
 from mypythontools.paths import PathLike
 from mypythontools.system import (
     get_console_str_with_quotes,
-    terminal_do_command,
     SHELL_AND,
 )
 
 # Lazy loaded
 # from git import Repo
 
+from ..commands import run_command
 from ..project_paths import PROJECT_PATHS
 from ..packages import get_version
 
@@ -35,7 +36,7 @@ def commit_all(commit_message: str, verbosity: Literal[0, 1, 2] = 1):
     """
     print_progress("Creating commit of all changes", verbosity > 0)
     git_command = f"git add . {SHELL_AND} git commit -m {get_console_str_with_quotes(commit_message)}"
-    terminal_do_command(git_command, cwd=PROJECT_PATHS.root.as_posix(), verbose=verbosity == 2)
+    run_command(git_command, cwd=PROJECT_PATHS.root.as_posix(), verbose=verbosity == 2)
 
 
 def push(
@@ -77,7 +78,7 @@ def push(
         git_command += " --follow-tags"
 
     try:
-        terminal_do_command(git_command, cwd=PROJECT_PATHS.root.as_posix(), verbose=verbosity == 2)
+        run_command(git_command, cwd=PROJECT_PATHS.root.as_posix(), verbose=verbosity == 2)
 
     except RuntimeError as err:
         git.repo.Repo(PROJECT_PATHS.root.as_posix()).delete_tag(tag)  # type: ignore
@@ -139,4 +140,56 @@ def clone_locally(from_path: PathLike, to_path: PathLike):
         from_path (PathLike): Source
         to_path (PathLike): Destination
     """
-    terminal_do_command(f"git clone {from_path} {to_path}")
+    run_command(f"git clone {from_path} {to_path}")
+
+
+def get_head_commit(path: None | PathLike = None) -> None | str:
+    """Get hash of current commit.
+
+    Args:
+        path (None | PathLike, optional): Path of the repository. If None, project root is used.
+            Defaults to None.
+
+    Returns:
+        None | str: Hash of the commit. None if not a git repository or if there is no commit yet.
+    """
+    import git.repo
+    from git.exc import InvalidGitRepositoryError, NoSuchPathError
+
+    path = Path(path) if path else PROJECT_PATHS.root
+
+    try:
+        return git.repo.Repo(path.as_posix(), search_parent_directories=True).head.commit.hexsha
+    except (InvalidGitRepositoryError, NoSuchPathError, ValueError):
+        return None
+
+
+def get_changed_files(since: str, path: None | PathLike = None) -> list[Path]:
+    """Get files changed since defined commit. Not committed changes and untracked files are included.
+
+    Args:
+        since (str): Commit hash (or any other revision) that is compared with working tree.
+        path (None | PathLike, optional): Path of the repository. If None, project root is used.
+            Defaults to None.
+
+    Returns:
+        list[Path]: Absolute paths of changed files. Deleted files are included too.
+
+    Raises:
+        RuntimeError: If path is not a git repository or if revision is not found (e.g. after rebase).
+    """
+    import git.repo
+    from git.exc import GitCommandError, InvalidGitRepositoryError, NoSuchPathError
+
+    path = Path(path) if path else PROJECT_PATHS.root
+
+    try:
+        repo = git.repo.Repo(path.as_posix(), search_parent_directories=True)
+        changed = repo.git.diff("--name-only", "--no-renames", since).splitlines()
+        untracked = repo.untracked_files
+    except (GitCommandError, InvalidGitRepositoryError, NoSuchPathError) as err:
+        raise RuntimeError(f"Getting changed files since '{since}' failed.") from err
+
+    working_dir = Path(str(repo.working_tree_dir))
+
+    return sorted({(working_dir / i).resolve() for i in [*changed, *untracked] if i})
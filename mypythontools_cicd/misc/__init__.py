@@ -1,6 +1,10 @@
-"""Miscellaneous functions that are too small to have own subpackage like for example formatting with black.
-"""
+"""Miscellaneous functions that are too small to have own subpackage like for example formatting with black."""
 
-from mypythontools_cicd.misc.misc_internal import reformat_with_black
+from mypythontools_cicd.misc.misc_internal import (
+    DurationsDatabase,
+    get_files_hash,
+    get_project_files,
+    reformat_with_black,
+)
 
-__all__ = ["reformat_with_black"]
+__all__ = ["DurationsDatabase", "get_files_hash", "get_project_files", "reformat_with_black"]
@@ -1,7 +1,16 @@
 """Module with functions for 'misc' subpackage."""
 
 from __future__ import annotations
-from typing import Sequence
+from typing import Any, Iterable, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from fnmatch import fnmatch
+from pathlib import Path
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import threading
 
 
 from mypythontools.paths import validate_path, PathLike
@@ -9,34 +18,381 @@ from mypythontools.types import validate_sequence
 
 from mypythontools.misc import print_progress
 from mypythontools.system import (
+    check_library_is_available,
     check_script_is_available,
-    terminal_do_command,
 )
 
+from mypythontools_cicd.commands import run_command
 from mypythontools_cicd.project_paths import PROJECT_PATHS
 
+# Lazy import
+# import black
+
+# Instances with the same file (e.g. in pipeline and in `run_tests`) merge saved data one after another
+_durations_save_lock = threading.Lock()
+
 
 def reformat_with_black(
-    root_path: None | PathLike = None, extra_args: Sequence[str] = ("--quiet",), verbose: bool = False
-) -> None:
+    root_path: None | PathLike = None,
+    extra_args: Sequence[str] = ("--quiet",),
+    verbose: bool = False,
+    changed_only: bool = False,
+) -> None | list[Path]:
     """Reformat code with black.
 
+    If `changed_only`, only python files changed since the last successful reformat (or since the last
+    commit if it's the first run) are formatted. Black is used via its python API (in spawned process pool
+    if there are more files) instead of subprocess. Settings are loaded from `pyproject.toml`, `extra_args`
+    are not used in this mode. Files that are not in git repository or files ignored in `.gitignore` are not
+    formatted.
+
     Args:
         root_path (None | PathLike, optional): Root path of project. If None, will be inferred.
             Defaults to None.
         extra_args (Sequence[str], optional): Some extra args for black. Defaults to ("--quiet,").
         verbose (bool, optional): If True, result of terminal command will be printed to console.
             Defaults to False.
+        changed_only (bool, optional): Whether to format only changed files. Defaults to False.
+
+    Returns:
+        None | list[Path]: If `changed_only`, list of files that were reformatted.
+
+    Raises:
+        RuntimeError: If some of the files cannot be formatted.
 
     Example:
         >>> reformat_with_black()
     """
     print_progress("Reformatting", verbose)
-    check_script_is_available("black", "black")
     validate_sequence(extra_args, "extra_args")
 
     root_path = validate_path(root_path, "Reformating failed") if root_path else PROJECT_PATHS.root
 
-    terminal_do_command(
-        f"black . {' '.join(extra_args)}", cwd=root_path, verbose=verbose, error_header="Formatting failed"
+    if not changed_only:
+        check_script_is_available("black", "black")
+
+        run_command(
+            f"black . {' '.join(extra_args)}",
+            cwd=root_path,
+            verbose=verbose,
+            error_header="Formatting failed",
+        )
+        return None
+
+    check_library_is_available("black")
+
+    # Lazy import - git imports packages that imports misc
+    from mypythontools_cicd.git import get_changed_files, get_head_commit
+
+    state_path = PROJECT_PATHS.cache / "reformat.json"
+    head_commit = get_head_commit(root_path)
+
+    try:
+        with open(state_path) as state_file:
+            since = json.load(state_file)["commit"]
+    except (OSError, ValueError, KeyError):
+        since = None
+
+    project_files = set(PROJECT_PATHS.get_file_index(root_path).glob("*.py*"))
+
+    try:
+        changed = get_changed_files(since or "HEAD", root_path)
+    except RuntimeError:
+        try:
+            changed = get_changed_files("HEAD", root_path)
+        except RuntimeError:
+            changed = list(project_files)
+
+    mode, excludes = _get_black_settings(root_path)
+    files = sorted(
+        i
+        for i in changed
+        if i.suffix in [".py", ".pyi"]
+        and i in project_files
+        and not any(j.search(f"/{i.relative_to(root_path).as_posix()}") for j in excludes)
+    )
+    reformatted = []
+    errors = []
+
+    if len(files) <= 4:
+        results = [_format_file_with_black(file, mode) for file in files]
+
+    else:
+        # It can run in pipeline stage thread and forking multithreaded process may deadlock, so spawn is used
+        with ProcessPoolExecutor(
+            min(len(files), os.cpu_count() or 1), mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            results = list(executor.map(_format_file_with_black, files, [mode] * len(files)))
+
+    for file, result in zip(files, results):
+        if isinstance(result, str):
+            errors.append(f"{file}: {result}")
+        elif result:
+            reformatted.append(file)
+
+    if errors:
+        raise RuntimeError("Formatting failed\n\n" + "\n".join(errors))
+
+    if verbose:
+        for file in reformatted:
+            print(f"reformatted {file}")
+
+    if head_commit:
+        PROJECT_PATHS.create_cache()
+        with open(state_path, "w") as state_file:
+            json.dump({"commit": head_commit}, state_file)
+
+    return reformatted
+
+
+def _get_black_settings(root_path: Path) -> tuple[Any, list[re.Pattern]]:
+    """Get black mode and regexes of excluded paths from `pyproject.toml` (like black's command line)."""
+    import black
+
+    config = {}
+    pyproject_path = root_path / "pyproject.toml"
+
+    if pyproject_path.exists():
+        config = black.parse_pyproject_toml(pyproject_path.as_posix())
+
+    mode = black.Mode(
+        target_versions={black.TargetVersion[i.upper()] for i in config.get("target_version", [])},
+        line_length=config.get("line_length", black.DEFAULT_LINE_LENGTH),
+        string_normalization=not config.get("skip_string_normalization", False),
+        magic_trailing_comma=not config.get("skip_magic_trailing_comma", False),
+        preview=config.get("preview", False),
     )
+    excludes = [
+        re.compile(i, re.VERBOSE)
+        for i in [
+            config.get("exclude", black.DEFAULT_EXCLUDES),
+            config.get("extend_exclude"),
+            config.get("force_exclude"),
+        ]
+        if i
+    ]
+
+    return mode, excludes
+
+
+def _format_file_with_black(file: Path, mode: Any) -> bool | str:
+    """Format file in place. Return whether file was changed or error message."""
+    import black
+
+    try:
+        return black.format_file_in_place(file, fast=False, mode=mode, write_back=black.WriteBack.YES)
+    except Exception as err:  # pylint: disable=broad-except
+        return str(err)
+
+
+def get_project_files(
+    patterns: Sequence[str] = ("*",),
+    root_path: None | PathLike = None,
+    exclude_names: Sequence[str] = ("node_modules", "build", "_build", "dist", "venv", "__pycache__"),
+) -> list[Path]:
+    """Get files of the project, that matches some of the patterns.
+
+    Files are taken from shared file index (`PROJECT_PATHS.get_file_index`), so project is not walked again
+    and paths ignored in `.gitignore`, hidden folders (e.g. `.git`) and virtual environments (folders with
+    `pyvenv.cfg`) are skipped. Files in folders from `exclude_names` are skipped as well.
+
+    Args:
+        patterns (Sequence[str], optional): Glob-style patterns matched with file name. E.g. ["*.py"].
+            Defaults to ("*",).
+        root_path (None | PathLike, optional): Where to search. If None, project root is used.
+            Defaults to None.
+        exclude_names (Sequence[str], optional): Names of folders that will be skipped.
+            Defaults to ("node_modules", "build", "_build", "dist", "venv", "__pycache__").
+
+    Returns:
+        list[Path]: Sorted list of found files.
+
+    Example:
+        >>> files = get_project_files(["*.py"])
+        >>> any(i.name == "__init__.py" for i in files)
+        True
+    """
+    validate_sequence(patterns, "patterns")
+    validate_sequence(exclude_names, "exclude_names")
+
+    root_path = validate_path(root_path, "Getting project files failed") if root_path else PROJECT_PATHS.root
+    root_path = root_path.resolve()
+
+    files = []
+
+    for path in PROJECT_PATHS.get_file_index(root_path).get_paths(root_path):
+        folders = path.relative_to(root_path).parts[:-1]
+
+        if any(i in exclude_names or i.endswith(".egg-info") for i in folders):
+            continue
+
+        if any(fnmatch(path.name, pattern) for pattern in patterns):
+            files.append(path)
+
+    return sorted(files)
+
+
+def get_files_hash(files: Iterable[PathLike], root_path: None | PathLike = None) -> str:
+    """Get one hash of content and relative paths of all the files. Order of files doesn't matter.
+
+    Args:
+        files (Iterable[PathLike]): Hashed files. Files that doesn't exist are hashed just by name.
+        root_path (None | PathLike, optional): Paths are hashed relatively to this path, so hash is the same
+            if project is moved. If None, project root is used. Defaults to None.
+
+    Returns:
+        str: Hexadecimal sha256 hash.
+
+    Example:
+        >>> get_files_hash(["setup.py"]) == get_files_hash(["setup.py"])
+        True
+    """
+    root_path = Path(root_path).resolve() if root_path else PROJECT_PATHS.root
+    file_hash = hashlib.sha256()
+
+    for file in sorted(Path(i).resolve() for i in files):
+        try:
+            name = file.relative_to(root_path).as_posix()
+        except ValueError:
+            name = file.as_posix()
+
+        file_hash.update(name.encode("utf-8") + b"\0")
+
+        if file.is_file():
+            with open(file, "rb") as hashed_file:
+                file_hash.update(hashed_file.read())
+
+        file_hash.update(b"\0")
+
+    return file_hash.hexdigest()
+
+
+class DurationsDatabase:
+    """Durations of tests, virtualenvs and pipeline stages from previous runs stored in json file.
+
+    Durations are grouped in categories like "tests", "venvs" or "stages". Stored value is exponential moving
+    average, so one slow run doesn't change the order much. It's used to schedule longest jobs first and
+    to estimate remaining time.
+
+    Attributes:
+        path (Path): Path to json file.
+        data (dict[str, dict[str, float]]): Category as key and dict of name and duration in seconds as value.
+
+    Example:
+        >>> import tempfile
+        ...
+        >>> durations = DurationsDatabase(Path(tempfile.mkdtemp()) / "durations.json")
+        >>> durations.update("venvs", {"3.7": 10, "3.10": 20})
+        >>> durations.update("venvs", {"3.7": 30})
+        >>> durations.get("venvs", "3.7")
+        20.0
+        >>> durations.sort_longest_first("venvs", ["3.7", "3.10", "3.11"])
+        ['3.11', '3.7', '3.10']
+        >>> durations.save()
+        >>> DurationsDatabase(durations.path).data == durations.data
+        True
+
+        Other instance with the same file doesn't overwrite durations it didn't update.
+
+        >>> other = DurationsDatabase(durations.path)
+        >>> durations.update("tests", {"test_a": 1})
+        >>> durations.save()
+        >>> other.update("venvs", {"3.7": 40})
+        >>> other.save()
+        >>> DurationsDatabase(durations.path).data["tests"]
+        {'test_a': 1}
+    """
+
+    def __init__(self, path: None | PathLike = None, smoothing: float = 0.5) -> None:
+        """Load stored durations.
+
+        Args:
+            path (None | PathLike, optional): Path to json file. If None, `durations.json` in project cache
+                is used. Defaults to None.
+            smoothing (float, optional): Weight of new value in moving average. If 1, only last duration is
+                stored. Defaults to 0.5.
+        """
+        self.path = Path(path) if path else PROJECT_PATHS.cache / "durations.json"
+        self.smoothing = smoothing
+        self.lock = threading.Lock()
+        self._updated: dict[str, set[str]] = {}
+
+        try:
+            with open(self.path) as durations_file:
+                self.data: dict[str, dict[str, float]] = json.load(durations_file)
+        except (OSError, ValueError):
+            self.data = {}
+
+    def get(self, category: str, name: str) -> None | float:
+        """Get stored duration.
+
+        Args:
+            category (str): E.g. "tests".
+            name (str): E.g. test node id.
+
+        Returns:
+            None | float: Duration in seconds. None if not known.
+        """
+        return self.data.get(category, {}).get(name)
+
+    def update(self, category: str, durations: dict[str, float]) -> None:
+        """Add new measured durations. It's not saved to file until `save` is called.
+
+        Args:
+            category (str): E.g. "tests".
+            durations (dict[str, float]): Name as key and duration in seconds as value.
+        """
+        with self.lock:
+            stored = self.data.setdefault(category, {})
+            self._updated.setdefault(category, set()).update(durations)
+
+            for name, duration in durations.items():
+                if name in stored:
+                    duration = self.smoothing * duration + (1 - self.smoothing) * stored[name]
+                stored[name] = round(duration, 3)
+
+    def sort_longest_first(self, category: str, names: Sequence[str]) -> list[str]:
+        """Sort names by stored duration. Unknown names are first as they can be long and the order is
+        kept for names with the same duration.
+
+        Args:
+            category (str): E.g. "tests".
+            names (Sequence[str]): Sorted names.
+
+        Returns:
+            list[str]: Sorted names.
+        """
+
+        def get_sort_key(name):
+            duration = self.get(category, name)
+            return -float("inf") if duration is None else -duration
+
+        return sorted(names, key=get_sort_key)
+
+    def save(self) -> None:
+        """Store durations into json file.
+
+        File is loaded again and only durations updated with this instance are overwritten, so durations
+        saved by other instance in the meantime are not lost.
+        """
+        with _durations_save_lock, self.lock:
+            try:
+                with open(self.path) as durations_file:
+                    stored: dict[str, dict[str, float]] = json.load(durations_file)
+            except (OSError, ValueError):
+                stored = {}
+
+            for category, names in self._updated.items():
+                stored.setdefault(category, {}).update({name: self.data[category][name] for name in names})
+
+            self.data = stored
+            self._updated = {}
+
+            if self.path.parent == PROJECT_PATHS.cache:
+                PROJECT_PATHS.create_cache()
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+            temp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            with open(temp_path, "w") as durations_file:
+                json.dump(self.data, durations_file, indent=2, sort_keys=True)
+            os.replace(temp_path, self.path)
@@ -3,13 +3,19 @@
 from __future__ import annotations
 from typing import Sequence, Any
 from pathlib import Path
+import hashlib
+import json
 import os
-import pkg_resources
 import re
+import sys
+import threading
 
 from typing_extensions import Literal
 from mypythontools.paths import validate_path, PathLike
+from mypythontools.system import get_console_str_with_quotes
 
+from mypythontools_cicd.commands import run_command
+from mypythontools_cicd.misc import get_files_hash, get_project_files
 from mypythontools_cicd.project_paths import PROJECT_PATHS
 
 # Lazy import
@@ -41,8 +47,8 @@ def get_requirements_files(
     if requirements == "infer":
 
         requirements_files = []
-        for i in [*path.glob("*"), *path.glob("*/*")]:
-            if "requirements" in i.as_posix().lower() and i.suffix == ".txt":
+        for i in PROJECT_PATHS.get_file_index(path).glob("*.txt", path, levels=2):
+            if "requirements" in i.as_posix().lower():
                 requirements_files.append(i)
 
         if not requirements_files:
@@ -62,10 +68,12 @@ def get_requirements_files(
             elif (path / req).exists():
                 existing_file = path / req
             else:
-                for i in [*path.glob("*"), *path.glob("*/*")]:
-                    if i.name == req:
-                        existing_file = i
-                        break
+                try:
+                    existing_file = PROJECT_PATHS.get_file_index(path).find(
+                        str(req), path, exclude_names=(), levels=2
+                    )
+                except FileNotFoundError:
+                    pass
 
                 if not existing_file:
                     raise FileNotFoundError(
@@ -77,11 +85,183 @@ def get_requirements_files(
     return requirements_files
 
 
+_REQUIREMENT_PATTERN = re.compile(
+    r"^(?P<name>[A-Za-z0-9](?:[A-Za-z0-9._-]*[A-Za-z0-9])?)\s*"
+    r"(?:\[(?P<extras>[^\]]*)\])?\s*"
+    r"(?:@\s*(?P<url>\S+)\s*|\(?(?P<specifiers>[^;()]*)\)?\s*)"
+    r"(?:;\s*(?P<marker>.+))?$"
+)
+_SPECIFIER_PATTERN = re.compile(r"^(~=|===|==|!=|<=|>=|<|>)\s*([A-Za-z0-9.*+!_-]+)$")
+
+# Bump if parsing changes, so disk cache is not used
+_REQUIREMENTS_CACHE_VERSION = "1"
+_requirements_cache: dict[str, dict[str, list[str]]] = {}
+_requirements_disk_cache_loaded = False
+# Requirements can be parsed from more threads, e.g. when syncing more venvs in parallel
+_requirements_cache_lock = threading.Lock()
+
+
+def parse_requirement(requirement: str) -> str:
+    """Validate and normalize one PEP 508 requirement.
+
+    It's lightweight alternative to `pkg_resources.Requirement`. Extras and version specifiers are sorted
+    and spaces are removed, so the same requirement has always the same string.
+
+    Args:
+        requirement (str): E.g. "numpy >= 1.20, <2 ; python_version < '3.8'".
+
+    Returns:
+        str: Normalized requirement. E.g. 'numpy<2,>=1.20; python_version < "3.8"'.
+
+    Raises:
+        ValueError: If requirement is not valid.
+
+    Example:
+        >>> parse_requirement("Numpy [b,a] >= 1.20, <2 ; python_version < '3.8'")
+        'Numpy[a,b]<2,>=1.20; python_version < "3.8"'
+    """
+    match = _REQUIREMENT_PATTERN.match(requirement.strip())
+
+    if not match:
+        raise ValueError(f"Invalid requirement '{requirement}'.")
+
+    result = match.group("name")
+
+    if match.group("extras") is not None:
+        extras = [i.strip() for i in match.group("extras").split(",") if i.strip()]
+        result += f"[{','.join(sorted(extras))}]"
+
+    if match.group("url"):
+        result += f"@ {match.group('url')}"
+
+    elif match.group("specifiers") and match.group("specifiers").strip():
+        specifiers = []
+
+        for specifier in match.group("specifiers").split(","):
+            specifier_match = _SPECIFIER_PATTERN.match(specifier.strip())
+            if not specifier_match:
+                raise ValueError(f"Invalid version specifier '{specifier.strip()}' in '{requirement}'.")
+            specifiers.append("".join(specifier_match.groups()))
+
+        result += ",".join(sorted(specifiers))
+
+    if match.group("marker"):
+        # Quoted values are kept, operators outside of quotes are surrounded by one space
+        marker_parts = re.split(r"""("[^"]*"|'[^']*')""", match.group("marker").strip())
+        marker = "".join(
+            (
+                f'"{part[1:-1]}"'
+                if part[:1] in ["'", '"']
+                else re.sub(r"\s*(===|==|!=|~=|<=|>=|<|>)\s*", r" \1 ", re.sub(r"\s+", " ", part))
+            )
+            for part in marker_parts
+        )
+        result += f"; {marker}"
+
+    return result
+
+
+def parse_requirements_file(file: PathLike) -> dict[str, list[str]]:
+    """Parse requirements file. Referenced files (`-r`) are not parsed, just returned.
+
+    Comments, empty lines, line continuation and pip options (e.g. `--index-url`, `-e` or `--hash`) are
+    ignored. Result is cached in memory and in project cache by hash of file content, so the same file is
+    not parsed again.
+
+    Args:
+        file (PathLike): Path to requirements file.
+
+    Returns:
+        dict[str, list[str]]: Dict with "requirements" (normalized requirements) and "includes" (referenced
+        requirements files as written in the file).
+
+    Raises:
+        ValueError: If some requirement is not valid.
+    """
+    global _requirements_disk_cache_loaded
+
+    with open(file, "rb") as requirements_file:
+        content = requirements_file.read()
+
+    key = hashlib.sha256(_REQUIREMENTS_CACHE_VERSION.encode("utf-8") + b"\0" + content).hexdigest()
+    disk_cache_path = _get_requirements_disk_cache_path()
+
+    with _requirements_cache_lock:
+        if not _requirements_disk_cache_loaded and disk_cache_path:
+            _requirements_disk_cache_loaded = True
+            try:
+                with open(disk_cache_path) as disk_cache_file:
+                    _requirements_cache.update(json.load(disk_cache_file))
+            except (OSError, ValueError):
+                pass
+
+        if key in _requirements_cache:
+            return _requirements_cache[key]
+
+    requirements = []
+    includes = []
+
+    # Lines ending with backslash continue on next line
+    lines = content.decode("utf-8").replace("\\\r\n", " ").replace("\\\n", " ").splitlines()
+
+    for line in lines:
+        # Comments must be at the start of the line or after whitespace
+        line = re.sub(r"(^|\s)#.*$", "", line).strip()
+
+        if not line:
+            continue
+
+        include_match = re.match(r"^(?:-r|--requirement)(?:\s+|=)(.+)$", line)
+
+        if include_match:
+            includes.append(include_match.group(1).strip())
+            continue
+
+        # Other options like '--index-url', '-e' or '-c' are not requirements
+        if line.startswith("-"):
+            continue
+
+        # Options like '--hash' can be on the same line as requirement
+        line = re.split(r"\s+--?[A-Za-z]", line, maxsplit=1)[0]
+
+        requirements.append(parse_requirement(line))
+
+    result = {"requirements": requirements, "includes": includes}
+
+    with _requirements_cache_lock:
+        _requirements_cache[key] = result
+
+        if disk_cache_path:
+            # Other processes can read the file at the same time, so it's replaced at once
+            temp_path = disk_cache_path.with_name(f"{disk_cache_path.name}.{os.getpid()}.tmp")
+            try:
+                PROJECT_PATHS.create_cache()
+                with open(temp_path, "w") as disk_cache_file:
+                    json.dump(dict(_requirements_cache), disk_cache_file)
+                os.replace(temp_path, disk_cache_path)
+            except OSError:
+                pass
+
+    return result
+
+
+def _get_requirements_disk_cache_path() -> None | Path:
+    # Cache is optional, setup.py can run where project root is not found or where it's read-only
+    try:
+        return PROJECT_PATHS.cache / "requirements.json"
+    except Exception:  # pylint: disable=broad-except
+        return None
+
+
 def get_requirements(
     files: Literal["infer"] | PathLike | Sequence[PathLike], path: PathLike = PROJECT_PATHS.root
 ) -> list[str]:
     """Get requirements into variable usually used in setup.py.
 
+    Requirements are parsed without `pkg_resources` (see `parse_requirements_file`). Referenced files
+    (`-r other.txt`) are expanded with `resolve_requirements`, so every file is read just once and
+    requirements are deduplicated.
+
     Args:
         files (Literal["infer"] | PathLike | Sequence[PathLike]): E.g. ["requirements.txt",
             "requirements_dev.txt"]. If 'infer', then every file where requirements is in the name is used.
@@ -95,22 +275,124 @@ def get_requirements(
 
     Raises:
         RuntimeError: If no requirements files found with 'infer'.
+        ValueError: If there is include cycle or conflicting pins.
     """
-    files = get_requirements_files(files, path)
-    all_requirements = []
+    return resolve_requirements(get_requirements_files(files, path), path)
+
+
+def resolve_requirements(
+    files: Sequence[PathLike], path: PathLike = PROJECT_PATHS.root, deduplicate: bool = True
+) -> list[str]:
+    """Expand referenced requirements files (`-r other.txt`) and merge requirements.
+
+    Include graph is walked once, so shared files (e.g. diamond of requirements files) are read just once.
+    Referenced files are searched relatively to the file first, then in `path`. Requirements with the same
+    normalized name (and the same environment marker) are merged into one requirement. Extras and version
+    specifiers are joined.
+
+    Args:
+        files (Sequence[PathLike]): Paths to requirements files.
+        path (PathLike, optional): Where referenced files are searched if not found next to the file.
+            Defaults to PROJECT_PATHS.root.
+        deduplicate (bool, optional): If False, requirements are returned as they are in the files in order
+            of inclusion. Defaults to True.
+
+    Returns:
+        list[str]: Requirements in order of first occurrence.
+
+    Raises:
+        ValueError: If there is include cycle, if some referenced file is not found or if the same package
+            is pinned to different versions.
+
+    Example:
+        >>> import tempfile
+        ...
+        >>> requirements_path = Path(tempfile.mkdtemp())
+        >>> _ = (requirements_path / "base.txt").write_text("numpy>=1.20\\nPandas==1.0")
+        >>> _ = (requirements_path / "a.txt").write_text("-r base.txt\\nnumpy<2")
+        >>> _ = (requirements_path / "b.txt").write_text("-r base.txt\\npandas")
+        >>> resolve_requirements([requirements_path / "a.txt", requirements_path / "b.txt"])
+        ['numpy<2,>=1.20', 'Pandas==1.0']
+    """
+    path = Path(path)
+    visited: set[Path] = set()
+    # Requirement with path of file where it's defined
+    found: list[tuple[str, Path]] = []
+
+    def visit(file: Path, stack: list[Path]) -> None:
+        if file in stack:
+            cycle = " -> ".join(i.as_posix() for i in [*stack[stack.index(file) :], file])
+            raise ValueError(f"Requirements files include cycle: {cycle}")
+
+        if file in visited:
+            return
+
+        visited.add(file)
+        parsed = parse_requirements_file(file)
+        found.extend((i, file) for i in parsed["requirements"])
+
+        for include in parsed["includes"]:
+            for candidate in [file.parent / include, path / include, Path(include)]:
+                if candidate.exists():
+                    visit(candidate.resolve(), [*stack, file])
+                    break
+            else:
+                raise ValueError(f"Requirements file '{include}' referenced in '{file}' not found.")
 
     for file in files:
+        visit(Path(file).resolve(), [])
+
+    if not deduplicate:
+        return [i[0] for i in found]
+
+    merged: dict[tuple[str, str], dict[str, Any]] = {}
+
+    for requirement, file in found:
+        match = _REQUIREMENT_PATTERN.match(requirement)
+        assert match  # Already validated in parse_requirement
+        key = (re.sub(r"[-_.]+", "-", match.group("name")).lower(), match.group("marker") or "")
+        specifiers = [i for i in (match.group("specifiers") or "").split(",") if i]
+
+        if key not in merged:
+            merged[key] = {"name": match.group("name"), "extras": set(), "specifiers": {}, "url": None}
+        item = merged[key]
 
-        with open(file) as f:
-            requirements = f.readlines()
-        requirements = [i.strip("\r\n") for i in requirements if i.strip("\r\n")]
+        if match.group("extras"):
+            item["extras"].update(match.group("extras").split(","))
 
-        # narrow_requirements calls recursively get_requirements so it can have another -r reference
-        requirements = narrow_requirements(requirements, path)
-        requirements = [str(requirement) for requirement in pkg_resources.parse_requirements(requirements)]
-        all_requirements.extend(requirements)
+        if match.group("url"):
+            if item["url"] and item["url"][0] != match.group("url"):
+                raise ValueError(
+                    f"Conflicting requirements for '{item['name']}': '{item['url'][0]}' in "
+                    f"'{item['url'][1]}' and '{match.group('url')}' in '{file}'."
+                )
+            item["url"] = (match.group("url"), file)
 
-    return all_requirements
+        for specifier in specifiers:
+            item["specifiers"].setdefault(specifier, file)
+
+        pins = [(i, j) for i, j in item["specifiers"].items() if i.startswith("==") and "*" not in i]
+        if len(pins) > 1 or (pins and item["url"]):
+            sources = [f"'{i}' in '{j}'" for i, j in pins]
+            if item["url"]:
+                sources.append(f"'{item['url'][0]}' in '{item['url'][1]}'")
+            raise ValueError(f"Conflicting pins for '{item['name']}': {' and '.join(sources)}.")
+
+    result = []
+
+    for (_, marker), item in merged.items():
+        requirement = item["name"]
+        if item["extras"]:
+            requirement += f"[{','.join(sorted(item['extras']))}]"
+        if item["url"]:
+            requirement += f"@ {item['url'][0]}"
+        else:
+            requirement += ",".join(sorted(item["specifiers"]))
+        if marker:
+            requirement += f"; {marker}"
+        result.append(requirement)
+
+    return result
 
 
 def narrow_requirements(requirements: list[str], path: PathLike = "requirements") -> list[str]:
@@ -126,12 +408,14 @@ def narrow_requirements(requirements: list[str], path: PathLike = "requirements"
     """
     path = validate_path(path, "'narrow_requirements' failed", "Path with referenced requirements")
 
-    for i in requirements:
-        if i.startswith("-r "):
-            req_name = i[3:].strip("\r\n")
-            requirements.extend(get_requirements(req_name, path=path))
-    requirements = [i for i in requirements if not i.startswith("-r ")]
-    return requirements
+    plain = [i for i in requirements if not i.startswith("-r ")]
+    referenced = [i[3:].strip("\r\n ") for i in requirements if i.startswith("-r ")]
+
+    if not referenced:
+        return plain
+
+    referenced_files = get_requirements_files(referenced, path)
+    return [*plain, *resolve_requirements(referenced_files, path, deduplicate=False)]
 
 
 def validate_version(version: str):
@@ -328,3 +612,95 @@ personal_setup_args_preset = {
     "author_email": "malachovd@seznam.cz",
     "author": "Daniel Malachov",
 }
+
+
+def get_package_hash(setup_dir_path: None | PathLike = None) -> str:
+    """Get hash of files used for building the package (setup files and package sources).
+
+    Package sources are packages (folders with `__init__.py`) and modules in `setup_dir_path` or in its
+    `src` folder.
+
+    Args:
+        setup_dir_path (None | PathLike, optional): Folder with `setup.py` or `pyproject.toml`. If None,
+            project root is used. Defaults to None.
+
+    Returns:
+        str: Hexadecimal hash.
+    """
+    setup_dir_path = (
+        validate_path(setup_dir_path, "Getting package hash failed", "setup_dir_path")
+        if setup_dir_path
+        else PROJECT_PATHS.root
+    )
+
+    build_files = [
+        setup_dir_path / i
+        for i in ["setup.py", "setup.cfg", "pyproject.toml", "MANIFEST.in", "README.md", "README.rst"]
+    ]
+    requirements_files = get_project_files(["requirements*.txt"], root_path=setup_dir_path)
+
+    # Packages are folders with `__init__.py` directly in setup folder or in its 'src' folder
+    package_files = []
+    for folder in [setup_dir_path, setup_dir_path / "src"]:
+        if not folder.is_dir():
+            continue
+        for package_path in folder.iterdir():
+            if package_path.name not in ["tests", "docs"] and (package_path / "__init__.py").exists():
+                package_files.extend(get_project_files(root_path=package_path))
+
+    # Modules directly in setup folder (e.g. `py_modules`)
+    package_files.extend(setup_dir_path.glob("*.py"))
+
+    return get_files_hash([*build_files, *requirements_files, *package_files], root_path=setup_dir_path)
+
+
+def get_package_wheel(
+    setup_dir_path: None | PathLike = None, wheels_path: None | PathLike = None, verbose: bool = False
+) -> Path:
+    """Build wheel of the package, or return already built one if package files did not change.
+
+    Wheels are stored in folder named by hash of package files (see `get_package_hash`), so the same wheel
+    is reused until some file changes. Folders with old wheels are deleted, other content of `wheels_path`
+    is kept.
+
+    Args:
+        setup_dir_path (None | PathLike, optional): Folder with `setup.py` or `pyproject.toml`. If None,
+            project root is used. Defaults to None.
+        wheels_path (None | PathLike, optional): Where wheels are stored. If None, 'wheels' folder in
+            project cache is used. Defaults to None.
+        verbose (bool, optional): Whether print output of build. Defaults to False.
+
+    Returns:
+        Path: Path to the wheel.
+    """
+    import shutil
+
+    setup_dir_path = (
+        validate_path(setup_dir_path, "Building wheel failed", "setup_dir_path")
+        if setup_dir_path
+        else PROJECT_PATHS.root
+    )
+    wheels_path = Path(wheels_path) if wheels_path else PROJECT_PATHS.create_cache() / "wheels"
+    wheel_dir_path = wheels_path / get_package_hash(setup_dir_path)[:16]
+
+    wheels = list(wheel_dir_path.glob("*.whl"))
+
+    if not wheels:
+        if wheels_path.exists():
+            for stale_path in wheels_path.iterdir():
+                if stale_path.is_dir() and re.fullmatch(r"[0-9a-f]{16}", stale_path.name):
+                    shutil.rmtree(stale_path)
+
+        python_path = get_console_str_with_quotes(sys.executable)
+        run_command(
+            f"{python_path} -m pip wheel --no-deps --wheel-dir {get_console_str_with_quotes(wheel_dir_path)} "
+            f"{get_console_str_with_quotes(setup_dir_path)}",
+            verbose=verbose,
+            error_header="Building wheel of the package failed.",
+        )
+        wheels = list(wheel_dir_path.glob("*.whl"))
+
+    if len(wheels) != 1:
+        raise RuntimeError(f"Exactly one wheel expected in '{wheel_dir_path}', found {len(wheels)}.")
+
+    return wheels[0]
@@ -3,8 +3,10 @@ paths to be able other modules here in mypythontools_cicd with PROJECT_PATHS.
 """
 
 from mypythontools_cicd.project_paths.project_paths_internal import (
+    FileIndex,
+    glob_to_regex,
     PROJECT_PATHS,
     ProjectPaths,
 )
 
-__all__ = ["PROJECT_PATHS", "ProjectPaths"]
+__all__ = ["FileIndex", "glob_to_regex", "PROJECT_PATHS", "ProjectPaths"]
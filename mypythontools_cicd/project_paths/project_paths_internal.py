@@ -1,17 +1,364 @@
 """Module with functions for 'project_paths' subpackage."""
 
 from __future__ import annotations
-from typing import Union
+from typing import Pattern, Sequence, Union
 from pathlib import Path
+import os
+import re
 import sys
 import builtins
+import threading
 
-from mypythontools.paths import validate_path, find_path
+from mypythontools.paths import validate_path
 
 PathLike = Union[Path, str]  # Path is included in PathLike
 """Str pr pathlib Path. It can be also relative to current working directory."""
 
 
+def glob_to_regex(pattern: str, anchored: bool = False) -> Pattern[str]:
+    """Convert glob-style pattern (as used in `.gitignore`) into regex matching relative posix paths.
+
+    `*` and `?` doesn't match `/`, `**` matches any number of folders.
+
+    Args:
+        pattern (str): E.g. "docs/**/*.rst".
+        anchored (bool, optional): If False, pattern can match in any subfolder like with `rglob`.
+            Defaults to False.
+
+    Returns:
+        Pattern[str]: Compiled regex.
+
+    Example:
+        >>> bool(glob_to_regex("**/*_.py").match("package/module_.py"))
+        True
+        >>> bool(glob_to_regex("docs/*.rst", anchored=True).match("project/docs/index.rst"))
+        False
+    """
+    regex = ""
+    i = 0
+
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+        elif pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+        elif pattern[i] == "*":
+            regex += "[^/]*"
+            i += 1
+        elif pattern[i] == "?":
+            regex += "[^/]"
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2 :]:
+            end = pattern.index("]", i + 2)
+            regex += "[" + pattern[i + 1 : end].replace("!", "^", 1).replace("\\", "\\\\") + "]"
+            i = end + 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+
+    return re.compile(("" if anchored else "(?:.*/)?") + regex + "$")
+
+
+class FileIndex:
+    """Index of files and folders in project created with one walk of the folder tree.
+
+    Folders in `exclude_names`, hidden folders, virtual environments (folders with `pyvenv.cfg`) and paths
+    ignored in `.gitignore` files (inside the indexed folder) are skipped. Before every lookup, modification
+    time of indexed folders is checked and only changed folders are listed again. If some `.gitignore`
+    changes, whole index is created again.
+
+    Use it instead of `glob` or `find_path` if searching the project repeatedly.
+
+    Attributes:
+        root (Path): Indexed folder.
+
+    Example:
+        >>> index = FileIndex(PROJECT_PATHS.root)
+        >>> index.find(PROJECT_PATHS.readme.name) == PROJECT_PATHS.readme
+        True
+        >>> PROJECT_PATHS.init in index.glob("*.py")
+        True
+    """
+
+    def __init__(
+        self,
+        root: PathLike,
+        exclude_names: Sequence[str] = ("node_modules", "venv", "__pycache__"),
+        use_gitignore: bool = True,
+    ) -> None:
+        """Init the index. Folder is walked lazily on first lookup.
+
+        Args:
+            root (PathLike): Indexed folder.
+            exclude_names (Sequence[str], optional): Names of folders that are never indexed.
+                Defaults to ("node_modules", "venv", "__pycache__").
+            use_gitignore (bool, optional): Whether to skip paths ignored in `.gitignore`. Defaults to True.
+        """
+        self.root = Path(root).resolve()
+        self.exclude_names = tuple(exclude_names)
+        self.use_gitignore = use_gitignore
+        self.lock = threading.Lock()
+        # Relative posix path of folder as key and modification time, subfolders and files as value
+        self._folders: dict[str, tuple[int, list[str], list[str]]] = {}
+        # Relative posix path of folder as key and modification time and rules from its '.gitignore'
+        self._gitignores: dict[str, tuple[int, list[tuple[Pattern[str], bool, bool]]]] = {}
+        # Relative posix path and whether it's a folder sorted by depth
+        self._paths: None | list[tuple[str, bool]] = None
+
+    def refresh(self) -> None:
+        """Update index with folders changed since last call. It's called automatically in lookups."""
+        with self.lock:
+            if self._folders and not self._is_gitignore_changed():
+                for folder in list(self._folders):
+                    if folder not in self._folders:
+                        continue  # Dropped with parent in this loop
+
+                    try:
+                        modified = os.stat(self._get_path(folder)).st_mtime_ns
+                    except OSError:
+                        self._drop(folder)
+                        continue
+
+                    if modified != self._folders[folder][0]:
+                        self._scan(folder)
+
+                        if self._is_gitignore_changed():
+                            break
+                else:
+                    return
+
+            self._folders.clear()
+            self._gitignores.clear()
+            self._scan("")
+
+    def get_paths(
+        self, folder: None | PathLike = None, levels: None | int = None, folders: bool = False
+    ) -> list[Path]:
+        """Get indexed files, sorted by depth first and then by path.
+
+        Args:
+            folder (None | PathLike, optional): Return only paths in this folder. If None, root is used.
+                Defaults to None.
+            levels (None | int, optional): If 1, only paths directly in folder are returned. If None,
+                all levels are used. Defaults to None.
+            folders (bool, optional): Whether to return also folders. Defaults to False.
+
+        Returns:
+            list[Path]: Absolute paths.
+        """
+        return [self._get_path(i) for i in self._get_relative_paths(folder, levels, folders)]
+
+    def glob(self, pattern: str, folder: None | PathLike = None, levels: None | int = None) -> list[Path]:
+        """Find files and folders matching the pattern in any subfolder like `Path.rglob`.
+
+        Args:
+            pattern (str): Glob-style pattern. E.g. "*.py" or "**/*_.py".
+            folder (None | PathLike, optional): Where to search. If None, root is used. Defaults to None.
+            levels (None | int, optional): If 1, only paths directly in folder are returned. If None,
+                all levels are used. Defaults to None.
+
+        Returns:
+            list[Path]: Found paths sorted by depth.
+        """
+        regex = glob_to_regex(pattern)
+        prefix = self._get_relative_folder(folder)
+
+        return [
+            self._get_path(i)
+            for i in self._get_relative_paths(folder, levels, True)
+            if regex.match(i[len(prefix) + 1 :] if prefix else i)
+        ]
+
+    def find(
+        self,
+        name: str,
+        folder: None | PathLike = None,
+        exclude_names: Sequence[str] = ("node_modules", "build", "dist", "venv"),
+        exclude_paths: Sequence[PathLike] = (),
+        levels: int = 5,
+    ) -> Path:
+        """Find file or folder by name. The least nested one is returned. Alternative to `find_path`.
+
+        Args:
+            name (str): E.g. "app.py".
+            folder (None | PathLike, optional): Where to search. If None, root is used. Defaults to None.
+            exclude_names (Sequence[str], optional): If some of the parents has this name, path is skipped.
+                Defaults to ("node_modules", "build", "dist", "venv").
+            exclude_paths (Sequence[PathLike], optional): Paths in these folders are skipped.
+                Defaults to ().
+            levels (int, optional): Maximum depth of searched path. Defaults to 5.
+
+        Returns:
+            Path: Found path.
+
+        Raises:
+            FileNotFoundError: If file is not found.
+        """
+        excluded = [Path(i).resolve().as_posix() for i in exclude_paths]
+        prefix = self._get_relative_folder(folder)
+
+        for path in self.get_paths(folder, levels, folders=True):
+            relative_parts = path.relative_to(self.root).parts[len(Path(prefix).parts) :]
+
+            if (
+                path.name == name
+                and not any(i in exclude_names for i in relative_parts[:-1])
+                and not any(path.as_posix().startswith(i) for i in excluded)
+            ):
+                return path
+
+        raise FileNotFoundError(f"File `{name}` not found")
+
+    def _get_path(self, relative: str) -> Path:
+        return self.root / relative if relative else self.root
+
+    def _get_relative_folder(self, folder: None | PathLike) -> str:
+        if folder is None:
+            return ""
+        relative = Path(folder).resolve().relative_to(self.root).as_posix()
+        return "" if relative == "." else relative
+
+    def _get_relative_paths(self, folder: None | PathLike, levels: None | int, folders: bool) -> list[str]:
+        self.refresh()
+
+        with self.lock:
+            if self._paths is None:
+                paths = []
+                for parent, (_, subfolders, files) in self._folders.items():
+                    paths.extend((f"{parent}/{i}" if parent else i, True) for i in subfolders)
+                    paths.extend((f"{parent}/{i}" if parent else i, False) for i in files)
+                self._paths = sorted(paths, key=lambda i: (i[0].count("/"), i[0]))
+            paths = self._paths
+
+        prefix = self._get_relative_folder(folder)
+        min_depth = prefix.count("/") + 1 if prefix else 0
+
+        return [
+            path
+            for path, is_folder in paths
+            if (folders or not is_folder)
+            and (not prefix or path.startswith(prefix + "/"))
+            and (levels is None or path.count("/") - min_depth < levels)
+        ]
+
+    def _scan(self, folder: str) -> None:
+        folder_path = self._get_path(folder)
+        self._paths = None
+
+        try:
+            modified = os.stat(folder_path).st_mtime_ns
+            entries = list(os.scandir(folder_path))
+        except OSError:
+            self._drop(folder)
+            return
+
+        if self.use_gitignore:
+            self._load_gitignore(folder)
+
+        subfolders = []
+        files = []
+
+        for entry in entries:
+            relative = f"{folder}/{entry.name}" if folder else entry.name
+
+            try:
+                is_folder = entry.is_dir()
+            except OSError:
+                continue
+
+            if is_folder and (
+                entry.name in self.exclude_names
+                or entry.name.startswith(".")
+                or os.path.exists(os.path.join(entry.path, "pyvenv.cfg"))
+            ):
+                continue
+
+            if self._is_ignored(relative, is_folder):
+                continue
+
+            (subfolders if is_folder else files).append(entry.name)
+
+        old_subfolders = self._folders[folder][1] if folder in self._folders else []
+        self._folders[folder] = (modified, sorted(subfolders), sorted(files))
+
+        for i in old_subfolders:
+            if i not in subfolders:
+                self._drop(f"{folder}/{i}" if folder else i)
+
+        for i in subfolders:
+            relative = f"{folder}/{i}" if folder else i
+            if relative not in self._folders:
+                self._scan(relative)
+
+    def _drop(self, folder: str) -> None:
+        self._paths = None
+        for i in list(self._folders):
+            if i == folder or i.startswith(folder + "/") or not folder:
+                del self._folders[i]
+
+    def _load_gitignore(self, folder: str) -> None:
+        gitignore_path = self._get_path(folder) / ".gitignore"
+
+        try:
+            modified = os.stat(gitignore_path).st_mtime_ns
+            with open(gitignore_path, encoding="utf-8", errors="replace") as gitignore_file:
+                lines = gitignore_file.read().splitlines()
+        except OSError:
+            self._gitignores.pop(folder, None)
+            return
+
+        rules = []
+
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+
+            negate = line.startswith("!")
+            line = line[1:] if negate else line
+            folders_only = line.endswith("/")
+            line = line.strip("/") if folders_only else line
+            anchored = "/" in line
+            rules.append((glob_to_regex(line.lstrip("/"), anchored), negate, folders_only))
+
+        self._gitignores[folder] = (modified, rules)
+
+    def _is_gitignore_changed(self) -> bool:
+        if not self.use_gitignore:
+            return False
+
+        for folder, (modified, _) in self._gitignores.items():
+            try:
+                if os.stat(self._get_path(folder) / ".gitignore").st_mtime_ns != modified:
+                    return True
+            except OSError:
+                return True
+
+        # New .gitignore in already indexed folder
+        return any(
+            ".gitignore" in files and folder not in self._gitignores
+            for folder, (_, _, files) in self._folders.items()
+        )
+
+    def _is_ignored(self, relative: str, is_folder: bool) -> bool:
+        ignored = False
+
+        # Rules from deeper '.gitignore' files have priority, the last matching rule wins
+        for folder, (_, rules) in sorted(self._gitignores.items(), key=lambda i: i[0].count("/")):
+            if folder and not relative.startswith(folder + "/"):
+                continue
+
+            path = relative[len(folder) + 1 :] if folder else relative
+
+            for regex, negate, folders_only in rules:
+                if (is_folder or not folders_only) and regex.match(path):
+                    ignored = not negate
+
+        return ignored
+
+
 class ProjectPaths:
     """Define paths for usual python projects like root path, docs path, init path etc.
 
@@ -32,6 +379,9 @@ class ProjectPaths:
         self._tests = None
         self._docs = None
         self._readme = None
+        self._cache = None
+        self._files: None | FileIndex = None
+        self._other_files: dict[Path, FileIndex] = {}
 
     def add_root_to_sys_path(self) -> None:
         """As name suggest, add root to sys.paths on index 0."""
@@ -63,6 +413,43 @@ class ProjectPaths:
     @root.setter
     def root(self, new_path: PathLike) -> None:
         self._root = validate_path(new_path)
+        self._files = None
+
+    @property
+    def files(self) -> FileIndex:
+        """Index of files in root used for lookups, so project is not walked again and again.
+
+        Type:
+            FileIndex
+
+        Default:
+            FileIndex(root_path)
+        """
+        if not self._files:
+            self._files = FileIndex(self.root)
+
+        return self._files
+
+    def get_file_index(self, folder: PathLike) -> FileIndex:
+        """Get index usable for searching in the folder.
+
+        If folder is in root, index of root (`files`) is used, otherwise new index is created and stored.
+
+        Args:
+            folder (PathLike): Folder where files will be searched.
+
+        Returns:
+            FileIndex: Index containing the folder.
+        """
+        folder = Path(folder).resolve()
+
+        if folder == self.files.root or self.files.root in folder.parents:
+            return self.files
+
+        if folder not in self._other_files:
+            self._other_files[folder] = FileIndex(folder)
+
+        return self._other_files[folder]
 
     @property
     def init(self) -> Path:
@@ -82,11 +469,7 @@ class ProjectPaths:
                 except AttributeError:
                     pass
 
-            self._init = find_path(
-                "__init__.py",
-                self.root,
-                exclude_paths=exclude,
-            )
+            self._init = self.files.find("__init__.py", exclude_paths=exclude)
 
         return self._init
 
@@ -190,6 +573,42 @@ class ProjectPaths:
     def readme(self, new_path: PathLike) -> None:
         self._readme = validate_path(new_path)
 
+    @property
+    def cache(self) -> Path:
+        """Folder where results of previous runs (e.g. stage cache) are stored. Usually root / .cicd_cache.
+
+        Folder is not created when accessing the property. Use `create_cache` before writing into it.
+
+        Type:
+            Path
+
+        Default:
+            root_path/.cicd_cache
+        """
+        if not self._cache:
+            self._cache = self.root / ".cicd_cache"
+
+        return self._cache
+
+    @cache.setter
+    def cache(self, new_path: PathLike) -> None:
+        self._cache = validate_path(new_path)
+
+    def create_cache(self) -> Path:
+        """Create cache folder if it doesn't exist with `.gitignore` inside, so it's never committed.
+
+        Returns:
+            Path: Cache folder.
+        """
+        cache_path = self.cache
+        cache_path.mkdir(parents=True, exist_ok=True)
+
+        if not (cache_path / ".gitignore").exists():
+            with open(cache_path / ".gitignore", "w") as gitignore:
+                gitignore.write("# Created automatically by mypythontools_cicd\n*\n")
+
+        return cache_path
+
     def reset_paths(self):
         """Reset all the paths to default."""
         self._root = None
@@ -198,6 +617,9 @@ class ProjectPaths:
         self._tests = None
         self._docs = None
         self._readme = None
+        self._cache = None
+        self._files = None
+        self._other_files = {}
 
 
 PROJECT_PATHS = ProjectPaths()
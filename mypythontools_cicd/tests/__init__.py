@@ -10,18 +10,32 @@ Attributes:
 
 from mypythontools_cicd.tests.tests_internal import (
     add_readme_tests,
+    combine_coverage_data,
+    create_coverage_config,
     deactivate_test_settings,
     default_test_config,
+    get_affected_tests,
+    get_coverage_map,
+    get_junit_durations,
     run_tests,
+    set_coverage_file,
     setup_tests,
+    split_tests,
     TestConfig,
 )
 
 __all__ = [
     "add_readme_tests",
+    "combine_coverage_data",
+    "create_coverage_config",
     "deactivate_test_settings",
     "default_test_config",
+    "get_affected_tests",
+    "get_coverage_map",
+    "get_junit_durations",
     "run_tests",
+    "set_coverage_file",
     "setup_tests",
+    "split_tests",
     "TestConfig",
 ]
@@ -1,28 +1,45 @@
 """Module with functions for 'tests' subpackage."""
 
 from __future__ import annotations
-from typing import Sequence
+from typing import Callable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+import configparser
+import doctest
+import hashlib
+import json
+import os
+import platform
+import re
 import sys
+import textwrap
+import threading
+import time
 import warnings
-import doctest
+import xml.etree.ElementTree as ET
 from doctest import OutputChecker
 from pathlib import Path
 
 from typing_extensions import Literal
 
-import mylogging
 from mypythontools.paths import validate_path, PathLike, WslPath
 from mypythontools.misc import delete_files, print_progress
 from mypythontools.config import Config, MyProperty
 from mypythontools.system import (
     get_console_str_with_quotes,
-    terminal_do_command,
     check_library_is_available,
+    SHELL_AND,
 )
 
+from ..commands import Command, CommandError, run_command, run_commands
 from ..venvs import Venv, prepare_venvs
+from ..git import get_changed_files, get_head_commit
+from ..misc import DurationsDatabase
+from ..packages import get_package_wheel
 from ..project_paths import PROJECT_PATHS
 
+# Lazy import
+# import mylogging
+
 INTERNAL_TESTS_PATH = ""
 """This is only for internal use."""
 
@@ -139,6 +156,58 @@ class TestConfig(Config):
         """
         return True
 
+    @MyProperty
+    def test_impact_analysis(self) -> bool:
+        """Run only tests affected by files changed since last successful tests. Library `pytest-cov` must
+        be installed.
+
+        Type:
+            bool
+
+        Default:
+            False
+
+        On full run, coverage with test contexts is recorded in first venv and map of source files executed by
+        each test is saved in project cache. On next runs, git diff since last successful run is used to
+        select tests. Changed or new test files are run completely. If some configuration file (e.g.
+        `setup.py`, `conftest.py` or requirements) or non python file in package or in tests changes, all
+        tests are run. It's expected, that tests are run from project root. Coverage report contains only
+        run tests.
+        """
+        return False
+
+    @MyProperty
+    def record_durations(self) -> bool:
+        """Store durations of tests and virtualenvs into `durations.json` in project cache.
+
+        Type:
+            bool
+
+        Default:
+            True
+
+        Durations are parsed from junit xml report of pytest. When testing more venvs in parallel, venvs
+        that took longest on previous runs start first.
+        """
+        return True
+
+    @MyProperty
+    def coverage_virtualenvs(self) -> Literal["first", "all"] | Sequence[PathLike]:
+        """Virtualenvs where coverage is measured if `test_coverage` is on.
+
+        Type:
+            Literal["first", "all"] | Sequence[PathLike]
+
+        Default:
+            "first"
+
+        Coverage makes tests slower, so by default it's measured only in first venv. If "all" or list of
+        particular venvs (values from `virtualenvs` or `wsl_virtualenvs` with `wsl-` prefix), coverage data
+        from all these venvs are combined into one `coverage.xml`, so branches for particular python versions
+        are counted as well. Combination runs in the first of these venvs.
+        """
+        return "first"
+
     @MyProperty
     def stop_on_first_error(self) -> bool:
         """Whether stop on first error.
@@ -151,6 +220,40 @@ class TestConfig(Config):
         """
         return True
 
+    @MyProperty
+    def parallel_venvs(self) -> int:
+        """Maximum number of virtualenvs tested at the same time.
+
+        Type:
+            int
+
+        Default:
+            1
+
+        Each venv installs package, syncs requirements and runs tests in own worker. Output of each venv is
+        printed at once when venv finishes, so it's not mixed. If `stop_on_first_error` is True, venvs that
+        did not start yet are skipped and tests that are running in other venvs are killed when some venv
+        fails.
+        """
+        return 1
+
+    @MyProperty
+    def workers(self) -> int | Literal["auto"]:
+        """Number of pytest processes running at the same time in each virtualenv.
+
+        Type:
+            int | Literal["auto"]
+
+        Default:
+            1
+
+        If bigger than 1, tests are collected first and split into shards with similar duration (durations
+        from previous runs are used if `record_durations` is on). Each shard runs in own pytest process, so
+        `pytest-xdist` is not necessary. Coverage data of shards are combined afterwards. If "auto", number of
+        CPUs is used.
+        """
+        return 1
+
     @MyProperty
     def virtualenvs(self) -> Sequence[PathLike]:
         """Virtualenvs used to testing. It's used to be able to test more python versions at once.
@@ -248,12 +351,45 @@ class TestConfig(Config):
         Default:
             "auto"
 
-        First it solves import problems in tests, second, it tests `setup.py` and `pyproject.toml`. It runs
-        `pip install --upgrade --force-reinstall .`. If there is library already installed, it will be
-        reinstalled. If `auto` it will test it if `setup.py` is available in current working directory.
+        First it solves import problems in tests, second, it tests `setup.py` and `pyproject.toml`. Wheel is
+        built only once for all the venvs and it's stored in project cache, so it's built again only if
+        setup files or package files change. Venv remembers which wheel was installed, so package is
+        reinstalled only if changed. Wheels with compiled extensions are not shared, package is installed
+        from source into each venv. If `auto` it will test it if `setup.py` is available in current working
+        directory.
         """
         return "auto"
 
+    @MyProperty
+    def venv_worker(self) -> bool:
+        """Run pip and other short python commands in long living worker process of each venv.
+
+        Type:
+            bool
+
+        Default:
+            False
+
+        It saves starting of shell and interpreter with every command (installing package, syncing
+        requirements etc.). Workers are stopped at the end of pipeline. Check `VenvWorker` for details.
+        """
+        return False
+
+    @MyProperty
+    def venv_wheelhouse(self) -> bool:
+        """Sync test requirements from wheelhouse and use pip cache in project cache shared by all venvs.
+
+        Type:
+            bool
+
+        Default:
+            True
+
+        Wheels built in the first venv are reused in the next venvs with the same python version, so these
+        can be synced also without network access. Check `Venv` for details.
+        """
+        return True
+
 
 default_test_config = TestConfig()
 
@@ -278,6 +414,11 @@ def run_tests(
         By default args to quiet mode and no traceback are passed. Usually this just runs automatic tests.
         If some of them fail, it's further analyzed in some other tool in IDE.
 
+    More venvs can be tested at once with `parallel_venvs`. If `stop_on_first_error` is False, all the venvs
+    are tested and error is raised at the end.
+
+    Tests inside each venv can be split into more pytest processes with `workers`.
+
     Example:
         ``run_tests(verbosity=2)``
     """
@@ -286,6 +427,9 @@ def run_tests(
 
     print_progress("Testing", config.verbosity > 0)
 
+    # Test impact map, junit results and coverage settings are stored in cache
+    PROJECT_PATHS.create_cache()
+
     tested_path = (
         validate_path(config.tested_path, "Running tests failed", "tested_path")
         if config.tested_path
@@ -306,6 +450,8 @@ def run_tests(
     except Exception:
         pass
 
+    xml_path = tests_path / "coverage.xml"
+
     verbosity = config.verbosity
     verbose = True if verbosity == 2 else False
     inner_verbosity = 2 if verbosity == 2 else 0
@@ -325,95 +471,807 @@ def run_tests(
     if not all_venvs:
         all_venvs = [sys.prefix]
 
+    impact_map_path = PROJECT_PATHS.cache / "test_impact.json"
+    head_commit = get_head_commit() if config.test_impact_analysis else None
+    impact_map = None
+    selected_tests = None
+
+    if head_commit:
+        try:
+            with open(impact_map_path) as impact_map_file:
+                impact_map = json.load(impact_map_file)
+            changed_files = get_changed_files(impact_map["commit"])
+        except (OSError, ValueError, KeyError, RuntimeError):
+            impact_map = None
+
+        if impact_map:
+            selected_tests = get_affected_tests(impact_map["tests"], changed_files)
+
+            if selected_tests is not None:
+                if not selected_tests:
+                    if verbosity:
+                        print("\tNo tests affected by changes since last successful run")
+                    return
+
+                if verbosity:
+                    print(f"\tRunning only tests affected by changes: {', '.join(selected_tests)}")
+
     if config.prepare_test_venvs:
         if verbosity:
             print("\tPreparing test venvs")
         prepare_venvs(path=config.prepare_test_venvs_path, versions=config.prepare_test_venvs, verbosity=0)
 
-    for i, venv in enumerate(all_venvs):
+    if not config.test_coverage and not head_commit:
+        coverage_venvs = []
+    elif config.coverage_virtualenvs == "first":
+        coverage_venvs = [0]
+    elif config.coverage_virtualenvs == "all":
+        coverage_venvs = list(range(len(all_venvs)))
+    else:
+        coverage_venvs = []
+        for venv in config.coverage_virtualenvs:
+            if str(venv) not in all_venvs:
+                raise ValueError(
+                    f"Venv '{venv}' from 'coverage_virtualenvs' is not in tested venvs {all_venvs}. Use "
+                    "the same value as in 'virtualenvs' or in 'wsl_virtualenvs' with 'wsl-' prefix."
+                )
+            coverage_venvs.append(all_venvs.index(str(venv)))
+
+    # If coverage is measured in more venvs, each venv stores data into own file and data are combined at end
+    combine_coverage = len(coverage_venvs) > 1
+
+    parallel = config.parallel_venvs > 1 and len(all_venvs) > 1
+    workers = (os.cpu_count() or 1) if config.workers == "auto" else config.workers
+    print_lock = threading.Lock()
+    # Package is built in project folder, so it cannot be installed into more venvs at once
+    install_lock = threading.Lock()
+
+    def test_venv(i: int, venv: str, log: Callable[[str], None]) -> None:
         if venv.startswith("wsl-"):
             wsl = True
             venv = venv[4:]
         else:
             wsl = False
 
+        # If venvs run at the same time, output is streamed line by line with venv prefix to not mix outputs
+        def do_command(command: str, cwd: str) -> None:
+            run_command(
+                command,
+                cwd=cwd,
+                verbose=verbose,
+                error_header="Tests failed.",
+                with_wsl=wsl,
+                stream=parallel,
+                prefix=venv if parallel else None,
+                cancel_event=cancel_event,
+            )
+
         used_path = tested_path if not wsl else WslPath(tested_path).wsl_path
         tested_path_str = get_console_str_with_quotes(used_path)
 
-        my_venv = Venv(venv, with_wsl=wsl)
-
-        if verbosity:
-            print(f"\tTests with{' wsl ' if wsl else ' '}venv '{my_venv.venv_path.name}'")
-
-        complete_args = (
-            "pytest",
-            tested_path_str,
-            *extra_args,
+        my_venv = Venv(
+            venv,
+            with_wsl=wsl,
+            wheelhouse=config.venv_wheelhouse,
+            pip_cache=config.venv_wheelhouse,
+            use_worker=config.venv_worker,
         )
 
-        test_command = " ".join(complete_args)
+        if verbosity:
+            log(f"\tTests with{' wsl ' if wsl else ' '}venv '{my_venv.venv_path.name}'")
 
-        used_command = test_command
+        if not my_venv.installed:
+            raise RuntimeError(
+                f"Defined virtualenv on {my_venv.venv_path} not found. Use 'prepare_test_venvs' or install "
+                "venvs manually."
+            )
 
         # To be able to not install dev requirements in older python venv, pytest is installed.
         # Usually just respond with Requirements already satisfied.
         if INTERNAL_TESTS_PATH:
-            my_venv.install_library(".[tests]", upgrade=True, path=INTERNAL_TESTS_PATH)
+            with install_lock:
+                my_venv.install_library(".[tests]", upgrade=True, path=INTERNAL_TESTS_PATH)
 
-        used_command = f"{my_venv.activate_prefix_command} {used_command}"
+        use_coverage = i in coverage_venvs
+        venv_coverage_file = tested_path / f".coverage.venv-{i}" if combine_coverage else None
 
-        if i == 0:
-            if config.test_coverage:
-                # Add coverage only to first virtualenv
-                xml_path = f"xml:{tests_path / 'coverage.xml'}"
-                used_command = used_command + (
-                    f" --cov {get_console_str_with_quotes(PROJECT_PATHS.app)} --cov-report "
-                    f"{get_console_str_with_quotes(xml_path)}"
-                )
+        def get_path_str(path: Path) -> str:
+            return get_console_str_with_quotes(path.as_posix() if not wsl else WslPath(path).wsl_path)
 
-        if not my_venv.installed:
-            raise RuntimeError(
-                f"Defined virtualenv on {my_venv.venv_path} not found. Use 'prepare_test_venvs' or install "
-                "venvs manually."
-            )
+        def get_test_command(
+            targets: Sequence[str], junit_path: None | Path, coverage_file: None | Path = None
+        ) -> str:
+            command = " ".join(["pytest", *targets, *extra_args])
+
+            if junit_path:
+                command = f"{command} --junitxml {get_path_str(junit_path)} -o junit_family=xunit1"
+
+            if use_coverage:
+                command = f"{command} --cov {get_console_str_with_quotes(PROJECT_PATHS.app)}"
+
+                # Shards and venvs with combined coverage write only data, report is created from combined data
+                if config.test_coverage and not coverage_file:
+                    command = f"{command} --cov-report {get_console_str_with_quotes(f'xml:{xml_path}')}"
+                else:
+                    command = f"{command} --cov-report="
+
+                if head_commit:
+                    command = f"{command} --cov-context=test"
+
+            return f"{my_venv.activate_prefix_command} {set_coverage_file(command, coverage_file, wsl)}"
+
+        test_targets = (
+            [get_console_str_with_quotes(i) for i in selected_tests] if selected_tests else [tested_path_str]
+        )
+        junit_path = PROJECT_PATHS.cache / f"junit-{i}.xml" if config.record_durations else None
 
         if config.install_package == True or (
             config.install_package == "auto" and (PROJECT_PATHS.root / "setup.py").exists()
         ):
-            if verbosity:
-                print(f"\t\tInstalling package from setup.py")
-
-            terminal_do_command(
-                f"{my_venv.activate_prefix_command} pip install --upgrade --force-reinstall . ",
-                cwd=tested_path.as_posix(),
-                verbose=verbose,
-                error_header="Tests failed.",
-                with_wsl=wsl,
-            )
+            with install_lock:
+                wheel_path = get_wheel()
+
+            package_name = wheel_path.name.split("-")[0]
+            marker_path = my_venv.real_path / "tested_package.hash"
+            installed_packages = [re.sub(r"[-_.]+", "_", i).lower() for i in my_venv.get_installed_packages()]
+
+            if (
+                marker_path.exists()
+                and marker_path.read_text() == wheel_path.parent.name
+                and package_name.lower() in installed_packages
+            ):
+                if verbosity:
+                    log("\t\tPackage install skipped - not changed since last install")
+
+            else:
+                if verbosity:
+                    log("\t\tInstalling package from setup.py")
+
+                delete_files(marker_path)
+
+                # Wheel with compiled extensions may not work on other python versions, so source is used
+                if wheel_path.name.endswith("-none-any.whl"):
+                    used_wheel_path = wheel_path.as_posix() if not wsl else WslPath(wheel_path).wsl_path
+                    with my_venv.transaction(verbose=verbose, path=tested_path) as transaction:
+                        transaction.uninstall(package_name)
+                        transaction.install(used_wheel_path)
+                else:
+                    with install_lock:
+                        do_command(
+                            f"{my_venv.activate_prefix_command} pip install --upgrade --force-reinstall . ",
+                            cwd=tested_path.as_posix(),
+                        )
+
+                marker_path.write_text(wheel_path.parent.name)
 
         if config.sync_test_requirements:
             if verbosity:
-                print(f"\t\tSyncing requirements")
+                log(f"\t\tSyncing requirements")
 
             my_venv.sync_requirements(
                 config.sync_test_requirements,
-                verbosity=inner_verbosity,
+                verbosity=inner_verbosity if not parallel else 0,
                 path=config.sync_test_requirements_path,
             )
 
+        shards = []
+        use_argfile = False
+
+        if workers > 1:
+            # Verbosity and quiet flags would change the format of collected tests
+            collect_args = [i for i in extra_args if i not in ["-q", "--quiet", "-v", "--verbose", "-x"]]
+            collected = run_command(
+                f"{my_venv.activate_prefix_command} pytest {' '.join(test_targets)} --collect-only -q "
+                f"{' '.join(collect_args)}",
+                cwd=tested_path.as_posix(),
+                verbose=False,
+                error_header="Collecting tests failed.",
+                with_wsl=wsl,
+            )
+            collected_tests = []
+            for line in collected.splitlines():
+                if not line.strip():
+                    break
+                if "::" in line:
+                    collected_tests.append(line.strip())
+
+            # Node ids are passed in argument file, so command line limit (~32k chars on Windows) is not
+            # exceeded. Older pytest doesn't support it, so only whole files are used there.
+            pytest_version = my_venv.get_installed_packages().get("pytest", "0")
+            use_argfile = tuple(int(i) for i in re.findall(r"\d+", pytest_version)[:2]) >= (8, 2)
+
+            shards = split_tests(
+                collected_tests,
+                workers,
+                durations.data.get("tests"),
+                whole_files=[i for i in selected_tests if "::" not in i] if selected_tests else None,
+                split_files=use_argfile,
+            )
+
+        if len(shards) < 2:
+            if verbosity:
+                log("\t\tRunning tests")
+
+            try:
+                do_command(
+                    get_test_command(test_targets, junit_path, venv_coverage_file), cwd=tested_path.as_posix()
+                )
+            finally:
+                if junit_path:
+                    durations.update("tests", get_junit_durations(junit_path))
+                    delete_files(junit_path)
+
+            return
+
         if verbosity:
-            print("\t\tRunning tests")
+            log(f"\t\tRunning tests in {len(shards)} shards")
+
+        argfile_paths = [PROJECT_PATHS.cache / f"shard-{i}-{shard}.txt" for shard in range(len(shards))]
+
+        def get_shard_targets(shard: int) -> list[str]:
+            if not use_argfile or all("::" not in test for test in shards[shard]):
+                return [get_console_str_with_quotes(test) for test in shards[shard]]
+
+            PROJECT_PATHS.create_cache()
+            argfile_paths[shard].write_text("\n".join(shards[shard]))
+            argfile_path = argfile_paths[shard]
+            return [
+                get_console_str_with_quotes(
+                    f"@{argfile_path.as_posix() if not wsl else WslPath(argfile_path).wsl_path}"
+                )
+            ]
+
+        shard_commands = [
+            Command(
+                get_test_command(
+                    get_shard_targets(shard),
+                    PROJECT_PATHS.cache / f"junit-{i}-{shard}.xml" if junit_path else None,
+                    tested_path / f".coverage.shard-{i}-{shard}" if use_coverage else None,
+                ),
+                cwd=tested_path.as_posix(),
+                prefix=f"{venv} - shard {shard}",
+                with_wsl=wsl,
+                error_header=f"Tests failed in shard {shard}.",
+                cancel_event=cancel_event,
+            )
+            for shard in range(len(shards))
+        ]
+
+        try:
+            run_commands(shard_commands, verbose=verbose)
+        except CommandError:
+            delete_files([tested_path / f".coverage.shard-{i}-{shard}" for shard in range(len(shards))])
+            raise
+        finally:
+            delete_files(argfile_paths)
+
+            if junit_path:
+                for shard in range(len(shards)):
+                    shard_junit_path = PROJECT_PATHS.cache / f"junit-{i}-{shard}.xml"
+                    durations.update("tests", get_junit_durations(shard_junit_path))
+                    delete_files(shard_junit_path)
+
+        if use_coverage:
+            coverage_files = " ".join(
+                get_path_str(tested_path / f".coverage.shard-{i}-{shard}") for shard in range(len(shards))
+            )
+            do_command(
+                f"{my_venv.activate_prefix_command} "
+                f"{set_coverage_file(f'coverage combine {coverage_files}', venv_coverage_file, wsl)}",
+                cwd=tested_path.as_posix(),
+            )
+
+            if config.test_coverage and not combine_coverage:
+                do_command(
+                    f"{my_venv.activate_prefix_command} coverage xml -o {get_path_str(xml_path)}",
+                    cwd=tested_path.as_posix(),
+                )
+
+    wheel: list[Path] = []
+
+    def get_wheel() -> Path:
+        # Built only once for all the venvs
+        if not wheel:
+            wheel.append(get_package_wheel(tested_path, verbose=verbose and not parallel))
+        return wheel[0]
+
+    durations = DurationsDatabase()
+    stop = threading.Event()
+    # Running tests are killed when other venv fails
+    cancel_event = stop if config.stop_on_first_error else None
+
+    def run_venv(i: int, venv: str) -> bool:
+        # Venvs that did not start yet are not tested if some venv already failed
+        if stop.is_set():
+            return False
+
+        venv_output = []
+        start = time.perf_counter()
+
+        try:
+            test_venv(i, venv, venv_output.append if parallel else print)
+            durations.update("venvs", {venv: time.perf_counter() - start})
+        except Exception as err:
+            # Killed because other venv failed
+            if isinstance(err, CommandError) and err.result and err.result.cancelled:
+                venv_output.append(f"\t\tTests with venv '{venv}' cancelled")
+                return False
+            if config.stop_on_first_error:
+                stop.set()
+            venv_output.append(f"\t\tTests with venv '{venv}' failed")
+            raise
+        finally:
+            with print_lock:
+                if verbosity and venv_output:
+                    print("\n".join(venv_output))
+
+        return True
+
+    # Longest venvs start first, so all workers finish at similar time
+    scheduled_venvs = durations.sort_longest_first("venvs", all_venvs) if parallel else all_venvs
 
-        terminal_do_command(
-            used_command,
+    with ThreadPoolExecutor(max_workers=config.parallel_venvs if parallel else 1) as executor:
+        futures = {executor.submit(run_venv, all_venvs.index(venv), venv): venv for venv in scheduled_venvs}
+
+    if config.record_durations:
+        durations.save()
+
+    failed = {venv: future.exception() for future, venv in futures.items() if future.exception()}
+
+    if parallel and verbosity:
+        summary = []
+        for future, venv in futures.items():
+            result = "failed" if venv in failed else "passed" if future.result() else "cancelled"
+            summary.append(f"\t\t{venv}: {result}")
+        print("\tSummary\n" + "\n".join(summary))
+
+    if failed and combine_coverage:
+        delete_files([tested_path / f".coverage.venv-{i}" for i in coverage_venvs])
+
+    if len(failed) == 1:
+        raise list(failed.values())[0]
+    elif failed:
+        raise RuntimeError(f"Tests failed in virtualenvs {list(failed)}.") from list(failed.values())[0]
+
+    if combine_coverage:
+        combine_coverage_data(
+            [tested_path / f".coverage.venv-{i}" for i in coverage_venvs],
+            all_venvs[coverage_venvs[0]],
+            tested_path,
+            xml_path if config.test_coverage else None,
+            map_wsl_paths=len({all_venvs[i].startswith("wsl-") for i in coverage_venvs}) > 1,
+            verbose=verbose,
+        )
+
+    if head_commit:
+        coverage_map = get_coverage_map(tested_path / ".coverage")
+
+        if impact_map and selected_tests is not None:
+            # Tests from re-run files are replaced, so removed tests are not kept in map
+            rerun_files = {i.split("::")[0] for i in selected_tests if "::" not in i}
+            coverage_map = {
+                **{
+                    test: files
+                    for test, files in impact_map["tests"].items()
+                    if test.split("::")[0] not in rerun_files
+                },
+                **coverage_map,
+            }
+
+        with open(impact_map_path, "w") as impact_map_file:
+            json.dump({"commit": head_commit, "tests": coverage_map}, impact_map_file, indent=2)
+
+    if config.test_coverage or head_commit:
+        delete_files(tested_path / ".coverage")
+
+
+def set_coverage_file(command: str, coverage_file: None | Path, wsl: bool = False) -> str:
+    """Add setting of `COVERAGE_FILE` environment variable to command, so coverage data are stored in
+    defined file.
+
+    Args:
+        command (str): Command like `pytest --cov`.
+        coverage_file (None | Path): Path to coverage data file. If None, command is returned unchanged.
+        wsl (bool, optional): Whether command runs in wsl. Defaults to False.
+
+    Returns:
+        str: Command that can be used in terminal.
+    """
+    if not coverage_file:
+        return command
+
+    if platform.system() == "Windows" and not wsl:
+        return f'set "COVERAGE_FILE={coverage_file.as_posix()}" {SHELL_AND} {command}'
+
+    path = coverage_file.as_posix() if not wsl else WslPath(coverage_file).wsl_path
+    return f"COVERAGE_FILE={get_console_str_with_quotes(path)} {command}"
+
+
+def combine_coverage_data(
+    coverage_files: Sequence[PathLike],
+    venv: str,
+    tested_path: PathLike,
+    xml_path: None | PathLike = None,
+    map_wsl_paths: bool = False,
+    verbose: bool = False,
+) -> None:
+    """Combine coverage data files from more venvs into `.coverage` in tested path and create xml report.
+
+    Combined files are deleted.
+
+    Args:
+        coverage_files (Sequence[PathLike]): Coverage data files.
+        venv (str): Venv where `coverage` is installed. Use `wsl-` prefix for wsl venv.
+        tested_path (PathLike): Folder where tests run.
+        xml_path (None | PathLike, optional): If defined, xml report is created. Defaults to None.
+        map_wsl_paths (bool, optional): Use if some data comes from wsl venvs and some not. Windows and wsl
+            paths are mapped, so the same source files are merged. Defaults to False.
+        verbose (bool, optional): Whether print output of commands. Defaults to False.
+    """
+    wsl = venv.startswith("wsl-")
+    my_venv = Venv(venv[4:] if wsl else venv, with_wsl=wsl)
+    tested_path = Path(tested_path)
+
+    def get_path_str(path: PathLike) -> str:
+        path = Path(path)
+        return get_console_str_with_quotes(path.as_posix() if not wsl else WslPath(path).wsl_path)
+
+    rc_arg = ""
+
+    if map_wsl_paths:
+        # Data from wsl venvs contain wsl paths like /mnt/c/... First path is used in the result
+        paths = [PROJECT_PATHS.root.as_posix(), WslPath(PROJECT_PATHS.root).wsl_path]
+        rc_path = create_coverage_config(tested_path, paths[::-1] if wsl else paths)
+        rc_arg = f" --rcfile {get_path_str(rc_path)}"
+
+    existing_files = " ".join(get_path_str(i) for i in coverage_files if Path(i).exists())
+
+    run_command(
+        f"{my_venv.activate_prefix_command} coverage combine{rc_arg} {existing_files}",
+        cwd=tested_path.as_posix(),
+        verbose=verbose,
+        error_header="Combining coverage data failed.",
+        with_wsl=wsl,
+    )
+
+    if xml_path:
+        run_command(
+            f"{my_venv.activate_prefix_command} coverage xml{rc_arg} -o {get_path_str(xml_path)}",
             cwd=tested_path.as_posix(),
             verbose=verbose,
-            error_header="Tests failed.",
+            error_header="Creating coverage report failed.",
             with_wsl=wsl,
         )
 
-    if config.test_coverage:
-        delete_files(".coverage")
+
+def create_coverage_config(tested_path: PathLike, source_paths: Sequence[str]) -> Path:
+    """Create copy of coverage configuration of the project in project cache with paths that are merged
+    when combining coverage data.
+
+    Config file used with ``--rcfile`` replaces the project configuration, so project settings (e.g. `omit`)
+    are copied. Configuration is searched in the same files as coverage does (`.coveragerc`, `setup.cfg`,
+    `tox.ini` and `pyproject.toml`).
+
+    Args:
+        tested_path (PathLike): Folder where coverage runs, where config files are searched.
+        source_paths (Sequence[str]): Equivalent source paths. Data are stored with the first one.
+
+    Returns:
+        Path: Path to config file that can be used with ``--rcfile``.
+    """
+    tested_path = Path(tested_path)
+    cache_path = PROJECT_PATHS.create_cache()
+    # Name of entry in [paths] section doesn't matter, it has to be just unique
+    entry_name = "mypythontools_cicd_source"
+
+    for name, prefix in [(".coveragerc", ""), ("setup.cfg", "coverage:"), ("tox.ini", "coverage:")]:
+        if not (tested_path / name).exists():
+            continue
+
+        project_config = configparser.ConfigParser(interpolation=None)
+        try:
+            project_config.read(tested_path / name, encoding="utf-8")
+        except configparser.Error:
+            continue
+
+        # Coverage sections only, other tools can have options coverage doesn't know
+        sections = [i for i in project_config.sections() if i.startswith(prefix)]
+        if not sections and prefix:
+            continue
+
+        config = configparser.ConfigParser(interpolation=None)
+        for section in sections:
+            config[section] = dict(project_config[section])
+
+        if not config.has_section(f"{prefix}paths"):
+            config.add_section(f"{prefix}paths")
+        config.set(f"{prefix}paths", entry_name, "\n" + "\n".join(source_paths))
+
+        config_path = cache_path / "coveragerc_paths"
+        with open(config_path, "w") as config_file:
+            config.write(config_file)
+
+        return config_path
+
+    pyproject_path = tested_path / "pyproject.toml"
+    pyproject = pyproject_path.read_text(encoding="utf-8") if pyproject_path.exists() else ""
+
+    if re.search(r"^\[tool\.coverage(\.|])", pyproject, flags=re.MULTILINE):
+        # Json list of strings is valid toml array
+        entry = f"{entry_name} = {json.dumps(list(source_paths))}"
+        paths_header = re.search(r"^\[tool\.coverage\.paths\][^\n]*$", pyproject, flags=re.MULTILINE)
+
+        if paths_header:
+            pyproject = f"{pyproject[:paths_header.end()]}\n{entry}{pyproject[paths_header.end():]}"
+        else:
+            pyproject = f"{pyproject}\n\n[tool.coverage.paths]\n{entry}\n"
+
+        config_path = cache_path / "coveragerc_paths.toml"
+        config_path.write_text(pyproject, encoding="utf-8")
+        return config_path
+
+    config_path = cache_path / "coveragerc_paths"
+    config_path.write_text(f"[paths]\n{entry_name} =\n" + "".join(f"    {i}\n" for i in source_paths))
+    return config_path
+
+
+def split_tests(
+    tests: Sequence[str],
+    shards_count: int,
+    durations: None | dict[str, float] = None,
+    whole_files: None | Sequence[str] = None,
+    split_files: bool = True,
+) -> list[list[str]]:
+    """Split tests into shards with similar duration. Longest first algorithm is used.
+
+    Whole test files are used if possible, so commands are short. Only files that takes more than average shard
+    duration are split to particular tests (if `split_files` is True).
+
+    Args:
+        tests (Sequence[str]): Test node ids, e.g. "tests/test_file.py::test_function".
+        shards_count (int): Maximum number of shards. It can be less if there is not enough tests.
+        durations (None | dict[str, float], optional): Durations of tests from previous runs. Unknown tests
+            have average duration. Defaults to None.
+        whole_files (None | Sequence[str], optional): Files that can be used as a whole. Use if not all tests
+            from file are in `tests`. If None, all files can be used. Defaults to None.
+        split_files (bool, optional): Whether tests from long files can be split into more shards. If False,
+            shards contain node ids only for files not in `whole_files`. Defaults to True.
+
+    Returns:
+        list[list[str]]: List of shards where shard is list of test files or test node ids.
+
+    Example:
+        >>> tests = ["tests/test_1.py::test_a", "tests/test_1.py::test_b", "tests/test_2.py::test_c"]
+        >>> durations = {"tests/test_1.py::test_a": 4, "tests/test_1.py::test_b": 4}
+        >>> split_tests(tests, 2, durations)
+        [['tests/test_1.py::test_a', 'tests/test_2.py'], ['tests/test_1.py::test_b']]
+        >>> split_tests(tests, 2, whole_files=["tests/test_2.py"])
+        [['tests/test_1.py::test_a', 'tests/test_2.py'], ['tests/test_1.py::test_b']]
+        >>> split_tests(tests, 2, durations, split_files=False)
+        [['tests/test_1.py'], ['tests/test_2.py']]
+    """
+    durations = durations or {}
+    known = [durations[test] for test in tests if test in durations]
+    default_duration = sum(known) / len(known) if known else 1.0
+
+    def get_duration(test: str) -> float:
+        return durations.get(test, default_duration)  # type: ignore
+
+    files: dict[str, list[str]] = {}
+    for test in tests:
+        files.setdefault(test.split("::")[0], []).append(test)
+
+    shard_limit = sum(get_duration(test) for test in tests) / max(shards_count, 1)
+    jobs: list[tuple[float, list[str]]] = []
+
+    for file, file_tests in files.items():
+        file_duration = sum(get_duration(test) for test in file_tests)
+
+        if (whole_files is None or file in whole_files) and (
+            file_duration <= shard_limit or len(file_tests) == 1 or not split_files
+        ):
+            jobs.append((file_duration, [file]))
+        else:
+            jobs.extend((get_duration(test), [test]) for test in file_tests)
+
+    shards: list[tuple[list[float], list[str]]] = [([0.0], []) for _ in range(min(shards_count, len(jobs)))]
+
+    for duration, items in sorted(jobs, key=lambda job: -job[0]):
+        shard = min(shards, key=lambda shard: shard[0][0])
+        shard[0][0] += duration
+        shard[1].extend(items)
+
+    return [items for _, items in shards if items]
+
+
+def get_junit_durations(junit_path: PathLike) -> dict[str, float]:
+    """Get durations of tests from junit xml file created by pytest with `-o junit_family=xunit1`.
+
+    Args:
+        junit_path (PathLike): Path to junit xml file.
+
+    Returns:
+        dict[str, float]: Test node id as key (e.g. "tests/test_file.py::test_function") and duration in
+        seconds as value. If file doesn't exist, empty dict is returned.
+    """
+    try:
+        tree = ET.parse(Path(junit_path).as_posix())
+    except (OSError, ET.ParseError):
+        return {}
+
+    durations = {}
+
+    for test_case in tree.iter("testcase"):
+        file = test_case.get("file")
+        class_name = test_case.get("classname", "")
+        name = test_case.get("name")
+
+        if not file or not name:
+            continue
+
+        # Class name contains module path and test classes, e.g. 'tests.test_file.TestClass'
+        module = file[:-3].replace("/", ".") if file.endswith(".py") else file
+        classes = class_name[len(module) + 1 :] if class_name.startswith(module + ".") else ""
+        node_id = "::".join([file, *([i for i in classes.split(".") if i]), name])
+
+        durations[node_id] = durations.get(node_id, 0) + float(test_case.get("time", 0))
+
+    return durations
+
+
+def get_coverage_map(coverage_file: PathLike, root_path: None | PathLike = None) -> dict[str, list[str]]:
+    """Get source files executed by each test from coverage data file recorded with `--cov-context=test`.
+
+    Args:
+        coverage_file (PathLike): Path to coverage data file. Usually `.coverage`.
+        root_path (None | PathLike, optional): Files are returned relatively to this path. Files outside
+            are ignored. If None, project root is used. Defaults to None.
+
+    Returns:
+        dict[str, list[str]]: Test node id as key and list of source files as posix paths as value. If file
+        doesn't exist, empty dict is returned.
+    """
+    import sqlite3
+
+    coverage_file = Path(coverage_file)
+    root_path = Path(root_path).resolve() if root_path else PROJECT_PATHS.root
+
+    if not coverage_file.exists():
+        return {}
+
+    connection = sqlite3.connect(coverage_file.as_posix())
+
+    try:
+        tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        # Line coverage is in 'line_bits', branch coverage in 'arc'
+        rows = [
+            row
+            for table in ("line_bits", "arc")
+            if table in tables
+            for row in connection.execute(
+                f"SELECT DISTINCT file.path, context.context FROM {table} "
+                f"JOIN file ON file.id = {table}.file_id JOIN context ON context.id = {table}.context_id"
+            )
+        ]
+    finally:
+        connection.close()
+
+    coverage_map: dict[str, set[str]] = {}
+
+    for file, context in rows:
+        # Context is like 'tests/test_file.py::test_function|run'
+        test = context.rsplit("|", 1)[0]
+
+        # Empty context is code executed during collection
+        if not test:
+            continue
+
+        try:
+            relative_file = Path(file).resolve().relative_to(root_path).as_posix()
+        except ValueError:
+            continue
+
+        coverage_map.setdefault(test, set()).add(relative_file)
+
+    return {test: sorted(files) for test, files in coverage_map.items()}
+
+
+def get_affected_tests(
+    coverage_map: dict[str, list[str]], changed_files: Sequence[PathLike], root_path: None | PathLike = None
+) -> None | list[str]:
+    """Select tests that can be affected by changed files.
+
+    Args:
+        coverage_map (dict[str, list[str]]): Source files executed by each test. Output of
+            `get_coverage_map`.
+        changed_files (Sequence[PathLike]): Changed files, e.g. from `git.get_changed_files`.
+        root_path (None | PathLike, optional): Root path of the project, where pytest runs. If None, project
+            root is used. Defaults to None.
+
+    Returns:
+        None | list[str]: Test files and test node ids relative to root. Whole test file is used if all of its
+        tests are affected. None if all the tests has to be run, e.g. if changed source file in package is
+        not executed by any test (new module or module used only on import).
+
+    Example:
+        >>> coverage_map = {"tests/test_a.py::test_1": ["pkg/a.py"], "tests/test_b.py::test_2": ["pkg/b.py"]}
+        >>> root = PROJECT_PATHS.root
+        >>> get_affected_tests(coverage_map, [root / "pkg" / "b.py"], root)
+        ['tests/test_b.py']
+        >>> get_affected_tests(coverage_map, [root / "setup.py"], root) is None
+        True
+        >>> get_affected_tests(coverage_map, [PROJECT_PATHS.app / "new_module.py"], root) is None
+        True
+    """
+    root_path = Path(root_path).resolve() if root_path else PROJECT_PATHS.root
+
+    def get_relative_folder(folder: Path) -> None | str:
+        try:
+            return folder.relative_to(root_path).as_posix()
+        except ValueError:
+            return None
+
+    app_path = get_relative_folder(PROJECT_PATHS.app)
+    tests_path = get_relative_folder(PROJECT_PATHS.tests)
+    config_files = [
+        "setup.py",
+        "setup.cfg",
+        "pyproject.toml",
+        "conftest.py",
+        "pytest.ini",
+        "tox.ini",
+        ".coveragerc",
+    ]
+
+    test_files = {test.split("::")[0] for test in coverage_map}
+    covered_files = {file for files in coverage_map.values() for file in files}
+    selected_files = set()
+    selected_tests = set()
+
+    for file in changed_files:
+        try:
+            relative = Path(file).resolve().relative_to(root_path)
+        except ValueError:
+            continue
+
+        name = relative.as_posix()
+
+        if relative.name in config_files or relative.name.startswith("requirements"):
+            return None
+
+        if relative.suffix != ".py":
+            if any(folder and (name + "/").startswith(folder + "/") for folder in (app_path, tests_path)):
+                return None
+            continue
+
+        is_test_file = relative.name.startswith("test_") or relative.name.endswith("_test.py")
+
+        if is_test_file or name in test_files:
+            if (root_path / relative).exists():
+                selected_files.add(name)
+        elif tests_path and name.startswith(tests_path + "/"):
+            # Helper module imported from tests, these are not in coverage
+            return None
+        elif app_path and name.startswith(app_path + "/") and name not in covered_files:
+            # Lines executed only on import are not in coverage of any test
+            return None
+
+        selected_tests.update(test for test, files in coverage_map.items() if name in files)
+
+    result = set(selected_files)
+
+    for test in selected_tests:
+        test_file = test.split("::")[0]
+
+        if test_file in result:
+            continue
+
+        if all(i in selected_tests for i in coverage_map if i.split("::")[0] == test_file):
+            result.add(test_file)
+        else:
+            result.add(test)
+
+    return sorted(result)
 
 
 def setup_tests(
@@ -445,6 +1303,8 @@ def setup_tests(
     """
     doctest.OutputChecker = CustomOutputChecker
 
+    import mylogging
+
     mylogging.config.colorize = False
 
     PROJECT_PATHS.add_root_to_sys_path()
@@ -478,7 +1338,9 @@ def setup_tests(
 def add_readme_tests(readme_path: None | PathLike = None, tests_folder_path: None | PathLike = None) -> None:
     """Generate pytest tests script file from README.md and save it to tests folder.
 
-    Can be called from conftest.
+    Can be called from conftest. File is named by hash of readme content, so it's generated again only if
+    readme content changes (not if just modified time changes e.g. on git checkout). Generating is done
+    in-process, no subprocess is started.
 
     Args:
         readme_path (None | PathLike, optional): If None, autodetected (README.md, Readme.md or readme.md
@@ -501,9 +1363,14 @@ def add_readme_tests(readme_path: None | PathLike = None, tests_folder_path: Non
             import numpy
             ```
 
+        If block is followed by block without syntax defined, it's expected output that is compared with
+        printed output. Blocks with python interactive session (lines starting with ``>>>``) are tested with
+        doctest (``--doctest-modules`` has to be used).
+
         If you want to import modules and use some global variables, add ``<!--phmdoctest-setup-->`` directive
-        before block with setup code.
-        If you want to skip some test, add ``<!--phmdoctest-mark.skip-->``
+        before block with setup code. Code after ``<!--phmdoctest-teardown-->`` runs after all the tests.
+        If you want to skip some test, add ``<!--phmdoctest-mark.skip-->``. Block after
+        ``<!--phmdoctest-skip-->`` is not used at all.
     """
     readme_path = (
         validate_path(readme_path, "'add_readme_tests' failed", "README")
@@ -516,8 +1383,11 @@ def add_readme_tests(readme_path: None | PathLike = None, tests_folder_path: Non
         else PROJECT_PATHS.tests
     )
 
-    readme_date_modified = str(readme_path.stat().st_mtime).split(".", maxsplit=1)[0]  # Keep only seconds
-    readme_tests_name = f"test_readme_generated-{readme_date_modified}.py"
+    with open(readme_path, encoding="utf-8") as readme_file:
+        readme = readme_file.read()
+
+    readme_hash = hashlib.sha256(readme.encode("utf-8")).hexdigest()[:10]
+    readme_tests_name = f"test_readme_generated-{readme_hash}.py"
 
     test_file_path = tests_folder_path / readme_tests_name
 
@@ -529,13 +1399,143 @@ def add_readme_tests(readme_path: None | PathLike = None, tests_folder_path: Non
         if i.name.startswith("test_readme_generated"):
             i.unlink()
 
-    python_path = get_console_str_with_quotes(sys.executable)
-    readme = get_console_str_with_quotes(readme_path)
-    output = get_console_str_with_quotes(test_file_path)
+    with open(test_file_path, "w", encoding="utf-8") as test_file:
+        test_file.write(get_readme_tests_code(readme, readme_path.name))
+
+
+def get_readme_tests_code(readme: str, readme_name: str = "README.md") -> str:
+    """Create content of pytest file from markdown.
+
+    Format of created tests is compatible with `phmdoctest`, but generated code doesn't need any library.
+    Generated code is formatted as black would format it (if code in readme is formatted).
+
+    Args:
+        readme (str): Content of markdown file.
+        readme_name (str, optional): Name used in docstring of created module. Defaults to "README.md".
+
+    Returns:
+        str: Python code with tests.
+
+    Example:
+        >>> readme = ["<!--phmdoctest-setup-->", "```python", "a = 1", "```", "```python", "print(a)", "```"]
+        >>> readme.extend(["Output", "```", "1", "```"])
+        >>> code = get_readme_tests_code("\\n".join(readme))
+        >>> print(code[code.index("# setup") :])
+        # setup code line 3.
+        a = 1
+        <BLANKLINE>
+        <BLANKLINE>
+        def test_code_6_output_10(capsys):
+            print(a)
+        <BLANKLINE>
+            assert capsys.readouterr().out == "1\\n"
+        <BLANKLINE>
+    """
+    blocks = []
+    fence = None
+    directives: list[str] = []
+
+    for line_number, line in enumerate(readme.splitlines(), start=1):
+        stripped = line.strip()
+
+        if fence is None:
+            fence_match = re.match(r"^(`{3,}|~{3,})\s*([^`\s]*)", stripped)
+            if fence_match:
+                fence = fence_match.group(1)
+                blocks.append(
+                    {
+                        "info": fence_match.group(2).lower(),
+                        "line": line_number + 1,
+                        "lines": [],
+                        "directives": directives,
+                    }
+                )
+                directives = []
+            else:
+                directives.extend(re.findall(r"<!--\s*phmdoctest-([\w.-]+?)\s*-->", stripped))
+
+        elif stripped.startswith(fence) and not stripped.strip(fence[0]):
+            fence = None
+        else:
+            blocks[-1]["lines"].append(line)
+
+    setup = []
+    teardown = []
+    tests = []
+    session_number = 0
+
+    for index, block in enumerate(blocks):
+        code = "\n".join(block["lines"]).strip("\n")
+        is_session = block["info"] == "pycon" or (
+            block["info"] in ["python", "py", "py3", "python3"] and code.lstrip().startswith(">>>")
+        )
+
+        if "skip" in block["directives"] or not code.strip():
+            continue
+
+        if is_session:
+            session_number += 1
+            session = textwrap.indent(textwrap.dedent(code), "    ")
+            tests.append(
+                f"def session_{session_number:05}_line_{block['line']}():\n    r\"\"\"\n{session}\n    \"\"\"\n"
+            )
+            continue
+
+        if block["info"] not in ["python", "py", "py3", "python3"]:
+            continue
+
+        if "setup" in block["directives"]:
+            setup.append(f"# setup code line {block['line']}.\n{code}\n")
+            continue
+
+        if "teardown" in block["directives"]:
+            teardown.append(code)
+            continue
+
+        decorator = "@pytest.mark.skip()\n" if "mark.skip" in block["directives"] else ""
+        body = textwrap.indent(code, "    ")
+        next_block = blocks[index + 1] if index + 1 < len(blocks) else None
+
+        if next_block and not next_block["info"] and "skip" not in next_block["directives"]:
+            expected = _get_string_literal("".join(f"{i}\n" for i in next_block["lines"]))
+            assertion = f"    assert capsys.readouterr().out == {expected}"
+            # Black doesn't split strings, it only wraps them in parentheses
+            if len(assertion) > 110:
+                assertion = f"    assert capsys.readouterr().out == (\n        {expected}\n    )"
+            tests.append(
+                f"{decorator}def test_code_{block['line']}_output_{next_block['line']}(capsys):\n{body}\n\n"
+                f"{assertion}\n"
+            )
+        else:
+            tests.append(f"{decorator}def test_code_{block['line']}():\n{body}\n")
 
-    generate_readme_test_command = f"{python_path} -m phmdoctest {readme} --outfile {output}"
+    header = f'"""pytest file built from {readme_name}"""\n'
+    if any(i.startswith("@pytest") for i in tests):
+        header = f"{header}\nimport pytest\n"
 
-    terminal_do_command(generate_readme_test_command, error_header="Readme test creation failed")
+    # Setup code is separated from header with one blank line as after imports
+    parts = ["\n".join([header, *setup])]
+
+    if teardown:
+        parts.append(f"def teardown_module():\n{textwrap.indent(chr(10).join(teardown), '    ')}\n")
+
+    if not tests:
+        tests.append(
+            'def test_nothing_passes():\n    """Succeed if no Python code blocks were processed."""\n'
+        )
+
+    return "\n\n".join([*parts, *tests])
+
+
+def _get_string_literal(text: str) -> str:
+    """Get string literal with double quotes if possible as black would format it."""
+    literal = repr(text)
+
+    # If single quotes are used, there is no quote in text
+    if literal.startswith("'") and '"' not in text:
+        literal = f'"{literal[1:-1]}"'
+
+    return literal
 
 
 def deactivate_test_settings() -> None:
@@ -544,6 +1544,8 @@ def deactivate_test_settings() -> None:
     Sometimes you want to run test just in normal mode (enable plots etc.). Usually at the end of
     test file in ``if __name__ = "__main__":`` block.
     """
+    import mylogging
+
     mylogging.config.colorize = True
 
     if "matplotlib" in sys.modules:
@@ -1,6 +1,20 @@
 """Module that will help with virtual environments so it's possible to work with venv from python.
 You can create, delete or update dependencies."""
 
-from mypythontools_cicd.venvs.venvs_internal import Venv, is_venv, prepare_venvs
+from mypythontools_cicd.venvs.venvs_internal import (
+    PipTransaction,
+    Venv,
+    VenvWorker,
+    is_venv,
+    prepare_venvs,
+    shutdown_workers,
+)
 
-__all__ = ["Venv", "is_venv", "prepare_venvs"]
+__all__ = [
+    "PipTransaction",
+    "Venv",
+    "VenvWorker",
+    "is_venv",
+    "prepare_venvs",
+    "shutdown_workers",
+]
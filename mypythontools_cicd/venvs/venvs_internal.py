@@ -1,9 +1,22 @@
 """Module with functions for 'venvs' subpackage."""
 
 from __future__ import annotations
-from typing import Sequence
+from typing import Any, Sequence
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import atexit
+import hashlib
+import itertools
+import json
+import os
 import platform
+import re
+import select
 import shutil
+import signal
+import subprocess
+import threading
+import time
 from pathlib import Path
 import sys
 
@@ -14,11 +27,11 @@ from mypythontools.misc import print_progress
 from mypythontools.system import (
     check_script_is_available,
     get_console_str_with_quotes,
-    terminal_do_command,
     SHELL_AND,
     is_wsl,
 )
 
+from ..commands import Command, CommandError, CommandResult, process_result, record_command, run_command
 from ..project_paths import PROJECT_PATHS
 from ..packages import get_requirements
 from mypythontools_cicd.project_paths import PROJECT_PATHS
@@ -33,9 +46,21 @@ class VenvNotFound(RuntimeError):
 class Venv:
     """You can create new venv or sync it's dependencies.
 
+    If `wheelhouse` is used, libraries are installed from project wheelhouse (folder with built wheels in
+    project cache) without using package index if possible. Missing wheels are downloaded or built into
+    wheelhouse first, so next venvs with the same python version can be synced offline.
+
     Attributes:
         venv_path (Path): Path of venv. E.g. `venv`
         with_wsl (bool, optional): If working with linux venv from linux.
+        wheelhouse (bool | PathLike): Folder with wheels. If True, `wheelhouse` in project cache is used.
+            If False, wheelhouse is not used and libraries are installed from package index.
+        pip_cache (bool | PathLike): Pip cache folder used in all pip commands. If True, `pip` in project
+            cache is used. If False, default pip cache is used.
+        use_worker (bool): Whether run pip and other python modules in `VenvWorker` instead of new shell.
+            It saves shell and interpreter startup, which is useful if running many short commands. Worker
+            needs `os.fork`, so it's POSIX only. On windows and for wsl venvs used from windows, commands
+            run in subprocess as if `use_worker` was False.
 
     Example:
         >>> from pathlib import Path
@@ -61,6 +86,11 @@ class Venv:
         >>> "colorama==0.4.4" in venv.list_packages()
         True
 
+        Installed packages are read from metadata on disk, so it's fast
+
+        >>> venv.get_installed_packages()["colorama"]
+        '0.4.4'
+
         You can use this venv from different venv with subprocess
 
         >>> result = subprocess.run(f"{venv.activate_prefix_command} pip list", capture_output=True, shell=True).stdout
@@ -74,12 +104,26 @@ class Venv:
         False
     """
 
-    def __init__(self, venv_path: PathLike, with_wsl: bool = False) -> None:
+    def __init__(
+        self,
+        venv_path: PathLike,
+        with_wsl: bool = False,
+        wheelhouse: bool | PathLike = False,
+        pip_cache: bool | PathLike = False,
+        use_worker: bool = False,
+    ) -> None:
         """Init the venv class. To create or update it, you can call extra functions.
 
         Args:
             venv_path(PathLike): Path of venv. E.g. `venv`
             with_wsl(bool, optional): If working with linux venv from linux.
+            wheelhouse(bool | PathLike, optional): Folder with built wheels used for installing libraries.
+                If True, `wheelhouse` in project cache is used. If False, not used. Defaults to False.
+            pip_cache(bool | PathLike, optional): Pip cache folder shared by all the venvs. If True, `pip`
+                in project cache is used. If False, default pip cache is used. Defaults to False.
+            use_worker(bool, optional): Whether run pip and other python modules in long living worker
+                process. Worker is POSIX only (needs `os.fork`). On windows and for wsl venvs used from
+                windows, it falls back to subprocess. Check `VenvWorker` for details. Defaults to False.
 
         Raises:
             FileNotFoundError: No folder found on defined path.
@@ -89,6 +133,9 @@ class Venv:
 
         self.venv_path_console_str = get_console_str_with_quotes(venv_path)
         self.with_wsl = with_wsl
+        self.wheelhouse = wheelhouse
+        self.pip_cache = pip_cache
+        self.use_worker = use_worker
 
         wsl = is_wsl() or with_wsl
 
@@ -120,6 +167,7 @@ class Venv:
                 f"{get_console_str_with_quotes(activate_path.as_posix())} {SHELL_AND} "
             )
             self.executable_str = get_console_str_with_quotes((self.executable).as_posix())
+            self._platform = "windows"
 
         elif platform.system() == "Windows" and with_wsl:
             venv_path = WslPath(venv_path)
@@ -132,6 +180,7 @@ class Venv:
                 f". {get_console_str_with_quotes(activate_path.wsl_path)} {SHELL_AND} "
             )
             self.executable_str = get_console_str_with_quotes((venv_path / "bin" / "python").wsl_path)
+            self._platform = "linux"
 
         else:
             activate_path = venv_path / "bin" / "activate"
@@ -141,6 +190,7 @@ class Venv:
             self.scripts_path = venv_path / "bin"
             self.activate_prefix_command = f". {get_console_str_with_quotes(activate_path)} {SHELL_AND} "
             self.executable_str = get_console_str_with_quotes((venv_path / "bin" / "python"))
+            self._platform = sys.platform
 
         self.venv_path = venv_path
         """Path to venv prefix, e.g. .../venv"""
@@ -160,7 +210,7 @@ class Venv:
                 Defaults to False.
         """
         if not self.installed:
-            terminal_do_command(
+            run_command(
                 self.create_command,
                 cwd=PROJECT_PATHS.root.as_posix(),
                 shell=True,
@@ -176,9 +226,21 @@ class Venv:
         requirements: None | list[str] = None,
         verbosity: Literal[0, 1, 2] = 1,
         path: PathLike = PROJECT_PATHS.root,
+        force: bool = False,
+        lock_max_age: None | float = 24 * 60 * 60,
     ) -> None:
         """Sync libraries based on requirements. Install missing, remove unnecessary.
 
+        After successful sync, fingerprint of requirements and python version is stored in venv. If
+        requirements didn't change since last sync, whole sync is skipped. Libraries installed in the
+        meantime manually are therefore not removed until requirements change or until `force` is used.
+
+        Requirements are resolved with pip-compile only once for the same requirements, python version and
+        platform. Resolved lock file is stored in `locks` folder in project cache and other venvs just sync
+        with it. Lock file is used only for `lock_max_age`, so new versions of libraries (that are not pinned
+        or dependencies of libraries) are used after some time. If `force` is used, requirements are resolved
+        again.
+
         Args:
             requirements_files (Literal["infer"] | PathLike | Sequence[PathLike], optional): Define what libraries
                 will be installed. If "infer", autodetected. Can also be a list of more files e.g
@@ -189,13 +251,15 @@ class Venv:
             path (PathLike, optional): If using just names or relative path, and not found, define the root.
                 It's also necessary when using another referenced files. If inferring files, it's used to
                 search. Defaults to PROJECT_PATHS.root.
+            force (bool, optional): Sync even if requirements didn't change since last sync and resolve
+                requirements even if there is cached lock file. Defaults to False.
+            lock_max_age (None | float, optional): How long in seconds is cached lock file used. If None, it
+                never expires. Defaults to one day.
         """
         print_progress("Syncing requirements", verbosity > 0)
 
         self._raise_if_not_installed()
 
-        self.install_library("pip-tools")
-
         requirements_all = []
 
         if requirements_files:
@@ -210,65 +274,238 @@ class Venv:
         if not requirements_all:
             raise RuntimeError("No requirements found.")
 
-        requirements_all_path = self.venv_path / "requirements_all.in"
-        if isinstance(self.venv_path, WslPath):
-            requirements_all_console_path_str = get_console_str_with_quotes(requirements_all_path.wsl_path)  # type: ignore
-            freezed_requirements_console_path_str = get_console_str_with_quotes(
-                (self.venv_path / "requirements.txt").wsl_path
-            )
-        else:
-            freezed_requirements_console_path_str = get_console_str_with_quotes(
-                (self.venv_path / "requirements.txt")
-            )
-            requirements_all_console_path_str = get_console_str_with_quotes(requirements_all_path)
+        fingerprint_path = self.real_path / "requirements_all.fingerprint"
+        fingerprint = hashlib.sha256(
+            "\n".join([self.get_python_version(), *sorted(requirements_all)]).encode("utf-8")
+        ).hexdigest()
+
+        if not force and fingerprint_path.exists():
+            with open(fingerprint_path) as fingerprint_file:
+                if fingerprint_file.read().strip() == fingerprint:
+                    if verbosity == 2:
+                        print("Requirements not changed since last sync, skipping.")
+                    return
+
+        # If sync fails in the middle, venv is not considered synced
+        if fingerprint_path.exists():
+            fingerprint_path.unlink()
+
+        self.install_library("pip-tools")
+
+        requirements_all_path = self.real_path / "requirements_all.in"
+        freezed_requirements_path = self.real_path / "requirements.txt"
 
         with open(requirements_all_path, "w") as requirement_libraries:
             requirement_libraries.write("\n".join(requirements_all))
 
-        pip_compile_command = (
-            f"pip-compile {requirements_all_console_path_str} --output-file "
-            f"{freezed_requirements_console_path_str} --quiet"
+        wheelhouse = self.get_wheelhouse_path()
+        find_links = ["--find-links", self._get_path_str(wheelhouse)] if wheelhouse else []
+        compile_args = [
+            "compile",
+            self._get_path_str(requirements_all_path),
+            "--output-file",
+            self._get_path_str(freezed_requirements_path),
+            "--quiet",
+            "--no-emit-find-links",
+        ]
+
+        # Resolution is shared by all the venvs with the same requirements, python version and platform
+        lock_key = hashlib.sha256(f"{self._platform}\n{fingerprint}".encode("utf-8")).hexdigest()
+        lock_path = PROJECT_PATHS.cache / "locks" / f"{lock_key}.txt"
+
+        # Parallel venvs with the same key wait until the first one resolves requirements
+        with _resolution_locks[lock_key]:
+            lock_valid = lock_path.exists() and (
+                lock_max_age is None or time.time() - lock_path.stat().st_mtime < lock_max_age
+            )
+
+            if not force and lock_valid:
+                if verbosity == 2:
+                    print("Using cached resolution of requirements.")
+                shutil.copyfile(lock_path, freezed_requirements_path)
+
+            else:
+                # Package index is used, so not pinned requirements resolve to the newest versions. Wheelhouse
+                # only is used as a fallback if package index is not available.
+                compile_options = [find_links, [*find_links, "--no-index"]] if wheelhouse else [[]]
+                compile_error = None
+
+                for options in compile_options:
+                    try:
+                        self.run_module(
+                            "piptools",
+                            [*compile_args, *options],
+                            verbose=verbosity == 2,
+                            error_header="Creating joined requirements.txt file failed.",
+                        )
+                        break
+                    except CommandError as err:
+                        compile_error = compile_error or err
+                else:
+                    # Error from package index is more descriptive than the one from offline fallback
+                    raise compile_error  # type: ignore
+
+                PROJECT_PATHS.create_cache()
+                lock_path.parent.mkdir(parents=True, exist_ok=True)
+                temp_lock_path = lock_path.with_name(f"{lock_key}.{os.getpid()}.tmp")
+                shutil.copyfile(freezed_requirements_path, temp_lock_path)
+                os.replace(temp_lock_path, lock_path)
+
+        offline = bool(wheelhouse) and self._update_wheelhouse(freezed_requirements_path, verbosity == 2)
+
+        self.run_module(
+            "piptools",
+            [
+                "sync",
+                self._get_path_str(freezed_requirements_path),
+                "--quiet",
+                *find_links,
+                *(["--no-index"] if offline else []),
+            ],
+            verbose=verbosity == 2,
+            error_header="Requirements syncing failed.",
         )
 
-        pip_sync_command = f"pip-sync {freezed_requirements_console_path_str} --quiet"
-        sync_commands = {
-            pip_compile_command: "Creating joined requirements.txt file failed.",
-            pip_sync_command: "Requirements syncing failed.",
-        }
+        with open(fingerprint_path, "w") as fingerprint_file:
+            fingerprint_file.write(fingerprint)
 
-        for i, j in sync_commands.items():
-            terminal_do_command(
-                f"{self.activate_prefix_command} {i}",
-                verbose=verbosity == 2,
-                error_header=j,
-                with_wsl=self.with_wsl,
-            )
+    def get_python_version(self) -> str:
+        """Get python version of the venv from `pyvenv.cfg` without starting the interpreter.
+
+        Returns:
+            str: Version like for example "3.10.4".
+
+        Raises:
+            VenvNotFound: If there is no `pyvenv.cfg` in venv.
+        """
+        try:
+            with open(self.real_path / "pyvenv.cfg") as config_file:
+                config_lines = config_file.readlines()
+        except OSError:
+            raise VenvNotFound(
+                f"Installed venv not found on {self.real_path}, 'pyvenv.cfg' missing."
+            ) from None
+
+        config = {}
+        for line in config_lines:
+            if "=" in line:
+                key, value = line.split("=", maxsplit=1)
+                config[key.strip()] = value.strip()
+
+        # 'venv' use version, 'virtualenv' use version_info like 3.10.4.final.0
+        version = config.get("version") or config.get("version_info", "")
+        return ".".join(version.split(".")[:3])
 
     def list_packages(self) -> str:
-        """Get list of installed libraries in the venv.
+        """Get list of installed libraries in the venv in the same format as ``pip freeze``.
 
-        The reason why it's meta coded via string parsing and not parsed directly is that it needs to be
-        available from other venv as well.
+        It's compatibility view on `get_installed_packages`, so it's fast and no subprocess is started.
+        Packages `pip`, `setuptools`, `wheel` and `distribute` are omitted as in ``pip freeze``.
+
+        Returns:
+            str: Lines like for example 'colorama==0.4.4'.
+        """
+        return "\n".join(
+            f"{name}=={version}"
+            for name, version in sorted(self.get_installed_packages().items(), key=lambda i: i[0].lower())
+            if name.lower() not in ["pip", "setuptools", "wheel", "distribute"]
+        )
+
+    def get_installed_packages(self) -> dict[str, str]:
+        """Get installed libraries in the venv with versions.
+
+        Metadata from `*.dist-info` and `*.egg-info` in site-packages are read directly from disk, so no
+        subprocess is started and it works also for wsl venvs from windows.
+
+        Returns:
+            dict[str, str]: Mapping of package names to versions. E.g. {"colorama": "0.4.4"}.
+
+        Raises:
+            VenvNotFound: If venv is not installed.
         """
         self._raise_if_not_installed()
 
-        result = terminal_do_command(
-            f"{self.activate_prefix_command} {self.executable_str} -m pip freeze",
-            with_wsl=self.with_wsl,
-            verbose=False,
+        packages = {}
+
+        site_packages_paths = [
+            *self.real_path.glob("lib/python*/site-packages"),
+            *self.real_path.glob("lib64/python*/site-packages"),
+            self.real_path / "Lib" / "site-packages",
+        ]
+
+        for site_packages_path in site_packages_paths:
+            if not site_packages_path.is_dir():
+                continue
+
+            for metadata_path in [
+                *site_packages_path.glob("*.dist-info"),
+                *site_packages_path.glob("*.egg-info"),
+            ]:
+                if metadata_path.suffix == ".dist-info":
+                    metadata_file = metadata_path / "METADATA"
+                elif metadata_path.is_dir():
+                    metadata_file = metadata_path / "PKG-INFO"
+                else:
+                    metadata_file = metadata_path
+
+                metadata = {}
+
+                try:
+                    with open(metadata_file, encoding="utf-8", errors="replace") as metadata_content:
+                        for line in metadata_content:
+                            # Headers end with first empty line, then description follows
+                            if not line.strip():
+                                break
+                            if ":" in line:
+                                key, value = line.split(":", maxsplit=1)
+                                metadata.setdefault(key.strip().lower(), value.strip())
+                except OSError:
+                    pass
+
+                # Folder name is used if metadata are broken, e.g. 'colorama-0.4.4.dist-info'
+                name_from_folder, _, version_from_folder = metadata_path.stem.partition("-")
+                name = metadata.get("name", name_from_folder)
+                version = metadata.get("version", version_from_folder.split("-")[0])
+
+                if name and name not in packages:
+                    packages[name] = version
+
+        return packages
+
+    def get_wheelhouse_path(self) -> None | Path:
+        """Get folder with wheels for python version and platform of this venv.
+
+        Returns:
+            None | Path: E.g. `.cicd_cache/wheelhouse/linux-3.10`. None if wheelhouse is not used.
+        """
+        if not self.wheelhouse:
+            return None
+
+        wheelhouse = (
+            PROJECT_PATHS.create_cache() / "wheelhouse" if self.wheelhouse is True else Path(self.wheelhouse)
         )
+        version = ".".join(self.get_python_version().split(".")[:2])
+        wheelhouse_path = wheelhouse / f"{self._platform}-{version}"
+        wheelhouse_path.mkdir(parents=True, exist_ok=True)
 
-        return result
+        return wheelhouse_path
 
     def install_library(
-        self, name: str, verbose: bool = False, upgrade: bool = False, path: None | PathLike = None
+        self,
+        name: str | Sequence[str],
+        verbose: bool = False,
+        upgrade: bool = False,
+        path: None | PathLike = None,
     ) -> None:
         """Install package to venv with pip install.
 
-        You can use extras with square brackets.
+        You can use extras with square brackets. More libraries can be installed at once with one pip call.
+        If libraries with all the dependencies are in wheelhouse, these are installed without using package
+        index. Otherwise missing wheels are added to wheelhouse first. Wheelhouse is not used for local paths
+        and if using `upgrade`.
 
         Args:
-            name (str): Name of installed library.
+            name (str | Sequence[str]): Name of installed library or list of names.
             verbose (bool, optional): If True, result of terminal command will be printed to console.
                 Defaults to False.
             upgrade (bool, optional): Update flag. If True, then latest is installed. If False, and already
@@ -276,43 +513,311 @@ class Venv:
             path (None | Pathlike, optional): If installing from local path, this is path from where you can use
                 relative paths. Defaults to None.
         """
-        self._raise_if_not_installed()
+        self._run_pip([name] if isinstance(name, str) else list(name), [], verbose, upgrade, path)
 
-        command = f"{self.activate_prefix_command} {self.executable_str} -m pip install {name} {'--upgrade' if upgrade else ''}"
-        terminal_do_command(
-            command,
-            shell=True,
-            verbose=verbose,
-            error_header="Library installation failed.",
-            with_wsl=self.with_wsl,
-            cwd=path,
-        )
-
-    def uninstall_library(self, name: str, verbose: bool = False) -> None:
+    def uninstall_library(self, name: str | Sequence[str], verbose: bool = False) -> None:
         """Uninstall package to venv with pip install.
 
         Args:
-            name (str): Name of library to uninstall.
+            name (str | Sequence[str]): Name of library to uninstall or list of names.
             verbose (bool, optional): If True, result of terminal command will be printed to console.
                 Defaults to False.
         """
+        self._run_pip([], [name] if isinstance(name, str) else list(name), verbose)
+
+    def transaction(
+        self, verbose: bool = False, upgrade: bool = False, path: None | PathLike = None
+    ) -> PipTransaction:
+        """Collect libraries to install and uninstall and run it in one command when leaving context.
+
+        Args:
+            verbose (bool, optional): If True, result of terminal command will be printed to console.
+                Defaults to False.
+            upgrade (bool, optional): Same as in `install_library`. Defaults to False
+            path (None | Pathlike, optional): Same as in `install_library`. Defaults to None.
+
+        Returns:
+            PipTransaction: Use `install` and `uninstall` methods. It's run with `commit` or when leaving
+            the context manager without an error.
+
+        Example:
+            Old version is removed and libraries are installed in one command. ::
+
+                with Venv("venv").transaction() as transaction:
+                    transaction.uninstall("mypythontools")
+                    transaction.install(["colorama", "pytest"])
+        """
+        return PipTransaction(self, verbose, upgrade, path)
+
+    def get_pip_env(self) -> dict[str, str]:
+        """Get environment variables used for pip commands so all the venvs share the same pip cache.
+
+        Returns:
+            dict[str, str]: Environment variables that can be used in `run_command`. Empty if pip cache is
+            not pinned.
+        """
+        if not self.pip_cache:
+            return {}
+
+        pip_cache_path = (
+            PROJECT_PATHS.create_cache() / "pip" if self.pip_cache is True else Path(self.pip_cache)
+        )
+        env = {"PIP_CACHE_DIR": pip_cache_path.as_posix()}
+
+        # Windows path is translated to wsl path
+        if isinstance(self.venv_path, WslPath):
+            env["WSLENV"] = ":".join(i for i in [os.environ.get("WSLENV"), "PIP_CACHE_DIR/p"] if i)
+
+        return env
+
+    def run_module(
+        self,
+        module: str,
+        args: Sequence[str] = (),
+        cwd: None | PathLike = None,
+        verbose: bool = False,
+        error_header: str = "",
+    ) -> str:
+        """Run python module in the venv like with ``python -m module``.
+
+        If venv uses worker, module runs in worker process, otherwise in new activated shell. Pip cache from
+        `get_pip_env` is used.
+
+        Args:
+            module (str): E.g. "pip".
+            args (Sequence[str], optional): Arguments of the module. Paths must be valid for venv (so wsl
+                paths for wsl venvs). Defaults to ().
+            cwd (None | PathLike, optional): Where to run the module. Defaults to None.
+            verbose (bool, optional): Whether print output to console. Defaults to False.
+            error_header (str, optional): If meet error, message at the beginning of message. Defaults to "".
+
+        Returns:
+            str: Standard output.
+
+        Raises:
+            CommandError: If module returns non zero exit code.
+        """
+        return self.run_modules([(module, args)], cwd, verbose, error_header)
+
+    def run_modules(
+        self,
+        modules: Sequence[tuple[str, Sequence[str]]],
+        cwd: None | PathLike = None,
+        verbose: bool = False,
+        error_header: str = "",
+    ) -> str:
+        """Run python modules one after another, it's stopped on first error. Without worker, modules are run
+        in one shell, so venv is activated only once.
+
+        Args:
+            modules (Sequence[tuple[str, Sequence[str]]]): Names of modules with its arguments.
+                E.g. `[("pip", ["uninstall", "--yes", "colorama"]), ("pip", ["install", "colorama"])]`.
+            cwd (None | PathLike, optional): Where to run the modules. Defaults to None.
+            verbose (bool, optional): Whether print output to console. Defaults to False.
+            error_header (str, optional): If meet error, message at the beginning of message. Defaults to "".
+
+        Returns:
+            str: Standard output of the last module.
+
+        Raises:
+            CommandError: If some module returns non zero exit code.
+        """
         self._raise_if_not_installed()
 
-        command = f"{self.activate_prefix_command} {self.executable_str} -m pip uninstall {name}"
+        worker = self.get_worker()
 
-        terminal_do_command(
-            command,
-            shell=True,
+        if worker:
+            output = ""
+            for module, args in modules:
+                output = worker.run_module(module, args, cwd, self.get_pip_env(), verbose, error_header)
+            return output
+
+        commands = [
+            f"{self.executable_str} -m {module} {' '.join(get_console_str_with_quotes(str(i)) for i in args)}"
+            for module, args in modules
+        ]
+
+        return run_command(
+            f"{self.activate_prefix_command} {f' {SHELL_AND} '.join(commands)}",
             verbose=verbose,
-            error_header="Library removal failed",
+            error_header=error_header,
             with_wsl=self.with_wsl,
-            input_str="y",
+            cwd=cwd,
+            env=self.get_pip_env(),
+        )
+
+    def get_worker(self) -> None | VenvWorker:
+        """Get running worker of this venv. It's started on first use.
+
+        Returns:
+            None | VenvWorker: Worker or None if venv doesn't use worker or if system doesn't support fork
+            (e.g. windows or wsl venv used from windows).
+        """
+        # Modules could change state of the worker if not run in forked process
+        if not self.use_worker or not hasattr(os, "fork") or isinstance(self.venv_path, WslPath):
+            return None
+
+        self._raise_if_not_installed()
+
+        with _workers_lock:
+            worker = _workers.get(self.real_path)
+
+            if not worker:
+                if not _workers:
+                    atexit.register(shutdown_workers)
+                worker = _workers[self.real_path] = VenvWorker(self.executable)
+
+        return worker
+
+    def _run_pip(
+        self,
+        install: list[str],
+        uninstall: list[str],
+        verbose: bool = False,
+        upgrade: bool = False,
+        path: None | PathLike = None,
+    ) -> None:
+        """Uninstall and install libraries in one command. Use wheelhouse if possible."""
+        self._raise_if_not_installed()
+
+        if not install and not uninstall:
+            return
+
+        commands: list[tuple[str, Sequence[str]]] = []
+
+        if uninstall:
+            commands.append(("pip", ["uninstall", "--yes", *uninstall]))
+
+        is_local = any(
+            i.startswith((".", "/", "-")) or (Path(path or Path.cwd()) / i).exists() for i in install
+        )
+        wheelhouse = None if not install or upgrade or is_local else self.get_wheelhouse_path()
+        install_args = ["install", *install, *(["--upgrade"] if upgrade else [])]
+
+        if wheelhouse:
+            find_links = ["--find-links", self._get_path_str(wheelhouse)]
+
+            try:
+                self.run_modules(
+                    [*commands, ("pip", [*install_args, "--no-index", *find_links])], path, verbose
+                )
+                return
+            except CommandError:
+                pass
+
+            # Download or build missing wheels, so next time it's installed offline
+            try:
+                self.run_module(
+                    "pip",
+                    [
+                        "wheel",
+                        *install,
+                        "--quiet",
+                        "--wheel-dir",
+                        self._get_path_str(wheelhouse),
+                        *find_links,
+                    ],
+                    path,
+                    verbose,
+                )
+            except CommandError:
+                pass
+
+            install_args.extend(find_links)
+
+        if install:
+            commands.append(("pip", install_args))
+
+        self.run_modules(
+            commands, path, verbose, "Library installation failed." if install else "Library removal failed"
         )
 
     def remove(self) -> None:
         """Remove the folder with venv."""
         shutil.rmtree(self.venv_path.as_posix())
 
+    def clone(self, destination: PathLike, hardlink: bool = True) -> Venv:
+        """Create new venv as a copy of this venv, so libraries doesn't have to be installed again.
+
+        Paths in activate scripts, shebangs of scripts and in `pyvenv.cfg` are changed to the new location.
+        Compiled `.pyc` files still contain original paths, which is visible only in tracebacks.
+
+        Args:
+            destination (PathLike): Path of new venv. Folder must not exist or must be empty.
+            hardlink (bool, optional): Whether create hardlinks instead of copying files where possible. It's
+                much faster and takes no space. It's safe as pip or python never change files in place.
+                Defaults to True.
+
+        Returns:
+            Venv: Created venv.
+
+        Raises:
+            RuntimeError: If destination is not empty or if venv is windows venv. Scripts launchers (e.g.
+                `pip.exe`) on windows contains path to python in binary form, so it cannot be moved.
+        """
+        self._raise_if_not_installed()
+
+        destination_path = Path(destination).resolve()
+
+        if not is_path_free(destination_path):
+            raise RuntimeError(f"Venv cannot be cloned. There is not empty folder on '{destination_path}'.")
+
+        if (self.real_path / "Scripts").exists():
+            raise RuntimeError(
+                "Windows venvs cannot be cloned, because script launchers contain absolute path of python."
+            )
+
+        def link_or_copy(source, target):
+            if hardlink:
+                try:
+                    os.link(source, target)
+                    return target
+                except OSError:
+                    pass
+            return shutil.copy2(source, target)
+
+        if destination_path.exists():
+            destination_path.rmdir()
+
+        shutil.copytree(self.real_path, destination_path, symlinks=True, copy_function=link_or_copy)
+
+        new_venv = Venv(
+            destination_path,
+            with_wsl=self.with_wsl,
+            wheelhouse=self.wheelhouse,
+            pip_cache=self.pip_cache,
+            use_worker=self.use_worker,
+        )
+
+        replacements = [(self.real_path.as_posix(), new_venv.real_path.as_posix())]
+        if isinstance(self.venv_path, WslPath):
+            replacements.append((self.venv_path.wsl_path, new_venv.venv_path.wsl_path))  # type: ignore
+
+        for file in [*(destination_path / "bin").iterdir(), destination_path / "pyvenv.cfg"]:
+            if file.is_symlink() or not file.is_file():
+                continue
+
+            try:
+                with open(file, encoding="utf-8") as script:
+                    content = script.read()
+            except (OSError, UnicodeDecodeError):
+                # Binary files
+                continue
+
+            new_content = content
+            for old_path, new_path in replacements:
+                new_content = new_content.replace(old_path, new_path)
+
+            if new_content != content:
+                mode = file.stat().st_mode
+                # File may be hardlink to original venv, so new file is created instead of editing
+                file.unlink()
+                with open(file, "w", encoding="utf-8", newline="") as script:
+                    script.write(new_content)
+                os.chmod(file, mode)
+
+        return new_venv
+
     def get_script_path(self, name: str) -> str:
         """Get script path such as pip for example."""
         if platform.system() == "Windows" and not is_wsl():
@@ -320,12 +825,387 @@ class Venv:
         else:
             return get_console_str_with_quotes(self.scripts_path / name)
 
+    def _get_path_str(self, path: Path) -> str:
+        """Path as used by venv, so wsl path for wsl venvs."""
+        return WslPath(path).wsl_path if isinstance(self.venv_path, WslPath) else path.as_posix()
+
+    def _update_wheelhouse(self, requirements_path: Path, verbose: bool) -> bool:
+        """Add wheels of pinned requirements that are not in wheelhouse yet. Return whether all requirements
+        can be installed without package index."""
+        wheelhouse = self.get_wheelhouse_path()
+
+        if not wheelhouse:
+            return False
+
+        # Wheel file names are like 'typing_extensions-4.2.0-py3-none-any.whl'
+        available = set()
+        for wheel in wheelhouse.glob("*.whl"):
+            name, version, *_ = wheel.name.split("-")
+            available.add((re.sub(r"[-_.]+", "_", name).lower(), version))
+
+        missing = []
+        offline = True
+
+        with open(requirements_path) as requirements_file:
+            for line in requirements_file:
+                requirement = line.split(" #")[0].strip(" \\\n")
+
+                # Options like '--index-url' are ignored, editable local paths need package index
+                if not requirement or requirement.startswith("#"):
+                    continue
+                if requirement.startswith("-"):
+                    offline = offline and not requirement.startswith(("-e", "--editable"))
+                    continue
+
+                name, is_pinned, version = requirement.split(";")[0].partition("==")
+                name = re.sub(r"[-_.]+", "_", name.split("[")[0].strip()).lower()
+
+                # Urls cannot be installed from wheelhouse
+                if not is_pinned:
+                    offline = False
+                elif (name, version.strip()) not in available:
+                    missing.append(requirement)
+
+        if not missing:
+            return offline
+
+        missing_path = self.real_path / "requirements_wheelhouse.txt"
+
+        with open(missing_path, "w") as missing_file:
+            missing_file.write("\n".join(missing))
+
+        try:
+            self.run_module(
+                "pip",
+                [
+                    "wheel",
+                    "--no-deps",
+                    "--quiet",
+                    "--requirement",
+                    self._get_path_str(missing_path),
+                    "--wheel-dir",
+                    self._get_path_str(wheelhouse),
+                ],
+                verbose=verbose,
+            )
+        except CommandError:
+            # Some wheels cannot be built, package index will be used
+            return False
+
+        return offline
+
     def _raise_if_not_installed(self):
         if not self.installed:
 
             raise VenvNotFound("Installed venv not found, first create it with 'create' or create multiple.")
 
 
+class PipTransaction:
+    """Libraries to install and uninstall in one command. Create it with `Venv.transaction`.
+
+    Uninstall runs first, so it's possible to reinstall library e.g. from new wheel. If using as context
+    manager, it's run when leaving the context if there was no error.
+
+    Attributes:
+        venv (Venv): Venv where libraries are installed.
+        to_install (list[str]): Libraries that will be installed.
+        to_uninstall (list[str]): Libraries that will be uninstalled.
+    """
+
+    def __init__(
+        self, venv: Venv, verbose: bool = False, upgrade: bool = False, path: None | PathLike = None
+    ):
+        """Init the transaction. Check `Venv.transaction` for parameters."""
+        self.venv = venv
+        self.verbose = verbose
+        self.upgrade = upgrade
+        self.path = path
+        self.to_install: list[str] = []
+        self.to_uninstall: list[str] = []
+
+    def __enter__(self) -> PipTransaction:
+        return self
+
+    def __exit__(self, exc_type, *args) -> None:
+        if exc_type is None:
+            self.commit()
+
+    def install(self, name: str | Sequence[str]) -> None:
+        """Add library or list of libraries to install."""
+        self.to_install.extend([name] if isinstance(name, str) else name)
+
+    def uninstall(self, name: str | Sequence[str]) -> None:
+        """Add library or list of libraries to uninstall."""
+        self.to_uninstall.extend([name] if isinstance(name, str) else name)
+
+    def commit(self) -> None:
+        """Uninstall and install collected libraries. It's done only once."""
+        install, uninstall = self.to_install, self.to_uninstall
+        self.to_install, self.to_uninstall = [], []
+
+        self.venv._run_pip(install, uninstall, self.verbose, self.upgrade, self.path)
+
+
+class VenvWorker:
+    """Long living python process of a venv that runs python modules without starting new shell and interpreter.
+
+    Requests and responses are json lines sent over stdin and stdout of the worker. Pip is imported in the
+    worker in advance. Every module runs in forked copy of the worker, so it's isolated and output of
+    subprocesses is captured as well. Therefore worker can be used only on systems with fork (not on windows).
+    If module doesn't finish in `timeout`, worker is killed and new one is started with next request.
+
+    Workers are created with `Venv.get_worker` and stopped with `shutdown_workers` (also called at exit).
+
+    Attributes:
+        executable (Path): Python of the venv.
+        timeout (None | float): Maximum duration of one module in seconds.
+        process (None | subprocess.Popen): Worker process. None if not started yet.
+    """
+
+    def __init__(self, executable: PathLike, timeout: None | float = 60 * 60) -> None:
+        """Init the worker. Process is started with first request.
+
+        Args:
+            executable (PathLike): Python of the venv.
+            timeout (None | float, optional): Maximum duration of one module in seconds. If None, there is
+                no limit. Defaults to one hour.
+        """
+        self.executable = Path(executable)
+        self.timeout = timeout
+        self.process: None | subprocess.Popen = None
+        self.lock = threading.Lock()
+        self._request_ids = itertools.count()
+
+    def start(self) -> None:
+        """Start the worker process if not running."""
+        if self.process and self.process.poll() is None:
+            return
+
+        self.process = subprocess.Popen(
+            [self.executable.as_posix(), "-u", "-c", _WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            # Own process group, so forked processes running modules can be killed too
+            start_new_session=True,
+        )
+
+    def stop(self) -> None:
+        """Stop the worker process."""
+        with self.lock:
+            if not self.process:
+                return
+
+            if self.process.poll() is None:
+                try:
+                    self.process.communicate(json.dumps({"type": "exit"}).encode("utf-8") + b"\n", timeout=10)
+                except (OSError, subprocess.TimeoutExpired):
+                    self._kill()
+
+            self.process = None
+
+    def run_module(
+        self,
+        module: str,
+        args: Sequence[str] = (),
+        cwd: None | PathLike = None,
+        env: None | dict[str, str] = None,
+        verbose: bool = False,
+        error_header: str = "",
+    ) -> str:
+        """Run module in worker like with ``python -m module``.
+
+        Args:
+            module (str): E.g. "pip".
+            args (Sequence[str], optional): Arguments of the module. Defaults to ().
+            cwd (None | PathLike, optional): Where to run the module. Defaults to None.
+            env (None | dict[str, str], optional): Environment variables added to the current ones.
+                Defaults to None.
+            verbose (bool, optional): Whether print output to console. Defaults to False.
+            error_header (str, optional): If meet error, message at the beginning of message. Defaults to "".
+
+        Returns:
+            str: Standard output.
+
+        Raises:
+            CommandError: If module returns non zero exit code or if worker stops.
+        """
+        args = [str(i) for i in args]
+        cwd = Path(cwd).resolve() if cwd else None
+        definition = Command(
+            f"{self.executable.as_posix()} -m {module} {' '.join(args)}",
+            cwd,
+            timeout=self.timeout,
+            env=env,
+            error_header=error_header,
+        )
+        request = {
+            "type": "run_module",
+            "module": module,
+            "args": args,
+            "cwd": cwd.as_posix() if cwd else None,
+            "env": env or {},
+        }
+
+        start = time.perf_counter()
+        timed_out = False
+
+        with self.lock:
+            try:
+                response = self._send(request)
+            except subprocess.TimeoutExpired:
+                # Module may hang, worker is killed and new one is started with next request
+                self._kill()
+                timed_out = True
+                response = {"returncode": None, "stdout": "", "stderr": ""}
+            except OSError as err:
+                # Worker stopped, e.g. it was killed. New one is started with next request.
+                self.process = None
+                response = {"returncode": None, "stdout": "", "stderr": f"Venv worker failed. {err}"}
+
+        result = CommandResult(
+            definition.command,
+            cwd,
+            response["returncode"],
+            response["stdout"].strip("\r\n"),
+            response["stderr"].strip("\r\n"),
+            time.perf_counter() - start,
+            timed_out,
+        )
+        record_command(definition, result, start)
+
+        return process_result(definition, result, verbose, check=True).stdout
+
+    def _send(self, request: dict[str, Any]) -> dict[str, Any]:
+        self.start()
+        assert self.process and self.process.stdin and self.process.stdout
+
+        request["id"] = next(self._request_ids)
+        self.process.stdin.write(json.dumps(request).encode("utf-8") + b"\n")
+        self.process.stdin.flush()
+
+        # Response is one line written at once, so it can be read when available
+        if self.timeout is not None and not select.select([self.process.stdout], [], [], self.timeout)[0]:
+            raise subprocess.TimeoutExpired(request["module"], self.timeout)
+
+        response_line = self.process.stdout.readline()
+
+        if not response_line:
+            raise OSError("Worker process stopped unexpectedly.")
+
+        response = json.loads(response_line)
+
+        if response.get("id") != request["id"]:
+            raise OSError("Worker returned response to different request.")
+
+        return response
+
+    def _kill(self) -> None:
+        """Kill the worker with all the running modules."""
+        if not self.process:
+            return
+
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)  # type: ignore
+        except OSError:
+            pass  # Already finished
+
+        self.process.wait()
+        self.process = None
+
+
+# Requests are json lines with "type" "run_module" or "exit". Response is json line with "returncode",
+# "stdout" and "stderr". Python 3.6 syntax is used as venvs can have older python than the pipeline.
+_WORKER_SCRIPT = """
+import json, os, runpy, sys, tempfile, traceback
+
+protocol = os.fdopen(os.dup(1), "w")
+
+try:
+    import pip._internal.cli.main
+    import pip._internal.commands.install
+except Exception:
+    pass
+
+
+def run_module(request):
+    sys.argv = [request["module"]] + request["args"]
+    try:
+        runpy.run_module(request["module"], run_name="__main__", alter_sys=True)
+    except SystemExit as err:
+        if err.code is None or isinstance(err.code, int):
+            return err.code or 0
+        print(err.code, file=sys.stderr)
+        return 1
+    except BaseException:
+        traceback.print_exc()
+        return 1
+    return 0
+
+
+def run_with_output(request, stdout, stderr):
+    os.dup2(stdout.fileno(), 1)
+    os.dup2(stderr.fileno(), 2)
+    if request["cwd"]:
+        os.chdir(request["cwd"])
+    os.environ.update(request["env"])
+    returncode = 1
+    try:
+        returncode = run_module(request)
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    return returncode
+
+
+def execute(request):
+    stdout, stderr = tempfile.TemporaryFile(), tempfile.TemporaryFile()
+
+    pid = os.fork()
+    if pid == 0:
+        os.dup2(os.open(os.devnull, os.O_RDONLY), 0)
+        returncode = 1
+        try:
+            returncode = run_with_output(request, stdout, stderr)
+        finally:
+            os._exit(returncode)
+    _, status = os.waitpid(pid, 0)
+    returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else 128 + os.WTERMSIG(status)
+
+    stdout.seek(0)
+    stderr.seek(0)
+    return {
+        "returncode": returncode,
+        "stdout": stdout.read().decode("utf-8", errors="replace"),
+        "stderr": stderr.read().decode("utf-8", errors="replace"),
+    }
+
+
+for line in sys.stdin:
+    request = json.loads(line)
+    if request["type"] == "exit":
+        break
+    response = execute(request)
+    response["id"] = request["id"]
+    protocol.write(json.dumps(response) + "\\n")
+    protocol.flush()
+"""
+
+_workers: dict[Path, VenvWorker] = {}
+_resolution_locks: defaultdict[str, threading.Lock] = defaultdict(threading.Lock)
+_workers_lock = threading.Lock()
+
+
+def shutdown_workers() -> None:
+    """Stop all the running venv workers. It's called at the end of the pipeline and at exit."""
+    with _workers_lock:
+        workers = list(_workers.values())
+        _workers.clear()
+
+    for worker in workers:
+        worker.stop()
+
+
 def is_venv() -> bool:
     """True if run in venv, False if run in main interpreter directly."""
     return sys.base_prefix.startswith(sys.prefix)
@@ -335,6 +1215,12 @@ def prepare_venvs(
     path: None | PathLike = "venv",
     versions: Sequence[str] = ["3.7", "3.10", "wsl-3.7", "wsl-3.10"],
     verbosity: Literal[0, 1, 2] = 1,
+    template_path: None | PathLike = None,
+    sync_requirements: None | Literal["infer"] | PathLike | Sequence[PathLike] = None,
+    sync_requirements_path: PathLike = PROJECT_PATHS.root,
+    max_workers: None | int = None,
+    wheelhouse: bool | PathLike = True,
+    pip_cache: bool | PathLike = True,
 ):
     """This will install virtual environments with defined versions.
 
@@ -342,12 +1228,36 @@ def prepare_venvs(
     on windows. You have to install python launcher when using linux or wsl. More about python-launcher
     https://github.com/brettcannon/python-launcher
 
+    If `template_path` is used, "golden" venv is created (and synced) for each version only once in
+    template path and new venvs are just cloned from it, which takes seconds. Windows venvs cannot be cloned
+    (wsl venvs can), so these are created and synced as usual.
+
+    All the versions are checked first and only missing venvs are created. These are created concurrently.
+    If some version fails, the others are still finished and then one error with all the failures is raised.
+
     Args:
         path (None | PathLike): Where venvs will be stored. If None, cwd() will be used. Defaults to "venv".
         versions (Sequence[str], optional): List of used versions. If you want to use wsl, add `wsl-` prefix
             like for example `wsl-3.7`. Defaults to ["3.7", "3.10", "wsl-3.7", "wsl-3.10"].
         verbosity (Literal[0, 1, 2], optional): If 0, prints nothing, if 1, then one line description of what
             happened is printed. If 3, all the results from terminal are printed. Defaults to 1.
+        template_path (None | PathLike, optional): Where template venvs are stored. E.g. "venv/templates".
+            If None, venvs are created from scratch. Defaults to None.
+        sync_requirements (None | Literal["infer"] | PathLike | Sequence[PathLike], optional): If defined,
+            template venvs (or new venvs if not using template) are synced with these requirements. It can be
+            path or list of paths to requirements files or "infer". Defaults to None.
+        sync_requirements_path (PathLike, optional): Define the root if using just names or relative path in
+            `sync_requirements`. Defaults to PROJECT_PATHS.root.
+        max_workers (None | int, optional): Maximum number of venvs created at the same time. If None,
+            default of `ThreadPoolExecutor` is used. Defaults to None.
+        wheelhouse (bool | PathLike, optional): Wheelhouse used for syncing requirements, so venvs with the
+            same python version are synced from already built wheels. Check `Venv` for details.
+            Defaults to True.
+        pip_cache (bool | PathLike, optional): Pip cache folder shared by all the venvs. Check `Venv` for
+            details. Defaults to True.
+
+    Raises:
+        RuntimeError: If some of the venvs cannot be created. Message contains errors of all failed versions.
     """
     print_progress("Preparing venvs", verbosity > 0)
 
@@ -357,43 +1267,103 @@ def prepare_venvs(
     if not isinstance(versions, list):
         raise TypeError("'versions' param has to be list.")
 
-    for version in versions:
-        venv_path = Path(f"{path}/{version}")
+    missing: list[tuple[str, Path, str, bool]] = []
+    errors: dict[str, str] = {}
+
+    for version_name in versions:
+        venv_path = Path(f"{path}/{version_name}")
+        wsl = version_name.startswith("wsl-")
+        version = version_name[4:] if wsl else version_name  # remove "wsl-"
+
+        if is_path_free(venv_path):
+            missing.append((version_name, venv_path, version, wsl))
+
+        elif not Venv(venv_path, with_wsl=wsl).installed:
+            errors[version_name] = (
+                f"There is not empty folder on defined path '{venv_path.as_posix()}' and existing "
+                "virtualenv for current OS not detected there. Clean it first or check the settings "
+                "whether it should be an wsl venv."
+            )
+
+    if any(wsl for *_, wsl in missing):
+        _check_wsl_launcher()
+
+    def prepare_venv(version_name: str, venv_path: Path, version: str, wsl: bool) -> None:
+        # Prefix is used so output of concurrently created venvs is not mixed
+        prefix = version_name if len(missing) > 1 else None
+
+        # Windows launchers contain absolute paths so windows venvs cannot be cloned
+        can_clone = wsl or platform.system() != "Windows" or is_wsl()
+
+        if template_path and can_clone:
+            template_venv = Venv(
+                Path(f"{template_path}/{version_name}"),
+                with_wsl=wsl,
+                wheelhouse=wheelhouse,
+                pip_cache=pip_cache,
+            )
+
+            if not template_venv.installed:
+                _create_venv(template_venv.real_path, version, wsl, verbosity, prefix)
+                template_venv = Venv(
+                    template_venv.real_path, with_wsl=wsl, wheelhouse=wheelhouse, pip_cache=pip_cache
+                )
+
+            if sync_requirements:
+                template_venv.sync_requirements(
+                    sync_requirements, verbosity=0 if verbosity < 2 else 2, path=sync_requirements_path
+                )
+
+            template_venv.clone(venv_path)
 
-        if version.startswith("wsl-"):
-            wsl = True
-            version = version[4:]  # remove "wsl-"
         else:
-            wsl = False
+            _create_venv(venv_path, version, wsl, verbosity, prefix)
 
-        if not is_path_free(venv_path):
-            if Venv(venv_path, with_wsl=wsl).installed:
-                continue
-            else:
-                raise RuntimeError(
-                    f"There is not empty folder on defined path '{venv_path.as_posix()}' and existing "
-                    "virtualenv for current OS not detected there. Clean it first or check the settings "
-                    "whether it should be an wsl venv."
+            if sync_requirements:
+                Venv(venv_path, with_wsl=wsl, wheelhouse=wheelhouse, pip_cache=pip_cache).sync_requirements(
+                    sync_requirements, verbosity=0 if verbosity < 2 else 2, path=sync_requirements_path
                 )
 
-        if wsl:
-            check_script_is_available(
-                "wsl py",
-                message=(
-                    "Verify whether python launcher is installed. If not, install it from "
-                    "https://github.com/brettcannon/python-launcher . \n If it's installed in "
-                    "'/home/linuxbrew/.linuxbrew/bin/py' it will be not visible from wsl. "
-                    "You can use /usr/local/..."
-                ),
-            )
-        create_command = f"py -{version} -m venv {venv_path.as_posix()}"
+    if missing:
+        with ThreadPoolExecutor(max_workers) as executor:
+            futures = {executor.submit(prepare_venv, *i): i[0] for i in missing}
 
-        terminal_do_command(
-            create_command,
-            verbose=verbosity == 2,
-            error_header=(
-                f"Creating virtual environment for{' wsl ' if wsl else ' '}version {version} failed. "
-                "If fails with wsl, try to install 'python3.x-venv' on wsl."
-            ),
-            with_wsl=wsl,
+            for future, version_name in futures.items():
+                error = future.exception()
+                if error is not None:
+                    errors[version_name] = str(error).strip()
+
+    if errors:
+        raise RuntimeError(
+            f"Preparing venvs failed for versions {list(errors)}.\n\n"
+            + "\n\n".join(f"{version_name}:\n{error}" for version_name, error in errors.items())
         )
+
+
+def _check_wsl_launcher() -> None:
+    check_script_is_available(
+        "wsl py",
+        message=(
+            "Verify whether python launcher is installed. If not, install it from "
+            "https://github.com/brettcannon/python-launcher . \n If it's installed in "
+            "'/home/linuxbrew/.linuxbrew/bin/py' it will be not visible from wsl. "
+            "You can use /usr/local/..."
+        ),
+    )
+
+
+def _create_venv(
+    venv_path: Path, version: str, wsl: bool, verbosity: Literal[0, 1, 2], prefix: None | str = None
+) -> None:
+    create_command = f"py -{version} -m venv {get_console_str_with_quotes(venv_path.as_posix())}"
+
+    run_command(
+        create_command,
+        verbose=verbosity == 2,
+        error_header=(
+            f"Creating virtual environment for{' wsl ' if wsl else ' '}version {version} failed. "
+            "If fails with wsl, try to install 'python3.x-venv' on wsl."
+        ),
+        with_wsl=wsl,
+        prefix=prefix,
+    )
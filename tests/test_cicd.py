@@ -5,14 +5,20 @@
 
 from __future__ import annotations
 from pathlib import Path
+import json
 import sys
 import platform
+import tempfile
+import threading
+import time
 
 from mypythontools.system import is_wsl
 
 root_path = sys.path.insert(0, Path(__file__).parents[1].as_posix())  # pylint: disable=no-member
 
 import mypythontools_cicd as cicd
+from mypythontools_cicd.commands import Trace
+from mypythontools_cicd.misc import DurationsDatabase
 from conftest import prepare_test
 
 test_project_path = Path("tests").resolve() / "tested project"
@@ -52,8 +58,136 @@ def test_cicd_pipeline():
     cicd.cicd.cicd_pipeline(config)
 
 
+def test_run_stages():
+    running = set()
+    concurrent = []
+    order = []
+    lock = threading.Lock()
+
+    def stage(name):
+        def function():
+            with lock:
+                running.add(name)
+                concurrent.append(set(running))
+            time.sleep(0.2)
+            with lock:
+                running.remove(name)
+                order.append(name)
+
+        return function
+
+    cicd.cicd.run_stages(
+        [
+            cicd.cicd.PipelineStage("run_tests", stage("run_tests"), depends_on=["reformat"]),
+            cicd.cicd.PipelineStage("reformat", stage("reformat")),
+            cicd.cicd.PipelineStage("docs", stage("docs"), depends_on=["reformat"]),
+            cicd.cicd.PipelineStage(
+                "git_push", stage("git_push"), depends_on=["run_tests", "docs", "deploy"]
+            ),
+        ],
+        max_workers=2,
+    )
+
+    assert order[0] == "reformat"
+    assert order[-1] == "git_push"
+    assert {"run_tests", "docs"} in concurrent
+
+    def failing():
+        raise RuntimeError("Stage failed")
+
+    order.clear()
+    trace = Trace()
+
+    try:
+        cicd.cicd.run_stages(
+            [
+                cicd.cicd.PipelineStage("reformat", lambda: False),
+                cicd.cicd.PipelineStage("run_tests", failing, depends_on=["reformat"]),
+                cicd.cicd.PipelineStage("git_push", stage("git_push"), depends_on=["run_tests"]),
+            ],
+            trace=trace,
+        )
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("Error in stage has to be raised.")
+
+    assert not order
+    assert {i["name"]: i["args"]["status"] for i in trace.events} == {
+        "run_tests": "failed",
+        "reformat": "skipped",
+    }
+
+    with open(trace.save(Path(tempfile.mkdtemp()) / "trace.json")) as trace_file:
+        trace_events = json.load(trace_file)["traceEvents"]
+
+    assert {i["name"] for i in trace_events if i["ph"] == "X"} == {"run_tests", "reformat"}
+
+    # With known durations the longest stage starts first
+    durations = DurationsDatabase(Path(tempfile.mkdtemp()) / "durations.json")
+    durations.update("stages", {"reformat": 0.1, "docs": 0.1, "run_tests": 5})
+
+    cicd.cicd.run_stages(
+        [
+            cicd.cicd.PipelineStage("docs", stage("docs")),
+            cicd.cicd.PipelineStage("run_tests", stage("run_tests")),
+        ],
+        max_workers=1,
+        durations=durations,
+    )
+
+    assert order == ["run_tests", "docs"]
+    assert durations.get("stages", "docs") < 1
+
+
+def test_stage_cache_key():
+    docs_path = cicd.project_paths.PROJECT_PATHS.docs
+    key = cicd.cicd.StageCache.get_key("run_tests", ["*.rst"], exclude_folders=[docs_path])
+
+    generated_path = docs_path / "source" / "generated_test_file.rst"
+    generated_path.write_text("Generated by docs stage")
+
+    try:
+        assert cicd.cicd.StageCache.get_key("run_tests", ["*.rst"], exclude_folders=[docs_path]) == key
+        assert cicd.cicd.StageCache.get_key("run_tests", ["*.rst"]) != key
+    finally:
+        generated_path.unlink()
+
+
+def test_stage_cache_with_set_version(monkeypatch):
+    regenerated = []
+    monkeypatch.setattr(cicd.cicd.cicd_internal, "docs_regenerate", lambda **_: regenerated.append(1))
+
+    config = cicd.cicd.default_pipeline_config.do.copy()
+    config.do_only = None
+    config.cache_stages = True
+    config.set_version = "increment"
+    config.docs = True
+
+    for i in ["reformat", "git_push", "deploy"]:
+        config[i] = False
+    for i in ["prepare_venvs", "sync_requirements", "git_commit_all", "tag", "allowed_branches"]:
+        config[i] = None
+    config.test.run_tests = False
+
+    cicd.project_paths.PROJECT_PATHS.cache = tempfile.mkdtemp()
+    original_version = cicd.packages.get_version()
+
+    try:
+        cicd.cicd.cicd_pipeline(config)
+        cicd.cicd.cicd_pipeline(config)
+    finally:
+        cicd.packages.set_version(original_version)
+
+    # Version changed by the first pipeline does not invalidate the cache
+    assert len(regenerated) == 1
+
+
 if __name__ == "__main__":
     # Find paths and add to sys.path to be able to import local modules
     prepare_test()
 
     # test_cicd_pipeline()
+    # test_run_stages()
+    # test_stage_cache_key()
+    # test_stage_cache_with_set_version()
@@ -0,0 +1,67 @@
+"""Tests for commands module."""
+
+# pylint: disable=missing-function-docstring
+
+
+from __future__ import annotations
+from pathlib import Path
+import sys
+import threading
+import time
+
+import pytest
+
+root_path = sys.path.insert(0, Path(__file__).parents[1].as_posix())  # pylint: disable=no-member
+
+from mypythontools_cicd import commands
+from conftest import prepare_test
+
+# pylint: disable=missing-function-docstring,
+
+
+def test_run_commands(capsys):
+    results = commands.run_commands(
+        [
+            commands.Command('python -c "print(1); print(2)"', prefix="first"),
+            commands.Command('python -c "print(3)"', prefix="second"),
+        ]
+    )
+
+    assert [i.stdout for i in results] == ["1\n2", "3"]
+    assert "[first] 2" in capsys.readouterr().out
+
+    with pytest.raises(commands.CommandError) as error:
+        commands.run_command('python -c "import sys; sys.exit(3)"', verbose=False)
+    assert error.value.result.returncode == 3
+
+    # Callers catching `RuntimeError` (e.g. `git.push`) handle failed commands as well
+    with pytest.raises(RuntimeError):
+        commands.run_command('python -c "import sys; sys.exit(3)"', verbose=False)
+
+    # Other commands are killed if one fails
+    start = time.perf_counter()
+    with pytest.raises(commands.CommandError):
+        commands.run_commands(
+            ['python -c "import time; time.sleep(10)"', 'python -c "1 / 0"'], fail_fast=True
+        )
+    assert time.perf_counter() - start < 5
+
+    with pytest.raises(commands.CommandError) as error:
+        commands.run_command('python -c "import time; time.sleep(10)"', timeout=0.5, verbose=False)
+    assert error.value.result.timed_out
+
+    # Command is killed if event is set from other thread
+    cancel_event = threading.Event()
+    threading.Timer(0.5, cancel_event.set).start()
+    with pytest.raises(commands.CommandError) as error:
+        commands.run_command(
+            'python -c "import time; time.sleep(10)"', verbose=False, cancel_event=cancel_event
+        )
+    assert error.value.result.cancelled
+
+
+if __name__ == "__main__":
+    # Find paths and add to sys.path to be able to import local modules
+    prepare_test()
+
+    # test_run_commands()
@@ -37,6 +37,11 @@ def test_docs_regenerate():
     assert another_rst_path.exists()
     assert not_deleted.exists()
 
+    # Unchanged rst files are not written again, so sphinx doesn't rebuild them
+    modified = rst_path.stat().st_mtime_ns
+    docs.docs_regenerate(keep=("not_deleted.rst",))
+    assert rst_path.stat().st_mtime_ns == modified
+
 
 if __name__ == "__main__":
     # Find paths and add to sys.path to be able to import local modules
@@ -0,0 +1,51 @@
+"""Tests for fast import of the package."""
+
+# pylint: disable=missing-function-docstring
+
+from __future__ import annotations
+from pathlib import Path
+import subprocess
+import sys
+
+root_path = Path(__file__).parents[1]
+
+sys.path.insert(0, root_path.as_posix())  # pylint: disable=no-member
+
+from conftest import prepare_test
+
+
+def get_imported_modules(module: str) -> list[str]:
+    """Import module in new process and return list of imported modules."""
+    code = f"import sys\nimport {module}\nprint(' '.join(sys.modules))\n"
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=root_path.as_posix(), capture_output=True, text=True, check=True
+    )
+    return result.stdout.splitlines()[-1].split()
+
+
+def test_import_time():
+    # Duration is not stable on CI, so imported modules are checked instead
+    modules = get_imported_modules("mypythontools_cicd")
+
+    # Subpackages are imported lazily, so neither subpackages nor heavy libraries are imported
+    assert not [module for module in modules if module.startswith("mypythontools_cicd.")]
+
+    for heavy_module in ["pkg_resources", "mylogging", "mypythontools", "black", "sphinx"]:
+        assert heavy_module not in modules
+
+    # Packages are used in setup.py, so it should not import other subpackages nor heavy libraries
+    modules = get_imported_modules("mypythontools_cicd.packages")
+
+    for heavy_module in ["pkg_resources", "mypythontools_cicd.build_app", "mypythontools_cicd.cicd"]:
+        assert heavy_module not in modules
+
+    # Subpackages are still available as attributes
+    modules = get_imported_modules("mypythontools_cicd; mypythontools_cicd.cicd.cicd_pipeline")
+    assert "mypythontools_cicd.cicd" in modules
+
+
+if __name__ == "__main__":
+    # Find paths and add to sys.path to be able to import local modules
+    prepare_test()
+
+    # test_import_time()
@@ -22,6 +22,20 @@ test_project_path = Path("tests").resolve() / "tested project"
 def test_reformat_with_black():
     misc.reformat_with_black()
 
+    not_formatted = test_project_path / "project_lib" / "not_formatted.py"
+
+    try:
+        with open(not_formatted, "w") as not_formatted_file:
+            not_formatted_file.write("a  =  [1,2]\n")
+
+        assert not_formatted in misc.reformat_with_black(changed_only=True)
+
+        with open(not_formatted) as not_formatted_file:
+            assert not_formatted_file.read() == "a = [1, 2]\n"
+
+    finally:
+        not_formatted.unlink()
+
 
 if __name__ == "__main__":
     # Find paths and add to sys.path to be able to import local modules
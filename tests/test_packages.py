@@ -4,12 +4,18 @@
 
 
 from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import json
 import sys
+import tempfile
+
+import pytest
 
 root_path = sys.path.insert(0, Path(__file__).parents[1].as_posix())  # pylint: disable=no-member
 
 from mypythontools_cicd import packages
+from mypythontools_cicd.project_paths import PROJECT_PATHS
 from conftest import prepare_test
 
 test_project_path = Path("tests").resolve() / "tested project"
@@ -24,8 +30,121 @@ def test_set_version():
     packages.set_version("0.0.1")
 
 
+def test_get_requirements():
+    requirements_path = Path(tempfile.mkdtemp())
+
+    with open(requirements_path / "requirements.txt", "w") as requirements_file:
+        requirements_file.write(
+            "# Comment\n"
+            "-r requirements_extra.txt\n"
+            "--index-url https://pypi.org/simple\n"
+            "numpy >= 1.20, <2 ; python_version < '3.8'  # Inline comment\n"
+            "pandas==1.0 \\\n    --hash=sha256:abc\n"
+        )
+
+    with open(requirements_path / "requirements_extra.txt", "w") as requirements_file:
+        requirements_file.write("mylogging[all]\n")
+
+    requirements = packages.get_requirements(requirements_path / "requirements.txt")
+    assert requirements == ['numpy<2,>=1.20; python_version < "3.8"', "pandas==1.0", "mylogging[all]"]
+
+    # Cached result is the same
+    assert packages.get_requirements(requirements_path / "requirements.txt") == requirements
+
+
+def test_get_requirements_parallel():
+    requirements_path = Path(tempfile.mkdtemp())
+    files = []
+
+    for i in range(20):
+        files.append(requirements_path / f"requirements_{i}.txt")
+        files[-1].write_text(f"library_{i}=={i}.0\n")
+
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(packages.get_requirements, files))
+
+    assert results == [[f"library_{i}=={i}.0"] for i in range(20)]
+
+    # Disk cache is valid json
+    with open(PROJECT_PATHS.cache / "requirements.json") as disk_cache_file:
+        assert json.load(disk_cache_file)
+
+
+def test_resolve_requirements():
+    requirements_path = Path(tempfile.mkdtemp())
+
+    files = {
+        "base.txt": "numpy>=1.20\nmypythontools==3.0\n",
+        "a.txt": "-r base.txt\nnumpy<2\n",
+        "b.txt": "-r base.txt\nmypythontools\n",
+        "all.txt": "-r a.txt\n-r b.txt\n",
+        "cycle.txt": "-r cycle_2.txt\n",
+        "cycle_2.txt": "-r cycle.txt\n",
+        "conflict.txt": "-r base.txt\nmypythontools==4.0\n",
+    }
+
+    for name, content in files.items():
+        with open(requirements_path / name, "w") as requirements_file:
+            requirements_file.write(content)
+
+    # Diamond is read once and duplicates are merged
+    assert packages.resolve_requirements([requirements_path / "all.txt"]) == [
+        "numpy<2,>=1.20",
+        "mypythontools==3.0",
+    ]
+
+    for name in ["cycle.txt", "conflict.txt"]:
+        with pytest.raises(ValueError):
+            packages.resolve_requirements([requirements_path / name])
+
+
+def test_get_package_hash():
+    project_path = Path(tempfile.mkdtemp())
+    (project_path / "setup.py").write_text("")
+    (project_path / "tested").mkdir()
+    (project_path / "tested" / "__init__.py").write_text("")
+    (project_path / "tested" / "module.py").write_text("a = 1\n")
+
+    package_hash = packages.get_package_hash(project_path)
+
+    # Sources of the package in setup folder are hashed, not the sources of current project
+    (project_path / "tested" / "module.py").write_text("a = 2\n")
+    assert packages.get_package_hash(project_path) != package_hash
+
+
+def test_get_package_wheel():
+    project_path = Path(tempfile.mkdtemp())
+    setup_code = "from setuptools import setup\n\nsetup(name='tested', version='{}', py_modules=['tested'])\n"
+    (project_path / "setup.py").write_text(setup_code.format("0.0.1"))
+    (project_path / "tested.py").write_text("")
+
+    # Folder can be defined by user, so other files are not deleted
+    wheels_path = project_path / "wheels"
+    wheels_path.mkdir()
+    (wheels_path / "other.txt").write_text("")
+
+    wheel = packages.get_package_wheel(project_path, wheels_path)
+    built_time = wheel.stat().st_mtime_ns
+
+    # Wheel is reused if package didn't change
+    assert packages.get_package_wheel(project_path, wheels_path) == wheel
+    assert wheel.stat().st_mtime_ns == built_time
+
+    (project_path / "setup.py").write_text(setup_code.format("0.0.2"))
+    new_wheel = packages.get_package_wheel(project_path, wheels_path)
+
+    assert new_wheel.parent != wheel.parent and "0.0.2" in new_wheel.name
+    assert not wheel.parent.exists()
+    assert (wheels_path / "other.txt").exists()
+
+
 if __name__ == "__main__":
     # Find paths and add to sys.path to be able to import local modules
     prepare_test()
 
     # test_set_version()
+    # test_get_requirements()
+    # test_get_requirements_parallel()
+    # test_resolve_requirements()
+    # test_get_package_hash()
+    # test_get_package_wheel()
@@ -6,10 +6,12 @@
 from __future__ import annotations
 from pathlib import Path
 import sys
+import tempfile
+import time
 
 root_path = sys.path.insert(0, Path(__file__).parents[1].as_posix())  # pylint: disable=no-member
 
-from mypythontools_cicd.project_paths import PROJECT_PATHS
+from mypythontools_cicd.project_paths import FileIndex, PROJECT_PATHS
 from conftest import prepare_test
 
 test_project_path = Path("tests").resolve() / "tested project"
@@ -25,6 +27,37 @@ def test_project_paths():
     assert PROJECT_PATHS.docs == test_project_path / "docs"
     assert PROJECT_PATHS.readme == test_project_path / "README.md"
     assert PROJECT_PATHS.tests == test_project_path / "tests"
+    assert PROJECT_PATHS.cache == test_project_path / ".cicd_cache"
+    assert (PROJECT_PATHS.create_cache() / ".gitignore").exists()
+
+    # Cache is created only if something is written
+    PROJECT_PATHS.reset_paths()
+    PROJECT_PATHS.root = tempfile.mkdtemp()
+    try:
+        assert not PROJECT_PATHS.cache.exists()
+        assert (PROJECT_PATHS.create_cache() / ".gitignore").exists()
+    finally:
+        PROJECT_PATHS.reset_paths()
+
+
+def test_file_index():
+    root = Path(tempfile.mkdtemp())
+
+    for i in ["app/main.py", "app/module_.py", "ignored/file.py", "node_modules/lib/index.html", "debug.log"]:
+        (root / i).parent.mkdir(parents=True, exist_ok=True)
+        (root / i).touch()
+
+    (root / ".gitignore").write_text("ignored/\n*.log\n")
+
+    index = FileIndex(root)
+    assert index.get_paths() == [root / ".gitignore", root / "app" / "main.py", root / "app" / "module_.py"]
+    assert index.glob("**/*_.py") == [root / "app" / "module_.py"]
+    assert index.find("main.py") == root / "app" / "main.py"
+
+    # Changed folders are listed again
+    time.sleep(0.01)
+    (root / "app" / "new.py").touch()
+    assert index.find("new.py") == root / "app" / "new.py"
 
 
 if __name__ == "__main__":
@@ -32,3 +65,4 @@ if __name__ == "__main__":
     prepare_test()
 
     # test_project_paths()
+    # test_file_index()
@@ -1,7 +0,0 @@
-"""pytest file built from d:/Github/mypythontools_cicd/README.md"""
-
-
-def test_nothing_passes():
-    """Succeed  if no Python code blocks or sessions were processed."""
-    # nothing to test
-    pass
@@ -0,0 +1,5 @@
+"""pytest file built from README.md"""
+
+
+def test_nothing_passes():
+    """Succeed if no Python code blocks were processed."""
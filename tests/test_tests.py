@@ -6,10 +6,16 @@
 from __future__ import annotations
 from pathlib import Path
 import sys
+import time
+
+import black
+import pytest
 
 root_path = sys.path.insert(0, Path(__file__).parents[1].as_posix())  # pylint: disable=no-member
 
 from mypythontools_cicd.tests import tests_internal as tests
+from mypythontools_cicd.commands import CommandError, run_command
+from mypythontools_cicd.venvs import Venv
 from mypythontools_cicd.project_paths import PROJECT_PATHS
 from conftest import prepare_test
 
@@ -27,8 +33,213 @@ def test_add_readme_tests():
             print("Readme tests found.")
 
 
+def test_get_readme_tests_code(tmp_path):
+    readme = """
+<!--phmdoctest-setup-->
+```python
+value = 1
+```
+
+```python
+print(value)
+```
+
+```
+1
+```
+
+<!--phmdoctest-mark.skip-->
+```python
+raise RuntimeError("Marked as skipped")
+```
+
+<!--phmdoctest-skip-->
+```python
+raise RuntimeError("Not used")
+```
+
+```pycon
+>>> value + 1
+2
+```
+
+<!--phmdoctest-teardown-->
+```python
+print("Teardown run")
+```
+"""
+    code = tests.get_readme_tests_code(readme)
+    assert "Not used" not in code
+    assert "import pytest\n" in code
+
+    # Generated code is formatted, so black doesn't change it in the repo
+    assert black.format_str(code, mode=black.Mode(line_length=110)) == code
+
+    test_path = tmp_path / "test_readme.py"
+    test_path.write_text(code)
+    output = run_command(
+        f'"{sys.executable}" -m pytest -s -p no:cacheprovider --doctest-modules "{test_path}"',
+        cwd=tmp_path,
+        verbose=False,
+    )
+    assert "2 passed, 1 skipped" in output
+    assert "Teardown run" in output
+
+    # Pytest is imported only if used
+    assert "import pytest" not in tests.get_readme_tests_code("```python\nprint(1)\n```")
+
+
+def test_get_affected_tests():
+    app = PROJECT_PATHS.app.relative_to(PROJECT_PATHS.root).as_posix()
+    coverage_map = {
+        "tests/test_a.py::test_1": [f"{app}/a.py"],
+        "tests/test_a.py::test_2": [f"{app}/a.py", f"{app}/b.py"],
+    }
+
+    assert tests.get_affected_tests(coverage_map, [PROJECT_PATHS.app / "b.py"]) == ["tests/test_a.py::test_2"]
+    assert tests.get_affected_tests(coverage_map, [PROJECT_PATHS.app / "a.py"]) == ["tests/test_a.py"]
+
+    # Source files not executed by any test (e.g. new module) cannot be mapped to tests
+    assert tests.get_affected_tests(coverage_map, [PROJECT_PATHS.app / "c.py"]) is None
+    assert (
+        tests.get_affected_tests(coverage_map, [PROJECT_PATHS.app / "b.py", PROJECT_PATHS.app / "c.py"])
+        is None
+    )
+
+
+def test_set_coverage_file(tmp_path):
+    assert tests.set_coverage_file("pytest", None) == "pytest"
+
+    command = tests.set_coverage_file("python -c \"import os; print(os.environ['COVERAGE_FILE'])\"", tmp_path)
+    assert Path(run_command(command, verbose=False)) == tmp_path
+
+
+def test_combine_coverage_data(tmp_path):
+    project_path = tmp_path / "project"
+    project_path.mkdir()
+    (project_path / "pyproject.toml").write_text('[tool.coverage.run]\nomit = ["omitted.py"]\n')
+    for module in ["first", "second", "omitted"]:
+        (project_path / f"{module}.py").write_text("print(1)\n")
+
+    venv = tmp_path / "venv"
+    run_command(f'"{sys.executable}" -m venv --system-site-packages --without-pip "{venv}"', verbose=False)
+    activate = Venv(venv).activate_prefix_command
+
+    coverage_files = [project_path / ".coverage.venv-0", project_path / ".coverage.venv-1"]
+    for module, coverage_file in zip(["first", "second"], coverage_files):
+        run_command(
+            f"{activate} {tests.set_coverage_file(f'coverage run {module}.py', coverage_file)}",
+            cwd=project_path,
+            verbose=False,
+        )
+    run_command(
+        f"{activate} {tests.set_coverage_file('coverage run --append omitted.py', coverage_files[0])}",
+        cwd=project_path,
+        verbose=False,
+    )
+
+    tests.combine_coverage_data(coverage_files, venv.as_posix(), project_path, project_path / "coverage.xml")
+
+    assert not [i for i in coverage_files if i.exists()]
+    assert (project_path / ".coverage").exists()
+    report = (project_path / "coverage.xml").read_text()
+    assert "first.py" in report and "second.py" in report and "omitted.py" not in report
+
+
+def test_create_coverage_config(tmp_path):
+    import coverage
+
+    # Coverage settings from project are kept
+    (tmp_path / "pyproject.toml").write_text(
+        '[tool.black]\nline-length = 110\n\n[tool.coverage.run]\nomit = ["omitted.py"]\n'
+    )
+    config = coverage.Coverage(config_file=str(tests.create_coverage_config(tmp_path, ["/a", "/b"]))).config
+    assert config.run_omit == ["omitted.py"]
+    assert ["/a", "/b"] in config.paths.values()
+
+    (tmp_path / "setup.cfg").write_text(
+        "[metadata]\nname = tested\n\n[coverage:run]\nomit = omitted.py\n\n[coverage:paths]\nother =\n    /c\n"
+    )
+    config = coverage.Coverage(config_file=str(tests.create_coverage_config(tmp_path, ["/a", "/b"]))).config
+    assert config.run_omit == ["omitted.py"]
+    assert ["/a", "/b"] in config.paths.values() and ["/c"] in config.paths.values()
+
+
+def get_parallel_config(tmp_path: Path, test_code: str) -> tests.TestConfig:
+    """Project with one test file and two venvs with pytest from current environment."""
+    project_path = tmp_path / "project"
+    project_path.mkdir()
+    (project_path / "test_parallel.py").write_text(test_code)
+
+    virtualenvs = [tmp_path / "first", tmp_path / "second"]
+    for venv in virtualenvs:
+        run_command(
+            f'"{sys.executable}" -m venv --system-site-packages --without-pip "{venv}"', verbose=False
+        )
+
+    config = tests.TestConfig()
+    config.tested_path = project_path
+    config.tests_path = project_path
+    config.virtualenvs = [venv.as_posix() for venv in virtualenvs]
+    config.wsl_virtualenvs = []
+    config.parallel_venvs = 2
+    config.install_package = False
+    config.sync_test_requirements = None
+    config.prepare_test_venvs = None
+    config.test_coverage = False
+    config.record_durations = False
+    config.verbosity = 0
+    return config
+
+
+def test_parallel_venvs(tmp_path, capsys, monkeypatch):
+    # Venvs use pytest from current environment, so this library doesn't have to be installed
+    monkeypatch.setattr(tests, "INTERNAL_TESTS_PATH", "")
+    config = get_parallel_config(tmp_path, "def test_ok():\n    assert True\n")
+    config.verbosity = 1
+
+    tests.run_tests(config)
+
+    output = capsys.readouterr().out
+    assert "first: passed" in output
+    assert "second: passed" in output
+
+
+def test_parallel_venvs_failure(tmp_path, capsys, monkeypatch):
+    monkeypatch.setattr(tests, "INTERNAL_TESTS_PATH", "")
+    # Test fails in the first venv and runs for long time in the second one
+    config = get_parallel_config(
+        tmp_path,
+        "import os, time\n\n\ndef test_venv():\n"
+        "    if os.environ['VIRTUAL_ENV'].endswith('second'):\n        time.sleep(30)\n    assert False\n",
+    )
+    config.verbosity = 1
+    config.record_durations = True
+    start = time.perf_counter()
+
+    with pytest.raises(CommandError) as error:
+        tests.run_tests(config)
+
+    # Second venv is killed once the first one fails
+    assert time.perf_counter() - start < 25
+    assert error.value.result.returncode
+    output = capsys.readouterr().out
+    assert "first: failed" in output
+    assert "second: cancelled" in output
+
+    # Junit reports are deleted even if tests fail
+    assert not list(PROJECT_PATHS.cache.glob("junit-*.xml"))
+
+
 if __name__ == "__main__":
     # Find paths and add to sys.path to be able to import local modules
     prepare_test()
 
     # test_add_readme_tests()
+    # test_get_readme_tests_code()
+    # test_get_affected_tests()
+    # test_set_coverage_file()
+    # test_combine_coverage_data()
+    # test_create_coverage_config()
+    # test_parallel_venvs()
+    # test_parallel_venvs_failure()
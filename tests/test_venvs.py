@@ -1,6 +1,9 @@
 from __future__ import annotations
 from pathlib import Path
+import os
+import re
 import sys
+import time
 import platform
 
 from mypythontools.misc import delete_files
@@ -10,6 +13,7 @@ sys.path.insert(0, Path(__file__).parents[1].as_posix())  # pylint: disable=no-m
 
 from conftest import prepare_test
 from mypythontools_cicd import venvs
+from mypythontools_cicd.commands import CommandError, Trace
 
 
 def test_prepare_venvs():
@@ -29,8 +33,197 @@ def test_prepare_venvs():
         delete_files(["venv/test_prepare/3.7"])
 
 
+def test_prepare_venvs_failures_collected():
+    if platform.system() == "Windows" and not is_wsl():
+        return
+
+    delete_files(["venv/test_failures"])
+
+    try:
+        venvs.prepare_venvs(path="venv/test_failures", versions=["3.7", "2.1", "1.1"])
+    except RuntimeError as err:
+        assert "['2.1', '1.1']" in str(err)
+    else:
+        raise AssertionError("Error has to be raised if some version cannot be created.")
+
+    # Other versions are finished even if some version fails
+    assert venvs.Venv("venv/test_failures/3.7").installed
+    delete_files(["venv/test_failures"])
+
+
+def test_wheelhouse():
+    delete_files(["venv/test_wheelhouse"])
+
+    wheelhouse = Path("venv/test_wheelhouse/wheelhouse").resolve()
+    first = venvs.Venv("venv/test_wheelhouse/first", wheelhouse=wheelhouse)
+    first.create()
+    first.sync_requirements(None, requirements=["colorama==0.4.4"], verbosity=0)
+
+    assert list(first.get_wheelhouse_path().glob("colorama-0.4.4-*.whl"))
+
+    # Package index is not available, so libraries has to be installed from wheelhouse
+    second = venvs.Venv("venv/test_wheelhouse/second", wheelhouse=wheelhouse)
+    second.create()
+    original_environ = os.environ.copy()
+    os.environ.update(
+        {"PIP_INDEX_URL": "http://127.0.0.1:9/simple", "PIP_EXTRA_INDEX_URL": "", "PIP_RETRIES": "0"}
+    )
+    try:
+        with Trace() as trace:
+            second.sync_requirements(None, requirements=["colorama==0.4.4"], verbosity=0)
+
+        # If resolved again, wheelhouse is used if package index is not available
+        with Trace() as resolve_trace:
+            second.sync_requirements(None, requirements=["colorama==0.4.4"], verbosity=0, force=True)
+    finally:
+        os.environ.clear()
+        os.environ.update(original_environ)
+
+    assert second.get_installed_packages()["colorama"] == "0.4.4"
+
+    # Requirements were resolved for the first venv already
+    commands = [i["args"]["command"] for i in trace.events if "piptools" in i["args"]["command"]]
+    assert commands and not [i for i in commands if "compile" in i]
+    compile_commands = [i["args"] for i in resolve_trace.events if "compile" in i["args"]["command"]]
+    assert compile_commands[-1]["returncode"] == 0
+
+    # Expired resolution is not used
+    third = venvs.Venv("venv/test_wheelhouse/third", wheelhouse=wheelhouse)
+    third.create()
+    with Trace() as trace:
+        third.sync_requirements(None, requirements=["colorama==0.4.4"], verbosity=0, lock_max_age=0)
+    assert [i for i in trace.events if "compile" in i["args"]["command"]]
+
+    delete_files(["venv/test_wheelhouse"])
+
+
+def test_sync_skipped_if_not_changed():
+    delete_files(["venv/test_fingerprint"])
+
+    venv = venvs.Venv("venv/test_fingerprint", wheelhouse=Path("venv/test_fingerprint/wheelhouse").resolve())
+    venv.create()
+    venv.sync_requirements(None, requirements=["colorama==0.4.4"], verbosity=0)
+
+    with Trace() as trace:
+        venv.sync_requirements(None, requirements=["colorama==0.4.4"], verbosity=0)
+    assert not trace.events
+
+    with Trace() as trace:
+        venv.sync_requirements(None, requirements=["colorama==0.4.3"], verbosity=0)
+    assert trace.events
+    assert venv.get_installed_packages()["colorama"] == "0.4.3"
+
+    # Python version is part of fingerprint as well
+    config_path = venv.real_path / "pyvenv.cfg"
+    config_path.write_text(re.sub(r"^version = .*$", "version = 3.0.0", config_path.read_text(), flags=re.M))
+    with Trace() as trace:
+        venv.sync_requirements(None, requirements=["colorama==0.4.3"], verbosity=0)
+    assert trace.events
+
+    delete_files(["venv/test_fingerprint"])
+
+
+def test_transaction():
+    delete_files(["venv/test_transaction"])
+
+    venv = venvs.Venv("venv/test_transaction", pip_cache=True)
+    venv.create()
+    venv.install_library(["colorama==0.4.4", "six==1.16.0"])
+
+    with venv.transaction() as transaction:
+        transaction.uninstall(["colorama", "six"])
+        transaction.install("colorama==0.4.3")
+
+    installed = venv.get_installed_packages()
+    assert installed["colorama"] == "0.4.3"
+    assert "six" not in installed
+    assert (venv.get_pip_env()["PIP_CACHE_DIR"]).endswith("pip")
+
+    # Shared pip cache is opt-in
+    assert "PIP_CACHE_DIR" not in venvs.Venv("venv/test_transaction").get_pip_env()
+
+    delete_files(["venv/test_transaction"])
+
+
+def test_worker():
+    delete_files(["venv/test_worker"])
+
+    venv = venvs.Venv("venv/test_worker", use_worker=True)
+    venv.create()
+    venv.install_library("colorama==0.4.4")
+
+    assert venv.get_installed_packages()["colorama"] == "0.4.4"
+    assert "Version: 0.4.4" in venv.run_module("pip", ["show", "colorama"])
+
+    try:
+        venv.run_module("not_existing_module")
+    except CommandError:
+        pass
+    else:
+        raise AssertionError("Error has to be raised if module fails.")
+
+    worker = venv.get_worker()
+    assert worker.process.poll() is None
+
+    venvs.shutdown_workers()
+    assert worker.process is None
+
+    # Hanging module is killed and worker is started again with next request
+    worker = venvs.VenvWorker(venv.executable, timeout=1)
+    start = time.perf_counter()
+    try:
+        worker.run_module("timeit", ["-n", "1", "import time; time.sleep(30)"])
+    except CommandError as err:
+        assert err.result.timed_out
+    else:
+        raise AssertionError("Error has to be raised if module timeouts.")
+    assert time.perf_counter() - start < 10
+    assert "pip" in worker.run_module("pip", ["--version"])
+    worker.stop()
+
+    delete_files(["venv/test_worker"])
+
+
+def test_worker_fallback(monkeypatch):
+    delete_files(["venv/test_worker_fallback"])
+
+    venv = venvs.Venv("venv/test_worker_fallback", use_worker=True)
+    venv.create()
+
+    # Without fork (e.g. on windows) modules run in subprocess
+    monkeypatch.delattr(os, "fork", raising=False)
+    assert venv.get_worker() is None
+    assert "pip" in venv.run_module("pip", ["--version"])
+
+    delete_files(["venv/test_worker_fallback"])
+
+
+def test_prepare_venvs_from_template():
+    if platform.system() == "Windows" and not is_wsl():
+        return
+
+    delete_files(["venv/test_template", "venv/test_cloned"])
+    venvs.prepare_venvs(path="venv/test_cloned", versions=["3.7"], template_path="venv/test_template")
+
+    cloned = venvs.Venv("venv/test_cloned/3.7")
+    assert cloned.installed
+    assert venvs.Venv("venv/test_template/3.7").installed
+
+    with open(cloned.real_path / "bin" / "activate") as activate:
+        assert "test_template" not in activate.read()
+
+    delete_files(["venv/test_template", "venv/test_cloned"])
+
+
 if __name__ == "__main__":
     # Find paths and add to sys.path to be able to import local modules
     prepare_test()
 
     # test_prepare_venvs()
+    # test_prepare_venvs_failures_collected()
+    # test_wheelhouse()
+    # test_sync_skipped_if_not_changed()
+    # test_transaction()
+    # test_worker()
+    # test_worker_fallback()
+    # test_prepare_venvs_from_template()
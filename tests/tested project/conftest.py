@@ -1,4 +1,5 @@
 """Just for testing reasons."""
+
 import mypythontools_cicd as cicd
 
 cicd.tests.setup_tests(generate_readme_tests=False)
@@ -1,7 +0,0 @@
-"""pytest file built from /mnt/d/Github/mypythontools_cicd/tests/tested project/README.md"""
-
-
-def test_code_4():
-    assert True
-
-    # Caution- no assertions.
@@ -0,0 +1,5 @@
+"""pytest file built from README.md"""
+
+
+def test_code_4():
+    assert True